@@ -1,26 +1,60 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, Header, Response, Query
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database import init_db, get_db, KnowledgeBase, Document, ChatHistory
+from sqlalchemy import func, or_, and_
+from typing import Dict, Optional
+from database import init_db, get_db, KnowledgeBase, Document, ChatHistory, TokenUsageDaily, Conversation
 from models import (
-    ScanUrlRequest, ScanUrlResponse, BedrockModelsResponse, OpenAIModelsResponse,
+    ScanUrlRequest, ScanUrlResponse, CrawlUrlRequest, BedrockModelsResponse, OpenAIModelsResponse, LocalModelsResponse,
     CreateKBRequest, CreateKBResponse, ChatRequest, ChatResponse, 
     ChatHistoryResponse, ChatHistoryItem, KBListResponse, KBListItem,
-    KBDetail, DocumentInfo, UpdateKBRequest
+    KBDetail, DocumentInfo, UpdateKBRequest, RefreshKBRequest, RefreshKBResponse,
+    ReindexKBRequest, ReindexKBResponse, SearchFilters, SearchRequest, SearchResponse, SearchResult,
+    KBUsageResponse, KBUsageSummary, UsageSummaryResponse, ConversationResponse,
+    CloneKBRequest, CloneKBResponse, SearchRecallResponse
 )
 from services.scraper import scan_url_for_pdfs
+from services.crawler import PDFCrawler, CrawlOptions
+from services.validator import validate_pdfs as validate_pdf_urls, validate_pdfs_stream
 from services.bedrock_client import BedrockClient
 from services.openai_client import OpenAIClient
+from services.local_client import LocalClient
 from services.pdf_processor import PDFProcessor
-from services.embeddings import EmbeddingsService
+from services.blob_store import BlobStore
+from services.text_cache import PageTextCache
+from services.embeddings import (
+    EmbeddingsService, evict_snapshot, configure_coarse_search, search_recall,
+    DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+)
+from services.llm_provider import validate_embedding_dimensions
 from services.chat import ChatService
+from services.conversation import ConversationMemory
+from services.metrics import render_metrics
+from services.profiling import ProfileStore, ProfilingMiddleware, run_in_threadpool
+from services.history_writer import history_writer
+from services.retention import HistoryRetention
+from services.locks import kb_lock, LockTimeout
+from services.kb_clone import clone_kb_files
+from services.lazy_imports import lazy_load_seconds, loaded_heavy_modules
+from services.call_policy import CallPolicy, configure_call_policies, latency_report
+from services.usage import usage_recorder, usage_rows
+from config import get_config
 from datetime import datetime, timedelta, timezone
+from dataclasses import asdict
+from contextlib import asynccontextmanager
+import json
 import shutil
 from pathlib import Path
-import requests
 import traceback
-from openai import OpenAI
+
+# Time to import this module; heavy dependencies are loaded on first use
+APP_IMPORT_SECONDS = time.perf_counter() - _import_started
+HEAVY_MODULES_AT_IMPORT = loaded_heavy_modules()
+startup_timings = {}
 
 app = FastAPI(title="KB Builder API", version="1.0.0")
 
@@ -33,15 +67,131 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in request profiling, installed only when profiling.enabled is set;
+# without the flag requests bypass the profiler entirely
+config = get_config()
+profiling_enabled = config.get_profiling_enabled()
+profile_store = ProfileStore(max_profiles=config.get_profiling_max_profiles())
+if profiling_enabled:
+    app.add_middleware(ProfilingMiddleware, store=profile_store, interval=config.get_profiling_interval())
+
+# Deadlines, retries and optional hedging for provider chat and embedding calls
+configure_call_policies(
+    chat=CallPolicy(
+        timeout=config.get_provider_timeout('chat'),
+        deadline=config.get_provider_deadline('chat'),
+        max_attempts=config.get_provider_max_attempts()
+    ),
+    embedding=CallPolicy(
+        timeout=config.get_provider_timeout('embedding'),
+        deadline=config.get_provider_deadline('embedding'),
+        max_attempts=config.get_provider_max_attempts(),
+        hedge_percentile=config.get_embedding_hedge_percentile()
+    )
+)
+
+# Optional two-stage search: low-dimensional candidates re-scored at full width
+configure_coarse_search(
+    dimensions=config.get_coarse_search_dimensions(),
+    method=config.get_coarse_search_method(),
+    candidate_factor=config.get_coarse_search_candidates()
+)
+
+# Expired chat history is deleted in the background in small batches
+history_retention = HistoryRetention(
+    default_days=config.get_history_retention_days(),
+    interval=config.get_history_retention_interval(),
+    batch_size=config.get_history_retention_batch_size(),
+    max_run_seconds=config.get_history_retention_max_run_seconds(),
+    lock_path=Path(config.get_data_path()) / "locks" / "history-retention.lock"
+)
+
 # Initialize database on startup
 @app.on_event("startup")
 def startup_event():
+    start = time.perf_counter()
     init_db()
+    history_writer.start()
+    history_retention.start()
+    usage_recorder.start()
+    startup_timings['startup_seconds'] = time.perf_counter() - start
+
+@app.on_event("shutdown")
+def shutdown_event():
+    history_retention.stop()
+    # Drain queued chat history and token usage before the process exits
+    history_writer.stop()
+    usage_recorder.stop()
+
+@asynccontextmanager
+async def exclusive_kb(db: Session, kb_id: int, state: str):
+    """Hold a KB's cross-worker write lock for an ingest/refresh/re-index/delete.
+    
+    The operation is recorded in knowledgebases.state so other workers can see
+    it (chat answers 404 for a KB being deleted). Queries never take the lock;
+    they read the last published index snapshot.
+    """
+    lock = kb_lock(kb_id)
+    try:
+        await run_in_threadpool(lock.acquire, config.get_kb_lock_timeout())
+    except LockTimeout:
+        raise HTTPException(status_code=409, detail="Knowledge base is being updated by another request; try again later")
+    try:
+        # Another worker may have changed or deleted the KB while we waited
+        db.expire_all()
+        kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+        if not kb or kb.state == 'deleting':
+            raise HTTPException(status_code=404, detail="Knowledge base not found")
+        kb.state = state
+        db.commit()
+        try:
+            yield kb
+        finally:
+            # A crashed worker leaves a stale state behind; the next lock holder overwrites it
+            db.rollback()
+            db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).update({'state': 'ready'})
+            db.commit()
+    finally:
+        lock.release()
+
+def still_building(db: Session, kb: KnowledgeBase) -> bool:
+    """Whether a KB in state 'building' is really being built.
+    
+    A worker that crashed mid-build leaves the state behind; when the KB's
+    lock is free nobody is building it, so the state is reset.
+    """
+    lock = kb_lock(kb.id)
+    try:
+        lock.acquire(timeout=0)
+    except LockTimeout:
+        return True
+    try:
+        db.query(KnowledgeBase).filter(
+            KnowledgeBase.id == kb.id, KnowledgeBase.state == 'building'
+        ).update({'state': 'ready'}, synchronize_session=False)
+        db.commit()
+        print(f"Cleared stale 'building' state of KB {kb.id}")
+        return False
+    finally:
+        lock.release()
+
+def encode_history_cursor(timestamp: datetime, history_id: int) -> str:
+    return f"{timestamp.isoformat()}_{history_id}"
+
+def decode_history_cursor(cursor: str):
+    timestamp, _, history_id = cursor.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(history_id)
 
 @app.get("/")
 def root():
     return {"message": "KB Builder API", "status": "running"}
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint"""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
 @app.post("/api/scan-url", response_model=ScanUrlResponse)
 async def scan_url(request: ScanUrlRequest):
     """Scan a URL and discover all PDF files"""
@@ -51,52 +201,43 @@ async def scan_url(request: ScanUrlRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/crawl-url")
+async def crawl_url(request: CrawlUrlRequest):
+    """Crawl a site for PDFs, streaming each PDF as an NDJSON line as soon as it is found"""
+    crawler = PDFCrawler(request.url, CrawlOptions(
+        max_depth=request.max_depth,
+        same_domain=request.same_domain,
+        max_pages=request.max_pages,
+        use_sitemap=request.use_sitemap,
+        respect_robots=request.respect_robots
+    ))
+    
+    async def stream():
+        try:
+            async for pdf in crawler.crawl():
+                yield json.dumps({'type': 'pdf', **pdf.model_dump()}) + "\n"
+            yield json.dumps({'type': 'done', 'stats': asdict(crawler.stats)}) + "\n"
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'detail': str(e)}) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.post("/api/validate-pdfs")
-async def validate_pdfs(request: dict):
-    """Validate PDF URLs to check if they're accessible"""
+async def validate_pdfs(request: dict, stream: bool = False):
+    """Validate PDF URLs to check if they're accessible.
+    
+    With ?stream=true each result is sent as an NDJSON line as soon as it is known.
+    """
     try:
         urls = request.get('urls', [])
-        results = []
         
-        for url_info in urls:
-            url = url_info.get('url')
-            filename = url_info.get('filename')
-            
-            try:
-                # HEAD request to check if URL is accessible
-                response = requests.head(url, timeout=10, allow_redirects=True)
-                
-                if response.status_code == 200:
-                    status = 'available'
-                    reason = 'OK'
-                elif response.status_code == 404:
-                    status = 'unavailable'
-                    reason = '404 Not Found'
-                elif response.status_code == 403:
-                    status = 'unavailable'
-                    reason = '403 Forbidden'
-                else:
-                    status = 'unavailable'
-                    reason = f'HTTP {response.status_code}'
-                    
-            except requests.exceptions.Timeout:
-                status = 'unavailable'
-                reason = 'Timeout'
-            except requests.exceptions.ConnectionError:
-                status = 'unavailable'
-                reason = 'Connection Error'
-            except Exception as e:
-                status = 'unavailable'
-                reason = str(e)[:50]
-            
-            results.append({
-                'url': url,
-                'filename': filename,
-                'status': status,
-                'reason': reason
-            })
+        if stream:
+            async def results():
+                async for result in validate_pdfs_stream(urls):
+                    yield json.dumps(result) + "\n"
+            return StreamingResponse(results(), media_type="application/x-ndjson")
         
-        return {'results': results}
+        return {'results': await validate_pdf_urls(urls)}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -123,6 +264,15 @@ async def get_openai_models():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/local/models", response_model=LocalModelsResponse)
+async def get_local_models():
+    """Get list of models served by the offline local provider"""
+    local_client = LocalClient()
+    return LocalModelsResponse(
+        models=local_client.list_available_models(),
+        default_model=local_client.get_default_model()
+    )
+
 @app.post("/api/openai/validate-key")
 async def validate_openai_api_key(request: dict):
     """Validate an OpenAI API key for chat+embedding usage."""
@@ -131,6 +281,7 @@ async def validate_openai_api_key(request: dict):
         raise HTTPException(status_code=400, detail="OpenAI API key is required")
 
     try:
+        from openai import OpenAI
         client = OpenAI(api_key=api_key)
         # Validate against the exact API capability this app needs.
         client.embeddings.create(model="text-embedding-3-small", input="key validation ping")
@@ -147,33 +298,55 @@ async def validate_openai_api_key(request: dict):
 async def list_knowledge_bases(db: Session = Depends(get_db)):
     """List all knowledge bases"""
     try:
-        kbs = db.query(KnowledgeBase).all()
-        kb_list = []
-        
-        for kb in kbs:
-            doc_count = db.query(func.count(Document.id)).filter(Document.kb_id == kb.id).scalar()
-            kb_list.append(KBListItem(
+        # One grouped query instead of a COUNT per KB
+        rows = (
+            db.query(KnowledgeBase, func.count(Document.id))
+            .outerjoin(Document, Document.kb_id == KnowledgeBase.id)
+            .group_by(KnowledgeBase.id)
+            .order_by(KnowledgeBase.id)
+            .all()
+        )
+        kb_list = [
+            KBListItem(
                 id=kb.id,
                 name=kb.name,
                 model_id=kb.model_id,
                 provider=kb.provider,
                 created_at=kb.created_at,
                 document_count=doc_count
-            ))
+            )
+            for kb, doc_count in rows
+        ]
         
         return KBListResponse(knowledge_bases=kb_list, total=len(kb_list))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/kb/{kb_id}", response_model=KBDetail)
-async def get_knowledge_base(kb_id: int, db: Session = Depends(get_db)):
-    """Get knowledge base details"""
+async def get_knowledge_base(
+    kb_id: int,
+    documents_limit: int = Query(default=200, ge=1, le=1000),
+    documents_after: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Get knowledge base details with a keyset-paginated document list"""
     try:
         kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
         if not kb:
             raise HTTPException(status_code=404, detail="Knowledge base not found")
         
-        documents = db.query(Document).filter(Document.kb_id == kb_id).all()
+        document_count = db.query(func.count(Document.id)).filter(Document.kb_id == kb_id).scalar()
+        
+        query = db.query(Document).filter(Document.kb_id == kb_id)
+        if documents_after is not None:
+            query = query.filter(Document.id > documents_after)
+        documents = query.order_by(Document.id).limit(documents_limit + 1).all()
+        
+        next_documents_cursor = None
+        if len(documents) > documents_limit:
+            documents = documents[:documents_limit]
+            next_documents_cursor = documents[-1].id
+        
         doc_list = [
             DocumentInfo(
                 id=doc.id,
@@ -191,10 +364,16 @@ async def get_knowledge_base(kb_id: int, db: Session = Depends(get_db)):
             name=kb.name,
             model_id=kb.model_id,
             provider=kb.provider,
+            chunk_size=kb.chunk_size or DEFAULT_CHUNK_SIZE,
+            chunk_overlap=DEFAULT_CHUNK_OVERLAP if kb.chunk_overlap is None else kb.chunk_overlap,
+            embedding_dimensions=kb.embedding_dimensions,
+            history_retention_days=kb.history_retention_days or history_retention.default_days,
+            state=kb.state or 'ready',
             created_at=kb.created_at,
             updated_at=kb.updated_at,
             documents=doc_list,
-            document_count=len(doc_list)
+            document_count=document_count,
+            next_documents_cursor=next_documents_cursor
         )
     except HTTPException:
         raise
@@ -203,13 +382,16 @@ async def get_knowledge_base(kb_id: int, db: Session = Depends(get_db)):
 
 @app.put("/api/kb/{kb_id}")
 async def update_knowledge_base(kb_id: int, request: UpdateKBRequest, db: Session = Depends(get_db)):
-    """Update knowledge base name"""
+    """Update knowledge base name and/or chat history retention"""
     try:
         kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
         if not kb:
             raise HTTPException(status_code=404, detail="Knowledge base not found")
         
-        kb.name = request.name
+        if request.name is not None:
+            kb.name = request.name
+        if request.history_retention_days is not None:
+            kb.history_retention_days = request.history_retention_days
         kb.updated_at = datetime.now(timezone.utc)
         db.commit()
         
@@ -228,14 +410,26 @@ async def delete_knowledge_base(kb_id: int, db: Session = Depends(get_db)):
         if not kb:
             raise HTTPException(status_code=404, detail="Knowledge base not found")
         
-        # Delete files
-        kb_path = Path(f"../data/kb_{kb_id}")
-        if kb_path.exists():
-            shutil.rmtree(kb_path)
-        
-        # Delete from database (cascade will handle documents and history)
-        db.delete(kb)
-        db.commit()
+        async with exclusive_kb(db, kb_id, 'deleting') as kb:
+            # Queued chat history must land before the cascade delete removes it
+            await run_in_threadpool(history_writer.wait_for_kb, kb_id)
+            
+            content_hashes = [
+                h for (h,) in db.query(Document.content_hash).filter(Document.kb_id == kb_id).all()
+            ]
+            
+            # Delete files
+            kb_path = Path(f"../data/kb_{kb_id}")
+            if kb_path.exists():
+                shutil.rmtree(kb_path)
+            evict_snapshot(kb_path / "vectors")
+            
+            # Drop shared PDFs that no other KB links to
+            BlobStore().gc(content_hashes)
+            
+            # Delete from database (cascade will handle documents and history)
+            db.delete(kb)
+            db.commit()
         
         return {"message": "Knowledge base deleted successfully"}
     except HTTPException:
@@ -252,6 +446,7 @@ async def create_knowledge_base(
 ):
     """Create a new knowledge base with PDF processing and embeddings"""
     import traceback
+    embeddings_service = None
     try:
         print(f"\n{'='*60}")
         print(f"Creating Knowledge Base: {request.name}")
@@ -267,6 +462,10 @@ async def create_knowledge_base(
                 status_code=400,
                 detail="OpenAI API key required for this session. Use Admin in the top bar to set it."
             )
+        try:
+            validate_embedding_dimensions(request.provider, request.embedding_dimensions)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Create KB record
         print("Step 1: Creating KB record in database...")
@@ -275,6 +474,8 @@ async def create_knowledge_base(
             model_id=request.model_id,
             provider=request.provider,
             api_key=None,  # Never persist provider keys
+            embedding_dimensions=request.embedding_dimensions,
+            state='building',
             created_at=datetime.now(timezone.utc),
             updated_at=datetime.now(timezone.utc)
         )
@@ -283,85 +484,109 @@ async def create_knowledge_base(
         db.refresh(kb)
         print(f"✓ KB created with ID: {kb.id}\n")
         
-        # Initialize services
-        print("Step 2: Initializing services...")
-        pdf_processor = PDFProcessor(kb.id)
-        embeddings_service = EmbeddingsService(kb.id, request.provider, request_api_key)
-        print("✓ Services initialized\n")
-        
-        all_chunks = []
-        
-        print(f"Step 3: Processing {len(request.documents)} document(s)...")
-        # Process each PDF
-        for idx, doc in enumerate(request.documents, 1):
-            try:
-                print(f"\n  Document {idx}/{len(request.documents)}: {doc.filename}")
-                
-                # Download PDF
-                print(f"    - Downloading from {doc.url[:50]}...")
-                file_path = pdf_processor.download_pdf(doc.url, doc.filename)
-                print(f"    ✓ Downloaded to {file_path}")
-                
-                # Get page count
-                page_count = pdf_processor.get_page_count(file_path)
-                print(f"    ✓ PDF has {page_count} pages")
-                
-                # Create document record
-                document = Document(
-                    kb_id=kb.id,
-                    filename=doc.filename,
-                    url=doc.url,
-                    file_path=file_path,
-                    page_count=page_count,
-                    status='processing',
-                    added_at=datetime.now(timezone.utc)
-                )
-                db.add(document)
-                db.commit()
-                
-                # Extract text
-                print(f"    - Extracting text from {page_count} pages...")
-                pages_data = pdf_processor.extract_text_from_pdf(file_path)
-                print(f"    ✓ Text extracted")
-                
-                # Chunk text
-                print(f"    - Chunking text...")
-                chunks = embeddings_service.chunk_text(pages_data)
-                all_chunks.extend(chunks)
-                print(f"    ✓ Created {len(chunks)} chunks (total: {len(all_chunks)})")
-                
-                # Update document status
-                document.status = 'completed'
-                db.commit()
-                print(f"    ✓ Document processed successfully\n")
-                
-            except Exception as e:
-                print(f"    ✗ Error processing document: {str(e)}\n")
-                # Mark document as failed
-                if 'document' in locals():
-                    document.status = 'failed'
+        async with exclusive_kb(db, kb.id, 'building') as kb:
+            # Files left by a deleted KB whose id SQLite handed out again
+            shutil.rmtree(Path(f"../data/kb_{kb.id}"), ignore_errors=True)
+            evict_snapshot(Path(f"../data/kb_{kb.id}") / "vectors")
+            
+            # Initialize services
+            print("Step 2: Initializing services...")
+            pdf_processor = PDFProcessor(kb.id, provider=request.provider)
+            embeddings_service = EmbeddingsService(
+                kb.id, request.provider, request_api_key, embedding_dimensions=request.embedding_dimensions
+            )
+            print("✓ Services initialized\n")
+            
+            # Pages stream through extraction, chunking and embedding into a private
+            # index copy that is published once every document is in
+            index_builder = embeddings_service.builder()
+            total_chunks = 0
+            
+            print(f"Step 3: Processing {len(request.documents)} document(s)...")
+            # Process each PDF
+            for idx, doc in enumerate(request.documents, 1):
+                try:
+                    print(f"\n  Document {idx}/{len(request.documents)}: {doc.filename}")
+                    
+                    # Download PDF
+                    print(f"    - Downloading from {doc.url[:50]}...")
+                    # Reuse another KB's copy of the same URL when the server says it is unchanged
+                    known = (
+                        db.query(Document)
+                        .filter(Document.url == doc.url, Document.content_hash.isnot(None))
+                        .order_by(Document.id.desc())
+                        .first()
+                    )
+                    if known:
+                        download = pdf_processor.fetch_pdf(
+                            doc.url, doc.filename,
+                            etag=known.etag, last_modified=known.last_modified, content_hash=known.content_hash
+                        )
+                    else:
+                        download = pdf_processor.fetch_pdf(doc.url, doc.filename)
+                    file_path = download['file_path']
+                    print(f"    ✓ Downloaded to {file_path}")
+                    
+                    # Get page count
+                    page_count = pdf_processor.get_page_count(file_path)
+                    print(f"    ✓ PDF has {page_count} pages")
+                    
+                    # Create document record
+                    document = Document(
+                        kb_id=kb.id,
+                        filename=doc.filename,
+                        url=doc.url,
+                        file_path=file_path,
+                        page_count=page_count,
+                        status='processing',
+                        etag=download['etag'],
+                        last_modified=download['last_modified'],
+                        content_hash=download['content_hash'],
+                        added_at=datetime.now(timezone.utc)
+                    )
+                    db.add(document)
                     db.commit()
-                raise Exception(f"Failed to process {doc.filename}: {str(e)}")
-        
-        # Store all chunks with embeddings
-        print(f"\nStep 4: Generating embeddings for {len(all_chunks)} chunks...")
-        print(f"  This may take a while...")
-        total_chunks = embeddings_service.store_chunks(all_chunks)
-        print(f"✓ All embeddings generated and stored\n")
-        
-        print(f"{'='*60}")
-        print(f"✓ Knowledge Base Created Successfully!")
-        print(f"  ID: {kb.id}")
-        print(f"  Name: {kb.name}")
-        print(f"  Documents: {len(request.documents)}")
-        print(f"  Chunks: {total_chunks}")
-        print(f"{'='*60}\n")
+                    
+                    # Extract, chunk and embed page by page
+                    print(f"    - Extracting, chunking and embedding {page_count} pages...")
+                    chunk_count = index_builder.add_pages(
+                        pdf_processor.iter_pages(file_path, download['content_hash'])
+                    )
+                    total_chunks += chunk_count
+                    print(f"\n    ✓ Created {chunk_count} chunks (total: {total_chunks})")
+                    
+                    # Update document status
+                    document.status = 'completed'
+                    db.commit()
+                    print(f"    ✓ Document processed successfully\n")
+                    
+                except Exception as e:
+                    print(f"    ✗ Error processing document: {str(e)}\n")
+                    # Mark document as failed
+                    if 'document' in locals():
+                        document.status = 'failed'
+                        db.commit()
+                    raise Exception(f"Failed to process {doc.filename}: {str(e)}")
+            
+            # Make the new index visible to queries
+            print(f"\nStep 4: Publishing index with {total_chunks} chunks...")
+            index_builder.publish()
+            print(f"✓ All embeddings generated and stored\n")
+            
+            print(f"{'='*60}")
+            print(f"✓ Knowledge Base Created Successfully!")
+            print(f"  ID: {kb.id}")
+            print(f"  Name: {kb.name}")
+            print(f"  Documents: {len(request.documents)}")
+            print(f"  Chunks: {total_chunks}")
+            print(f"{'='*60}\n")
         
         return CreateKBResponse(
             id=kb.id,
             name=kb.name,
             status="success",
-            message=f"Knowledge base created with {len(request.documents)} documents and {total_chunks} chunks"
+            message=f"Knowledge base created with {len(request.documents)} documents and {total_chunks} chunks",
+            embedding_tokens=embeddings_service.llm_provider.usage.totals()['input_tokens']
         )
         
     except HTTPException:
@@ -371,6 +596,374 @@ async def create_knowledge_base(
         print(f"ERROR creating KB: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Embedding tokens are spent even when the build fails part way
+        if embeddings_service is not None:
+            usage_recorder.record(embeddings_service.kb_id, 'ingest', embeddings_service.llm_provider.usage)
+
+@app.post("/api/kb/{kb_id}/refresh", response_model=RefreshKBResponse)
+async def refresh_knowledge_base(
+    kb_id: int,
+    request: RefreshKBRequest = None,
+    db: Session = Depends(get_db),
+    session_openai_key: str | None = Header(default=None, alias="X-Session-OpenAI-Key")
+):
+    """Re-download changed source PDFs and re-embed only the documents whose content changed"""
+    try:
+        kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+        if not kb:
+            raise HTTPException(status_code=404, detail="Knowledge base not found")
+        
+        request_api_key = (request.api_key if request else None) or session_openai_key
+        if kb.provider == 'openai' and not request_api_key:
+            raise HTTPException(
+                status_code=400,
+                detail="OpenAI API key required for this session. Use Admin in the top bar to set it."
+            )
+        
+        async with exclusive_kb(db, kb_id, 'updating') as kb:
+            documents = db.query(Document).filter(Document.kb_id == kb_id).all()
+            
+            def refresh() -> dict:
+                pdf_processor = PDFProcessor(kb.id, provider=kb.provider)
+                embeddings_service = EmbeddingsService(
+                    kb.id, kb.provider, request_api_key,
+                    chunk_size=kb.chunk_size, chunk_overlap=kb.chunk_overlap,
+                    embedding_dimensions=kb.embedding_dimensions
+                )
+                usage = embeddings_service.llm_provider.usage
+                unchanged, updated, failed, chunks_replaced = 0, 0, [], 0
+                try:
+                    for document in documents:
+                        try:
+                            # Documents created before validators were stored are compared by local file hash
+                            content_hash = document.content_hash
+                            if not content_hash and document.file_path and Path(document.file_path).exists():
+                                content_hash = pdf_processor.hash_file(document.file_path)
+                            
+                            download = pdf_processor.fetch_pdf(
+                                document.url, document.filename,
+                                etag=document.etag,
+                                last_modified=document.last_modified,
+                                content_hash=content_hash
+                            )
+                            document.etag = download['etag']
+                            document.last_modified = download['last_modified']
+                            document.content_hash = download['content_hash']
+                            
+                            if not download['changed'] and document.status == 'completed':
+                                unchanged += 1
+                                db.commit()
+                                continue
+                            
+                            print(f"  - {document.filename} changed, re-indexing...")
+                            chunks_replaced += embeddings_service.replace_document_pages(
+                                document.filename,
+                                pdf_processor.iter_pages(download['file_path'], download['content_hash'])
+                            )
+                            
+                            document.file_path = download['file_path']
+                            document.page_count = pdf_processor.get_page_count(download['file_path'])
+                            document.status = 'completed'
+                            db.commit()
+                            updated += 1
+                        except Exception as e:
+                            print(f"  ✗ Failed to refresh {document.filename}: {str(e)}")
+                            db.rollback()
+                            failed.append(document.filename)
+                finally:
+                    usage_recorder.record(kb_id, 'ingest', usage)
+                return {
+                    'unchanged': unchanged,
+                    'updated': updated,
+                    'failed': failed,
+                    'chunks_replaced': chunks_replaced,
+                    'embedding_tokens': usage.totals()['input_tokens']
+                }
+            
+            # Downloads, extraction and embedding run off the event loop, like re-index
+            print(f"Refreshing KB {kb_id}: checking {len(documents)} document(s)...")
+            result = await run_in_threadpool(refresh)
+            
+            if result['updated']:
+                kb.updated_at = datetime.now(timezone.utc)
+                db.commit()
+        
+        print(f"✓ Refresh complete: {result['updated']} updated, {result['unchanged']} unchanged, "
+              f"{len(result['failed'])} failed")
+        return RefreshKBResponse(id=kb.id, checked=len(documents), **result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/kb/{kb_id}/reindex", response_model=ReindexKBResponse)
+async def reindex_knowledge_base(
+    kb_id: int,
+    request: ReindexKBRequest,
+    db: Session = Depends(get_db),
+    session_openai_key: str | None = Header(default=None, alias="X-Session-OpenAI-Key")
+):
+    """Re-chunk a KB with new chunk settings, reusing stored page text and unchanged embeddings"""
+    try:
+        kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+        if not kb:
+            raise HTTPException(status_code=404, detail="Knowledge base not found")
+        if request.chunk_overlap >= request.chunk_size:
+            raise HTTPException(status_code=400, detail="chunk_overlap must be smaller than chunk_size")
+        
+        request_api_key = request.api_key or session_openai_key
+        if kb.provider == 'openai' and not request_api_key:
+            raise HTTPException(
+                status_code=400,
+                detail="OpenAI API key required for this session. Use Admin in the top bar to set it."
+            )
+        
+        async with exclusive_kb(db, kb_id, 'updating') as kb:
+            documents = (
+                db.query(Document)
+                .filter(Document.kb_id == kb_id, Document.status == 'completed')
+                .order_by(Document.id)
+                .all()
+            )
+            sources = [(doc.file_path, doc.content_hash) for doc in documents]
+            
+            def rebuild() -> dict:
+                pdf_processor = PDFProcessor(kb_id, provider=kb.provider)
+                embeddings_service = EmbeddingsService(
+                    kb_id, kb.provider, request_api_key, embedding_dimensions=kb.embedding_dimensions
+                )
+                # Streamed from the page text cache when the PDF was extracted before
+                pages = (
+                    page
+                    for file_path, content_hash in sources
+                    for page in pdf_processor.iter_pages(file_path, content_hash)
+                )
+                usage = embeddings_service.llm_provider.usage
+                try:
+                    result = embeddings_service.reindex(pages, request.chunk_size, request.chunk_overlap)
+                finally:
+                    usage_recorder.record(kb_id, 'ingest', usage)
+                return {**result, 'embedding_tokens': usage.totals()['input_tokens']}
+            
+            # Run off the event loop so chat requests keep being served from the old index
+            print(f"Re-indexing KB {kb_id} with chunk_size={request.chunk_size}, chunk_overlap={request.chunk_overlap}...")
+            result = await run_in_threadpool(rebuild)
+            print(f"✓ Re-index complete: {result['chunks']} chunks, {result['embeddings_reused']} embeddings reused")
+            
+            kb.chunk_size = request.chunk_size
+            kb.chunk_overlap = request.chunk_overlap
+            kb.updated_at = datetime.now(timezone.utc)
+            db.commit()
+        
+        return ReindexKBResponse(
+            id=kb.id,
+            chunk_size=request.chunk_size,
+            chunk_overlap=request.chunk_overlap,
+            **result
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/kb/{kb_id}/clone", response_model=CloneKBResponse)
+async def clone_knowledge_base(kb_id: int, request: CloneKBRequest, db: Session = Depends(get_db)):
+    """Create a new knowledge base sharing this one's PDFs and index through hardlinks.
+    
+    Nothing is re-downloaded or re-embedded; the clone's files are copied only
+    when a refresh or re-index of either KB replaces them.
+    """
+    try:
+        kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+        if not kb or kb.state == 'deleting':
+            raise HTTPException(status_code=404, detail="Knowledge base not found")
+        
+        # The source's lock keeps a refresh or re-index from swapping files mid-clone
+        async with exclusive_kb(db, kb_id, 'updating') as source:
+            clone = KnowledgeBase(
+                name=request.name,
+                model_id=request.model_id or source.model_id,
+                provider=source.provider,  # Embeddings are shared, so the provider must match
+                api_key=None,
+                chunk_size=source.chunk_size,
+                chunk_overlap=source.chunk_overlap,
+                embedding_dimensions=source.embedding_dimensions,
+                history_retention_days=source.history_retention_days,
+                state='building',
+                created_at=datetime.now(timezone.utc),
+                updated_at=datetime.now(timezone.utc)
+            )
+            db.add(clone)
+            db.commit()
+            db.refresh(clone)
+            clone_id = clone.id
+            
+            async with exclusive_kb(db, clone_id, 'building') as clone:
+                try:
+                    evict_snapshot(Path(f"../data/kb_{clone_id}") / "vectors")
+                    stats = await run_in_threadpool(clone_kb_files, kb_id, clone_id)
+                    
+                    source_path = Path(f"../data/kb_{kb_id}")
+                    clone_path = Path(f"../data/kb_{clone_id}")
+                    documents = db.query(Document).filter(Document.kb_id == kb_id).order_by(Document.id).all()
+                    for doc in documents:
+                        file_path = doc.file_path
+                        if file_path and Path(file_path).is_relative_to(source_path):
+                            file_path = str(clone_path / Path(file_path).relative_to(source_path))
+                        db.add(Document(
+                            kb_id=clone_id,
+                            filename=doc.filename,
+                            url=doc.url,
+                            file_path=file_path,
+                            page_count=doc.page_count,
+                            status=doc.status,
+                            etag=doc.etag,
+                            last_modified=doc.last_modified,
+                            content_hash=doc.content_hash,
+                            added_at=doc.added_at
+                        ))
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    shutil.rmtree(Path(f"../data/kb_{clone_id}"), ignore_errors=True)
+                    db.query(Document).filter(Document.kb_id == clone_id).delete()
+                    db.query(KnowledgeBase).filter(KnowledgeBase.id == clone_id).delete()
+                    db.commit()
+                    raise
+        
+        print(f"✓ Cloned KB {kb_id} into KB {clone_id}: {stats['files_linked']} files linked, "
+              f"{stats['files_copied']} copied")
+        return CloneKBResponse(
+            id=clone_id,
+            name=request.name,
+            source_id=kb_id,
+            documents=len(documents),
+            **stats
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+
+def provider_http_error(e: Exception, action: str) -> HTTPException:
+    """Map a provider failure to the HTTP error shown to the user"""
+    error_text = str(e).lower()
+    if "incorrect api key" in error_text or "invalid api key" in error_text:
+        return HTTPException(
+            status_code=401,
+            detail="OpenAI API key is invalid. Set a valid key via Admin (session)."
+        )
+    if "insufficient_quota" in error_text or "quota" in error_text:
+        return HTTPException(
+            status_code=402,
+            detail="OpenAI quota exceeded or billing issue. Check your OpenAI billing/credits and try again."
+        )
+    if "connection error" in error_text or "api connection" in error_text:
+        return HTTPException(
+            status_code=503,
+            detail="Unable to reach OpenAI API. Check internet access/DNS and try again."
+        )
+    return HTTPException(
+        status_code=500,
+        detail=f"{action}: {str(e)}"
+    )
+
+def resolve_filters(db: Session, kb_id: int, filters: Optional[SearchFilters]) -> Dict:
+    """Turn request filters into query keyword arguments (document ids become filenames)"""
+    if filters is None:
+        return {}
+    filenames = None
+    if filters.document_ids is not None or filters.filenames is not None:
+        filenames = set(filters.filenames or [])
+        if filters.document_ids:
+            documents = db.query(Document.id, Document.filename).filter(
+                Document.kb_id == kb_id, Document.id.in_(filters.document_ids)
+            ).all()
+            missing = set(filters.document_ids) - {doc.id for doc in documents}
+            if missing:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unknown document ids for this knowledge base: {sorted(missing)}"
+                )
+            # Chunks are keyed by filename, so an id cannot tell apart documents sharing one
+            shared = db.query(Document.id, Document.filename).filter(
+                Document.kb_id == kb_id,
+                Document.filename.in_({doc.filename for doc in documents}),
+                Document.id.notin_(filters.document_ids)
+            ).all()
+            if shared:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Document ids share a filename with other documents of this knowledge base: "
+                           f"{sorted({doc.filename for doc in shared})}; filter by filename instead"
+                )
+            filenames.update(doc.filename for doc in documents)
+    page_ranges = None
+    if filters.page_ranges:
+        for page_range in filters.page_ranges:
+            if page_range.end < page_range.start:
+                raise HTTPException(status_code=400, detail="Page range end must not be before its start")
+        page_ranges = [(page_range.start, page_range.end) for page_range in filters.page_ranges]
+    return {'filenames': filenames, 'page_ranges': page_ranges}
+
+def get_conversation(db: Session, kb_id: int, conversation_id: int) -> Conversation:
+    conversation = db.query(Conversation).filter(
+        Conversation.id == conversation_id, Conversation.kb_id == kb_id
+    ).first()
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation
+
+def conversation_response(conversation: Conversation) -> ConversationResponse:
+    return ConversationResponse(
+        id=conversation.id,
+        kb_id=conversation.kb_id,
+        summary=conversation.summary or '',
+        recent_turns=json.loads(conversation.recent_turns or '[]'),
+        turn_count=conversation.turn_count or 0,
+        created_at=conversation.created_at,
+        updated_at=conversation.updated_at
+    )
+
+@app.post("/api/kb/{kb_id}/conversations", response_model=ConversationResponse)
+async def create_conversation(kb_id: int, db: Session = Depends(get_db)):
+    """Start a conversation; pass its id as conversation_id to chat for follow-up questions"""
+    kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+    if not kb or kb.state == 'deleting':
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    try:
+        conversation = Conversation(kb_id=kb_id, summary='', recent_turns='[]', turn_count=0)
+        db.add(conversation)
+        db.commit()
+        db.refresh(conversation)
+        return conversation_response(conversation)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/kb/{kb_id}/conversations/{conversation_id}", response_model=ConversationResponse)
+async def get_conversation_state(kb_id: int, conversation_id: int, db: Session = Depends(get_db)):
+    """Running summary and recent turns the next chat turn will see"""
+    return conversation_response(get_conversation(db, kb_id, conversation_id))
+
+@app.delete("/api/kb/{kb_id}/conversations/{conversation_id}")
+async def delete_conversation(kb_id: int, conversation_id: int, db: Session = Depends(get_db)):
+    """Delete a conversation (chat history is kept)"""
+    conversation = get_conversation(db, kb_id, conversation_id)
+    try:
+        db.delete(conversation)
+        db.commit()
+        return {"message": "Conversation deleted successfully"}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/kb/{kb_id}/chat", response_model=ChatResponse)
 async def chat_with_kb(
@@ -383,8 +976,10 @@ async def chat_with_kb(
     try:
         # Get KB
         kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
-        if not kb:
+        if not kb or kb.state == 'deleting':
             raise HTTPException(status_code=404, detail="Knowledge base not found")
+        if kb.state == 'building' and still_building(db, kb):
+            raise HTTPException(status_code=409, detail="Knowledge base is still being built")
         
         # Resolve provider key with request/session precedence
         effective_api_key = request.api_key or session_openai_key or kb.api_key
@@ -394,25 +989,68 @@ async def chat_with_kb(
                 detail="OpenAI API key required for this session. Use Admin in the top bar to set it."
             )
 
+        # Follow-ups carry the conversation's bounded summary and recent turns
+        conversation, memory, turn_count = None, None, None
+        if request.conversation_id is not None:
+            conversation = get_conversation(db, kb_id, request.conversation_id)
+            # Turns are applied in order: the update below only succeeds if no other
+            # turn of this conversation finished in the meantime
+            turn_count = conversation.turn_count or 0
+            memory = ConversationMemory(
+                conversation.summary,
+                json.loads(conversation.recent_turns or '[]'),
+                context_tokens=config.get_conversation_context_tokens(),
+                summary_tokens=config.get_conversation_summary_tokens()
+            )
+        
         # Initialize chat service with provider info
-        chat_service = ChatService(kb_id, kb.model_id, kb.provider, effective_api_key)
+        chat_service = ChatService(
+            kb_id, kb.model_id, kb.provider, effective_api_key, embedding_dimensions=kb.embedding_dimensions
+        )
         
         # Get response
-        result = chat_service.chat(request.message)
+        diversity = request.diversity if request.diversity is not None else config.get_retrieval_diversity()
+        filters = resolve_filters(db, kb_id, request.filters)
+        db.rollback()  # no transaction held open across the model calls
+        try:
+            # Condensing, answering and summarizing are blocking provider calls
+            result = await run_in_threadpool(
+                chat_service.chat, request.message, diversity=diversity, memory=memory, **filters
+            )
+        finally:
+            usage_recorder.record(kb_id, 'chat', chat_service.llm_provider.usage)
+            usage_recorder.record(kb_id, 'query', chat_service.embeddings_service.llm_provider.usage)
         
-        # Save to history
-        history = ChatHistory(
+        if conversation is not None:
+            updated = db.query(Conversation).filter(
+                Conversation.id == conversation.id, Conversation.turn_count == turn_count
+            ).update({
+                'summary': memory.summary,
+                'recent_turns': json.dumps(memory.turns),
+                'turn_count': turn_count + 1,
+                'updated_at': datetime.now(timezone.utc)
+            }, synchronize_session=False)
+            db.commit()
+            if not updated:
+                raise HTTPException(
+                    status_code=409,
+                    detail="Another message of this conversation was answered meanwhile; send one message at a time"
+                )
+        
+        # Save to history (committed in batches by the background writer)
+        history_writer.submit(
             kb_id=kb_id,
             user_message=request.message,
             bot_response=result['response'],
             timestamp=datetime.now(timezone.utc)
         )
-        db.add(history)
-        db.commit()
         
         return ChatResponse(
             response=result['response'],
-            sources=result['sources']
+            sources=result['sources'],
+            usage=result['usage'],
+            conversation_id=request.conversation_id,
+            standalone_query=result['standalone_query'] if memory is not None else None
         )
     
     except HTTPException:
@@ -422,27 +1060,75 @@ async def chat_with_kb(
         print(f"ERROR in chat_with_kb(kb_id={kb_id}): {str(e)}")
         print(traceback.format_exc())
 
-        error_text = str(e).lower()
-        if "incorrect api key" in error_text or "invalid api key" in error_text:
+        raise provider_http_error(e, "Chat request failed")
+
+@app.post("/api/kb/{kb_id}/search", response_model=SearchResponse)
+async def search_kb(
+    kb_id: int,
+    request: SearchRequest,
+    db: Session = Depends(get_db),
+    session_openai_key: str | None = Header(default=None, alias="X-Session-OpenAI-Key")
+):
+    """Return the chunks most relevant to a query, without calling the chat model"""
+    try:
+        kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+        if not kb or kb.state == 'deleting':
+            raise HTTPException(status_code=404, detail="Knowledge base not found")
+        if kb.state == 'building' and still_building(db, kb):
+            raise HTTPException(status_code=409, detail="Knowledge base is still being built")
+        
+        effective_api_key = request.api_key or session_openai_key or kb.api_key
+        if kb.provider == 'openai' and not effective_api_key:
             raise HTTPException(
-                status_code=401,
-                detail="OpenAI API key is invalid. Set a valid key via Admin (session)."
+                status_code=400,
+                detail="OpenAI API key required for this session. Use Admin in the top bar to set it."
             )
-        if "insufficient_quota" in error_text or "quota" in error_text:
-            raise HTTPException(
-                status_code=402,
-                detail="OpenAI quota exceeded or billing issue. Check your OpenAI billing/credits and try again."
+        
+        embeddings_service = EmbeddingsService(
+            kb_id, kb.provider, effective_api_key, embedding_dimensions=kb.embedding_dimensions
+        )
+        diversity = request.diversity if request.diversity is not None else config.get_retrieval_diversity()
+        try:
+            chunks = await run_in_threadpool(
+                embeddings_service.query, request.query, request.n_results, diversity,
+                **resolve_filters(db, kb_id, request.filters)
             )
-        if "connection error" in error_text or "api connection" in error_text:
-            raise HTTPException(
-                status_code=503,
-                detail="Unable to reach OpenAI API. Check internet access/DNS and try again."
+        finally:
+            usage_recorder.record(kb_id, 'query', embeddings_service.llm_provider.usage)
+        return SearchResponse(results=[
+            SearchResult(
+                filename=chunk['metadata']['filename'],
+                page_number=chunk['metadata']['page_number'],
+                text=chunk['text'],
+                distance=chunk['distance']
             )
+            for chunk in chunks
+        ])
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"ERROR in search_kb(kb_id={kb_id}): {str(e)}")
+        print(traceback.format_exc())
+        raise provider_http_error(e, "Search request failed")
 
-        raise HTTPException(
-            status_code=500,
-            detail=f"Chat request failed: {str(e)}"
-        )
+@app.get("/api/kb/{kb_id}/search-recall", response_model=SearchRecallResponse)
+async def get_search_recall(
+    kb_id: int,
+    k: int = Query(default=10, ge=1, le=100),
+    samples: int = Query(default=200, ge=1, le=2000),
+    db: Session = Depends(get_db)
+):
+    """Recall@k, latency and index sizes of two-stage search versus exact search for a KB"""
+    kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+    if not kb or kb.state == 'deleting':
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    try:
+        report = await run_in_threadpool(search_recall, Path(f"../data/kb_{kb_id}") / "vectors", k, samples)
+        return SearchRecallResponse(**report)
+    except Exception as e:
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/admin/cleanup-api-keys")
 async def cleanup_stored_api_keys(db: Session = Depends(get_db)):
@@ -468,21 +1154,147 @@ async def cleanup_stored_api_keys(db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/admin/prune-text-cache")
+async def prune_text_cache(db: Session = Depends(get_db)):
+    """Remove cached page text for PDFs that no document references."""
+    try:
+        live_hashes = [h for (h,) in db.query(Document.content_hash).distinct().all()]
+        result = PageTextCache().prune(live_hashes)
+        return {
+            "message": f"Removed {result['removed']} cached text file(s), kept {result['kept']}.",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/startup")
+async def get_startup_report():
+    """Worker start-up timings and when heavy dependencies were loaded"""
+    return {
+        "app_import_seconds": round(APP_IMPORT_SECONDS, 4),
+        "startup_seconds": round(startup_timings.get('startup_seconds', 0.0), 4),
+        "heavy_modules_at_import": HEAVY_MODULES_AT_IMPORT,
+        "heavy_modules_loaded": loaded_heavy_modules(),
+        "lazy_import_seconds": {name: round(seconds, 4) for name, seconds in lazy_load_seconds().items()}
+    }
+
+@app.get("/api/admin/provider-latency")
+async def get_provider_latency():
+    """Tail latency, retries, timeouts and hedges of provider calls in this worker"""
+    return latency_report()
+
+@app.get("/api/admin/profiles")
+async def list_profiles():
+    """List stored request profiles, newest first"""
+    if not profiling_enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    profiles = profile_store.list()
+    return {"profiles": profiles, "total": len(profiles)}
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    """Download a stored request profile as HTML"""
+    if not profiling_enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    path = profile_store.get_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/html", filename=path.name)
+
+@app.get("/api/kb/{kb_id}/usage", response_model=KBUsageResponse)
+async def get_kb_usage(
+    kb_id: int,
+    days: int = Query(default=30, ge=1, le=366),
+    db: Session = Depends(get_db)
+):
+    """Tokens (and cost, where priced in config.yml) per day, stage and model for a knowledge base"""
+    kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+    if not kb:
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    
+    # Include this worker's counts that are not written yet
+    await run_in_threadpool(usage_recorder.flush)
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    rows = (
+        db.query(TokenUsageDaily)
+        .filter(TokenUsageDaily.kb_id == kb_id, TokenUsageDaily.day >= since)
+        .order_by(TokenUsageDaily.day.desc(), TokenUsageDaily.stage, TokenUsageDaily.model)
+        .all()
+    )
+    return KBUsageResponse(kb_id=kb_id, **usage_rows(rows, config.get_model_pricing()))
+
+@app.get("/api/usage", response_model=UsageSummaryResponse)
+async def get_usage_summary(
+    days: int = Query(default=30, ge=1, le=366),
+    db: Session = Depends(get_db)
+):
+    """Token and cost totals per knowledge base, highest token use first"""
+    await run_in_threadpool(usage_recorder.flush)
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    pricing = config.get_model_pricing()
+    rows = (
+        db.query(TokenUsageDaily, KnowledgeBase.name)
+        .join(KnowledgeBase, KnowledgeBase.id == TokenUsageDaily.kb_id)
+        .filter(TokenUsageDaily.day >= since)
+        .all()
+    )
+    by_kb = {}
+    for row, name in rows:
+        by_kb.setdefault((row.kb_id, name), []).append(row)
+    summaries = []
+    for (kb_id, name), kb_rows in by_kb.items():
+        usage = usage_rows(kb_rows, pricing)
+        summaries.append(KBUsageSummary(
+            kb_id=kb_id, name=name, totals=usage['totals'], unpriced_models=usage['unpriced_models']
+        ))
+    summaries.sort(key=lambda item: item.totals.input_tokens + item.totals.output_tokens, reverse=True)
+    return UsageSummaryResponse(since=since, knowledge_bases=summaries)
+
 @app.get("/api/kb/{kb_id}/history", response_model=ChatHistoryResponse)
-async def get_chat_history(kb_id: int, db: Session = Depends(get_db)):
-    """Get chat history for a knowledge base (last 7 days)"""
+async def get_chat_history(
+    kb_id: int,
+    limit: int = Query(default=100, ge=1, le=500),
+    before: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get chat history for a knowledge base (within its retention window), newest first.
+    
+    Pages are keyset-paginated on (timestamp, id); pass next_cursor back as
+    ?before= to fetch older messages.
+    """
     try:
         # Get KB
         kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
         if not kb:
             raise HTTPException(status_code=404, detail="Knowledge base not found")
         
-        # Get history from last 7 days
-        seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        history = db.query(ChatHistory).filter(
+        # Make this KB's queued messages visible before reading
+        await run_in_threadpool(history_writer.wait_for_kb, kb_id)
+        
+        # Rows past retention may not be deleted yet; hide them
+        retention_days = kb.history_retention_days or history_retention.default_days
+        cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+        query = db.query(ChatHistory).filter(
             ChatHistory.kb_id == kb_id,
-            ChatHistory.timestamp >= seven_days_ago
-        ).order_by(ChatHistory.timestamp.desc()).all()
+            ChatHistory.timestamp >= cutoff
+        )
+        if before:
+            try:
+                cursor_ts, cursor_id = decode_history_cursor(before)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid history cursor")
+            query = query.filter(or_(
+                ChatHistory.timestamp < cursor_ts,
+                and_(ChatHistory.timestamp == cursor_ts, ChatHistory.id < cursor_id)
+            ))
+        history = query.order_by(
+            ChatHistory.timestamp.desc(), ChatHistory.id.desc()
+        ).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(history) > limit:
+            history = history[:limit]
+            next_cursor = encode_history_cursor(history[-1].timestamp, history[-1].id)
         
         return ChatHistoryResponse(
             history=[
@@ -493,7 +1305,8 @@ async def get_chat_history(kb_id: int, db: Session = Depends(get_db)):
                     timestamp=h.timestamp
                 )
                 for h in history
-            ]
+            ],
+            next_cursor=next_cursor
         )
     
     except HTTPException:
@@ -502,19 +1315,16 @@ async def get_chat_history(kb_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/kb/{kb_id}/history/cleanup")
-async def cleanup_old_history(db: Session = Depends(get_db)):
-    """Delete chat history older than 7 days"""
+async def cleanup_old_history():
+    """Run one chunked history retention pass now (retention also runs in the background)"""
     try:
-        seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        deleted = db.query(ChatHistory).filter(
-            ChatHistory.timestamp < seven_days_ago
-        ).delete()
-        db.commit()
-        
-        return {"message": f"Deleted {deleted} old chat history records"}
+        result = await run_in_threadpool(history_retention.run_once)
+        message = f"Deleted {result['deleted']} old chat history records"
+        if not result['complete']:
+            message += " (time limit reached; the rest is removed on the next run)"
+        return {"message": message, **result}
     
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
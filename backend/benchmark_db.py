@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark the KB listing and chat history queries on a synthetic database.
+
+Compares the previous access patterns (one COUNT per KB, unbounded 7-day
+history scan without secondary indexes, rollback journal) with the current
+ones (grouped count, keyset-paginated history on indexed columns, WAL).
+
+Usage:
+    python benchmark_db.py [--kbs 10000] [--history 1000000] [--docs-per-kb 3]
+"""
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, or_, and_
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, KnowledgeBase, Document, ChatHistory, create_db_engine, init_db
+
+
+def populate(db_path: Path, kbs: int, docs_per_kb: int, history: int) -> None:
+    """Bulk-load synthetic rows with the sqlite3 module (much faster than the ORM)"""
+    conn = sqlite3.connect(str(db_path))
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    fmt = "%Y-%m-%d %H:%M:%S.%f"
+    conn.executemany(
+        "INSERT INTO knowledgebases (id, name, model_id, provider, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+        ((i, f"KB {i}", "gpt-4o-mini", "openai", now.strftime(fmt), now.strftime(fmt)) for i in range(1, kbs + 1))
+    )
+    conn.executemany(
+        "INSERT INTO documents (kb_id, filename, url, page_count, status, added_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (kb, f"doc{d}.pdf", f"https://example.com/{kb}/doc{d}.pdf", 10, "completed", now.strftime(fmt))
+            for kb in range(1, kbs + 1) for d in range(docs_per_kb)
+        )
+    )
+    message = "What does the report say about revenue? " * 5
+    answer = "According to the context, revenue grew. " * 20
+
+    def history_rows():
+        for _ in range(history):
+            age = timedelta(seconds=random.randint(0, 14 * 24 * 3600))
+            yield random.randint(1, kbs), message, answer, (now - age).strftime(fmt)
+
+    conn.executemany(
+        "INSERT INTO chat_history (kb_id, user_message, bot_response, timestamp) VALUES (?, ?, ?, ?)",
+        history_rows()
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(label: str, fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<48} {best * 1000:10.1f} ms")
+    return best
+
+
+def run(db_path: Path, legacy: bool, hot_kb: int) -> None:
+    if legacy:
+        engine = create_engine(f"sqlite:///{db_path}")
+    else:
+        engine = create_db_engine(f"sqlite:///{db_path}")
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
+
+    def list_n_plus_one():
+        for kb in db.query(KnowledgeBase).all():
+            db.query(func.count(Document.id)).filter(Document.kb_id == kb.id).scalar()
+
+    def list_grouped():
+        (
+            db.query(KnowledgeBase, func.count(Document.id))
+            .outerjoin(Document, Document.kb_id == KnowledgeBase.id)
+            .group_by(KnowledgeBase.id)
+            .all()
+        )
+
+    def history_unbounded():
+        db.query(ChatHistory).filter(
+            ChatHistory.kb_id == hot_kb,
+            ChatHistory.timestamp >= seven_days_ago
+        ).order_by(ChatHistory.timestamp.desc()).all()
+
+    def history_pages(pages: int = 3, limit: int = 100):
+        cursor = None
+        for _ in range(pages):
+            query = db.query(ChatHistory).filter(
+                ChatHistory.kb_id == hot_kb,
+                ChatHistory.timestamp >= seven_days_ago
+            )
+            if cursor:
+                query = query.filter(or_(
+                    ChatHistory.timestamp < cursor[0],
+                    and_(ChatHistory.timestamp == cursor[0], ChatHistory.id < cursor[1])
+                ))
+            rows = query.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(limit).all()
+            if not rows:
+                break
+            cursor = (rows[-1].timestamp, rows[-1].id)
+
+    def document_page():
+        db.query(Document).filter(Document.kb_id == hot_kb).order_by(Document.id).limit(200).all()
+
+    if legacy:
+        timed("list KBs (COUNT per KB)", list_n_plus_one, repeat=1)
+        timed("history (7 days, unbounded, no index)", history_unbounded)
+        timed("KB documents (no index)", document_page)
+    else:
+        timed("list KBs (grouped count)", list_grouped)
+        timed("history (3 keyset pages of 100)", history_pages)
+        timed("KB documents (first page, indexed)", document_page)
+
+    db.close()
+    engine.dispose()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kbs", type=int, default=10_000)
+    parser.add_argument("--docs-per-kb", type=int, default=3)
+    parser.add_argument("--history", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        # Tables only (no secondary indexes) for the legacy run
+        Base.metadata.create_all(bind=create_engine(f"sqlite:///{db_path}"), checkfirst=True)
+        legacy_indexes = [ix for t in Base.metadata.sorted_tables for ix in t.indexes]
+        conn = sqlite3.connect(str(db_path))
+        for index in legacy_indexes:
+            conn.execute(f"DROP INDEX IF EXISTS {index.name}")
+        conn.commit()
+        conn.close()
+
+        print(f"Populating {args.kbs} KBs, {args.kbs * args.docs_per_kb} documents, {args.history} history rows...")
+        start = time.perf_counter()
+        populate(db_path, args.kbs, args.docs_per_kb, args.history)
+        print(f"  done in {time.perf_counter() - start:.1f} s\n")
+
+        hot_kb = random.randint(1, args.kbs)
+
+        print("Before (rollback journal, no secondary indexes):")
+        run(db_path, legacy=True, hot_kb=hot_kb)
+
+        print("\nAfter (WAL, indexes, grouped count, keyset pagination):")
+        start = time.perf_counter()
+        init_db(create_db_engine(f"sqlite:///{db_path}"))
+        print(f"  {'create indexes':<48} {(time.perf_counter() - start) * 1000:10.1f} ms")
+        run(db_path, legacy=False, hot_kb=hot_kb)
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Recall, index size and search time of reduced-width embeddings and two-stage search.
+
+Embeds a synthetic corpus with the local (offline) provider at its full width
+and at reduced widths, and builds two-stage indexes (see
+configure_coarse_search) on top. Every variant reports retrieval quality,
+index size and mean search time per single query. Each query paraphrases one
+chunk. "hit@k" (that chunk is found) compares widths, and "exact@k" (overlap
+with exact search at the same width) shows what two-stage search loses.
+Hashed n-gram vectors compress worse than the API providers' embeddings, so
+check a real KB with GET /api/kb/{id}/search-recall.
+
+Usage:
+    python benchmark_embedding_dimensions.py [--chunks 30000] [--queries 200] [-k 10] [--candidates 16] [--min-recall 0.9]
+"""
+import argparse
+import random
+import time
+
+import faiss
+import numpy as np
+
+from services import embeddings
+from services.embeddings import build_coarse_index, configure_coarse_search, search_vectors
+from services.llm_provider import LocalLLMProvider
+
+FULL_WIDTH = 768
+
+
+def make_corpus(chunks: int, queries: int, seed: int = 11):
+    """Chunks drawn from overlapping topic vocabularies; each query paraphrases one chunk.
+
+    Returns (chunks, queries, index of the chunk each query was taken from).
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(8000)]
+    topics = [rng.sample(vocabulary, 300) for _ in range(150)]
+
+    def text(words: int) -> str:
+        primary, secondary = rng.sample(topics, 2)
+        return " ".join(rng.choice(primary if rng.random() < 0.7 else secondary) for _ in range(words))
+
+    corpus = [text(80) for _ in range(chunks)]
+    sources = [rng.randrange(chunks) for _ in range(queries)]
+    # A handful of the source chunk's words plus unrelated ones
+    questions = [
+        " ".join(rng.sample(corpus[source].split(), 10) + rng.sample(vocabulary, 4)) for source in sources
+    ]
+    return corpus, questions, np.array(sources)
+
+
+def embed(texts, dimension: int):
+    provider = LocalLLMProvider(dimension=dimension)
+    return np.vstack([provider.embed_batch(texts[i:i + 1000]) for i in range(0, len(texts), 1000)])
+
+
+def timed_search(index, coarse, queries, k: int):
+    """Top-k ids and mean milliseconds per single-query search"""
+    ids = []
+    start = time.perf_counter()
+    for query in queries:
+        ids.append(search_vectors(index, coarse, query[None, :], k)[1][0])
+    return np.array(ids), (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def overlap(found, truth) -> float:
+    """Share of the exact top-k that a search also returned"""
+    return sum(len(set(f) & set(t)) for f, t in zip(found, truth)) / truth.size
+
+
+def hit_rate(found, sources) -> float:
+    """Share of queries whose source chunk is in the top-k"""
+    return float(np.mean([source in row for row, source in zip(found, sources)]))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=30000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=16, help="coarse candidates per result")
+    parser.add_argument("--min-recall", type=float, default=0.9,
+                        help="exact@k two-stage search must reach to pass")
+    args = parser.parse_args()
+
+    corpus, questions, sources = make_corpus(args.chunks, args.queries)
+    variants = [
+        # (label, embedding width, coarse dimensions, coarse method)
+        (f"full {FULL_WIDTH}", FULL_WIDTH, 0, 'pca'),
+        ("width 384", 384, 0, 'pca'),
+        ("width 256", 256, 0, 'pca'),
+        ("width 128", 128, 0, 'pca'),
+        (f"{FULL_WIDTH} + pca 192", FULL_WIDTH, 192, 'pca'),
+        (f"{FULL_WIDTH} + pca 96", FULL_WIDTH, 96, 'pca'),
+    ]
+
+    print(f"Embedding {len(corpus)} chunks and {len(questions)} queries...")
+    vectors, query_vectors = {}, {}
+    for width in sorted({width for _, width, _, _ in variants}):
+        vectors[width] = embed(corpus, width)
+        query_vectors[width] = embed(questions, width)
+
+    full_bytes = len(corpus) * FULL_WIDTH * 4
+    k = args.k
+    print(f"\n'hit@{k}': query's source chunk in the top {k}; 'exact@{k}': top {k} shared with exact search at that width")
+    print(f"{'':<16} {f'hit@{k}':>8} {f'exact@{k}':>9} {'index MB':>9} {'smaller':>8} {'search':>9} {'speedup':>8}")
+    baseline_ms = None
+    results = {}
+    for label, width, coarse_dimensions, method in variants:
+        index = faiss.IndexFlatL2(width)
+        index.add(vectors[width])
+        configure_coarse_search(coarse_dimensions, method, args.candidates)
+        coarse = build_coarse_index(index) if coarse_dimensions else None
+        found, ms = timed_search(index, coarse, query_vectors[width], k)
+        _, exact = index.search(query_vectors[width], k)
+        size = index.ntotal * width * 4 + (coarse.ntotal * coarse_dimensions * 4 if coarse is not None else 0)
+        baseline_ms = baseline_ms or ms
+        results[label] = (hit_rate(found, sources), overlap(found, exact), size, ms)
+        print(
+            f"{label:<16} {results[label][0]:>8.3f} {results[label][1]:>9.3f} {size / 1e6:>9.1f}"
+            f" {full_bytes / size:>7.1f}x {ms:>7.2f}ms {baseline_ms / ms:>7.1f}x"
+        )
+    configure_coarse_search(0)
+
+    if embeddings.COARSE_MIN_VECTORS > args.chunks:
+        print(f"Note: fewer than {embeddings.COARSE_MIN_VECTORS} chunks; the app would search exactly")
+    # Only a reduced embedding width shrinks the index; the coarse copy adds to it
+    full = results[f"full {FULL_WIDTH}"]
+    reduced = results["width 256"]
+    two_stage = results[f"{FULL_WIDTH} + pca 192"]
+    failed = False
+    if reduced[2] * 2.5 > full[2]:
+        print("✗ A 256-wide index is not about 3x smaller than the full-width one")
+        failed = True
+    if two_stage[3] >= full[3]:
+        print("✗ Two-stage search was not faster than exact search")
+        failed = True
+    if two_stage[1] < args.min_recall:
+        print(f"✗ Two-stage search found {two_stage[1]:.3f} of the exact top {k}, below --min-recall {args.min_recall}")
+        failed = True
+    if failed:
+        return 1
+    print(f"✓ Reduced widths shrink the index; two-stage search is faster at exact@{k} >= {args.min_recall}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -36,8 +36,9 @@ def main():
         ('faiss', 'faiss-cpu'),
         ('langchain', 'langchain'),
         ('tiktoken', 'tiktoken'),
-        ('schedule', 'schedule'),
         ('openai', 'openai'),
+        ('prometheus_client', 'prometheus-client'),
+        ('pyinstrument', 'pyinstrument'),
     ]
     
     results = []
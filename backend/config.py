@@ -66,6 +66,82 @@ class Config:
     def get_log_level(self) -> str:
         """Get log level"""
         return self.get('app.log_level', 'INFO')
+    
+    def get_profiling_enabled(self) -> bool:
+        """Whether requests may opt in to profiling (X-Profile header / ?profile=1); off unless configured"""
+        return bool(self.get('profiling.enabled', False))
+    
+    def get_profiling_max_profiles(self) -> int:
+        """Number of profiles kept in the on-disk ring buffer"""
+        return int(self.get('profiling.max_profiles', 50))
+    
+    def get_profiling_interval(self) -> float:
+        """Profiler sampling interval in seconds"""
+        return float(self.get('profiling.interval', 0.001))
+    
+    def get_history_retention_days(self) -> int:
+        """Default chat history retention for KBs without their own setting"""
+        return int(self.get('history.retention_days', 7))
+    
+    def get_history_retention_interval(self) -> float:
+        """Seconds between background retention runs"""
+        return float(self.get('history.retention_interval', 3600))
+    
+    def get_history_retention_batch_size(self) -> int:
+        """Rows deleted per retention transaction"""
+        return int(self.get('history.retention_batch_size', 500))
+    
+    def get_history_retention_max_run_seconds(self) -> float:
+        """Time box for a single retention run"""
+        return float(self.get('history.retention_max_run_seconds', 10))
+    
+    def get_retrieval_diversity(self) -> float:
+        """Default MMR diversity for chat requests that do not set one (0 disables MMR)"""
+        return float(self.get('retrieval.diversity', 0.0))
+    
+    def get_coarse_search_dimensions(self) -> int:
+        """Dimensions of the first stage of two-stage search (0 searches every vector at full width)"""
+        return int(self.get('retrieval.coarse_dimensions', 0))
+    
+    def get_coarse_search_method(self) -> str:
+        """'pca' or 'truncate' (leading dimensions; for text-embedding-3 and Titan V2)"""
+        return self.get('retrieval.coarse_method', 'pca')
+    
+    def get_coarse_search_candidates(self) -> int:
+        """Coarse candidates re-scored at full precision per requested result"""
+        return int(self.get('retrieval.coarse_candidates', 16))
+    
+    def get_provider_timeout(self, operation: str) -> float:
+        """Seconds one 'chat' or 'embedding' provider attempt may take"""
+        return float(self.get(f'providers.{operation}_timeout', 60 if operation == 'chat' else 15))
+    
+    def get_provider_deadline(self, operation: str) -> float:
+        """Seconds a 'chat' or 'embedding' provider call may take across all retries"""
+        return float(self.get(f'providers.{operation}_deadline', 120 if operation == 'chat' else 30))
+    
+    def get_provider_max_attempts(self) -> int:
+        """Attempts per provider call, including the first"""
+        return int(self.get('providers.max_attempts', 3))
+    
+    def get_embedding_hedge_percentile(self) -> float:
+        """Latency percentile after which a duplicate embedding request is sent (0 disables)"""
+        return float(self.get('providers.embedding_hedge_percentile', 0))
+    
+    def get_model_pricing(self) -> Dict[str, Dict[str, float]]:
+        """USD per million input/output tokens by model id, for usage cost estimates"""
+        return self.get('pricing', {}) or {}
+    
+    def get_conversation_context_tokens(self) -> int:
+        """Token budget of a conversation's summary plus recent turns in each prompt"""
+        return int(self.get('conversation.context_tokens', 1200))
+    
+    def get_conversation_summary_tokens(self) -> int:
+        """Part of the conversation budget kept for the running summary"""
+        return int(self.get('conversation.summary_tokens', 300))
+    
+    def get_kb_lock_timeout(self) -> float:
+        """Seconds a KB write waits for another worker's write to the same KB"""
+        return float(self.get('concurrency.kb_lock_timeout', 30))
 
 
 # Global config instance
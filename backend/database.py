@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, ForeignKey, Text, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -11,30 +11,44 @@ class KnowledgeBase(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
     model_id = Column(String(255), nullable=False)
-    provider = Column(String(50), nullable=False, default='bedrock')  # 'bedrock' or 'openai'
+    provider = Column(String(50), nullable=False, default='bedrock')  # 'bedrock', 'openai' or 'local'
     api_key = Column(String(500), nullable=True)  # For OpenAI API key (encrypted in production)
+    chunk_size = Column(Integer, nullable=True)  # Tokens per chunk; NULL means the service default
+    chunk_overlap = Column(Integer, nullable=True)
+    embedding_dimensions = Column(Integer, nullable=True)  # NULL means the provider's full width
+    history_retention_days = Column(Integer, nullable=True)  # NULL means the configured default
+    state = Column(String(20), nullable=True, default='ready')  # 'ready', 'building', 'updating' or 'deleting'
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     documents = relationship("Document", back_populates="knowledge_base", cascade="all, delete-orphan")
     chat_history = relationship("ChatHistory", back_populates="knowledge_base", cascade="all, delete-orphan")
+    token_usage = relationship("TokenUsageDaily", cascade="all, delete-orphan")
+    conversations = relationship("Conversation", cascade="all, delete-orphan")
 
 class Document(Base):
     __tablename__ = 'documents'
     
     id = Column(Integer, primary_key=True)
-    kb_id = Column(Integer, ForeignKey('knowledgebases.id'), nullable=False)
+    kb_id = Column(Integer, ForeignKey('knowledgebases.id'), nullable=False, index=True)
     filename = Column(String(500), nullable=False)
     url = Column(String(1000), nullable=False)
     file_path = Column(String(1000))
     page_count = Column(Integer)
     status = Column(String(50), default='pending')
+    etag = Column(String(500), nullable=True)  # Validators for conditional refresh downloads
+    last_modified = Column(String(100), nullable=True)
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the downloaded PDF
     added_at = Column(DateTime, default=datetime.utcnow)
     
     knowledge_base = relationship("KnowledgeBase", back_populates="documents")
 
 class ChatHistory(Base):
     __tablename__ = 'chat_history'
+    __table_args__ = (
+        # Serves per-KB history pages and timestamp-based retention
+        Index('ix_chat_history_kb_id_timestamp', 'kb_id', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True)
     kb_id = Column(Integer, ForeignKey('knowledgebases.id'), nullable=False)
@@ -44,13 +58,75 @@ class ChatHistory(Base):
     
     knowledge_base = relationship("KnowledgeBase", back_populates="chat_history")
 
+class TokenUsageDaily(Base):
+    """Tokens used per KB, UTC day, stage ('chat', 'query' or 'ingest') and model"""
+    __tablename__ = 'token_usage_daily'
+    __table_args__ = (
+        UniqueConstraint('kb_id', 'day', 'stage', 'model', name='uq_token_usage_daily'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    kb_id = Column(Integer, ForeignKey('knowledgebases.id'), nullable=False)
+    day = Column(String(10), nullable=False, index=True)  # YYYY-MM-DD
+    stage = Column(String(20), nullable=False)
+    model = Column(String(255), nullable=False)
+    requests = Column(Integer, nullable=False, default=0)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    estimated_tokens = Column(Integer, nullable=False, default=0)  # Part of the totals estimated locally
+
+class Conversation(Base):
+    """Bounded chat memory: a running summary plus the most recent turns"""
+    __tablename__ = 'conversations'
+    
+    id = Column(Integer, primary_key=True)
+    kb_id = Column(Integer, ForeignKey('knowledgebases.id'), nullable=False, index=True)
+    summary = Column(Text, nullable=False, default='')
+    recent_turns = Column(Text, nullable=False, default='[]')  # JSON list of {"user", "assistant"}
+    turn_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 # Database setup
 DATABASE_URL = "sqlite:///./kb_builder.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer; synchronous=NORMAL is durable in WAL mode except on power loss.
+SQLITE_PRAGMAS = (
+    # Only takes effect on a new database (or after VACUUM); lets retention
+    # return freed pages with PRAGMA incremental_vacuum
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+def create_db_engine(url: str = DATABASE_URL):
+    """Create an engine with the SQLite pragmas applied on connect"""
+    db_engine = create_engine(url, connect_args={"check_same_thread": False})
+    
+    @event.listens_for(db_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+    
+    return db_engine
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+def init_db(db_engine=None):
+    db_engine = db_engine or engine
+    Base.metadata.create_all(bind=db_engine)
+    # create_all skips tables that already exist, so add indexes introduced later explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db_engine, checkfirst=True)
 
 def get_db():
     db = SessionLocal()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Report how long importing the API takes and which modules dominate it.
+
+Runs ``python -X importtime -c "import app"`` in a fresh interpreter, prints
+the slowest modules by cumulative import time and fails (exit code 1) when a
+heavy dependency is imported at start-up or the total exceeds --budget.
+
+Usage:
+    python import_report.py [--top 15] [--budget 3.0]
+"""
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+from services.lazy_imports import HEAVY_MODULES
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure():
+    """Return [(module, self_us, cumulative_us, depth)] for `import app`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "import failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="number of top-level imports to list")
+    parser.add_argument("--budget", type=float, default=3.0, help="maximum seconds to import app")
+    args = parser.parse_args()
+
+    try:
+        rows = measure()
+    except RuntimeError as exc:
+        print(f"Failed to import app: {exc}")
+        return 1
+
+    total = next((cumulative for module, _, cumulative, _ in rows if module == "app"), 0) / 1e6
+    direct = sorted((r for r in rows if r[3] == 1), key=lambda r: r[2], reverse=True)
+
+    print(f"import app: {total:.3f} s\n")
+    print(f"  {'module':<40} {'cumulative':>12}")
+    for module, _, cumulative, _ in direct[:args.top]:
+        print(f"  {module:<40} {cumulative / 1000:9.1f} ms")
+
+    imported = {module for module, _, _, _ in rows}
+    heavy = [name for name in HEAVY_MODULES if name in imported]
+    status = 0
+    if heavy:
+        print(f"\n✗ Heavy modules imported at start-up: {', '.join(heavy)}")
+        status = 1
+    else:
+        print("\n✓ No heavy modules imported at start-up")
+    if total > args.budget:
+        print(f"✗ Import time {total:.3f} s exceeds budget of {args.budget:.1f} s")
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,6 @@
 """
-Database migration script to add provider and api_key columns to existing database
+Database migration script to add columns introduced after the initial schema
+(provider/api_key/chunk settings/embedding dimensions/history retention/state on knowledgebases, refresh validators on documents)
 """
 import sqlite3
 from pathlib import Path
@@ -34,6 +35,36 @@ def migrate():
         else:
             print("'api_key' column already exists")
         
+        if 'state' not in columns:
+            print("Adding 'state' column...")
+            cursor.execute("ALTER TABLE knowledgebases ADD COLUMN state VARCHAR(20) DEFAULT 'ready'")
+            print("✓ Added 'state' column")
+        else:
+            print("'state' column already exists")
+        
+        for name in ('chunk_size', 'chunk_overlap', 'embedding_dimensions', 'history_retention_days'):
+            if name not in columns:
+                print(f"Adding '{name}' column...")
+                cursor.execute(f"ALTER TABLE knowledgebases ADD COLUMN {name} INTEGER")
+                print(f"✓ Added '{name}' column")
+            else:
+                print(f"'{name}' column already exists")
+        
+        cursor.execute("PRAGMA table_info(documents)")
+        document_columns = [col[1] for col in cursor.fetchall()]
+        
+        for name, ddl in [
+            ('etag', "VARCHAR(500)"),
+            ('last_modified', "VARCHAR(100)"),
+            ('content_hash', "VARCHAR(64)"),
+        ]:
+            if name not in document_columns:
+                print(f"Adding documents '{name}' column...")
+                cursor.execute(f"ALTER TABLE documents ADD COLUMN {name} {ddl}")
+                print(f"✓ Added documents '{name}' column")
+            else:
+                print(f"documents '{name}' column already exists")
+        
         conn.commit()
         print("\n✓ Migration completed successfully!")
         
@@ -1,10 +1,18 @@
-from pydantic import BaseModel, HttpUrl, ConfigDict
+from pydantic import BaseModel, HttpUrl, ConfigDict, Field
 from typing import Optional, List
 from datetime import datetime
 
 class ScanUrlRequest(BaseModel):
     url: str
 
+class CrawlUrlRequest(BaseModel):
+    url: str
+    max_depth: int = Field(default=2, ge=0, le=10)
+    same_domain: bool = True
+    max_pages: int = Field(default=200, ge=1, le=5000)
+    use_sitemap: bool = True
+    respect_robots: bool = True
+
 class PDFInfo(BaseModel):
     filename: str
     url: str
@@ -34,6 +42,16 @@ class OpenAIModelsResponse(BaseModel):
     models: list[OpenAIModel]
     default_model: str
 
+class LocalModel(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
+    model_id: str
+    model_name: str
+
+class LocalModelsResponse(BaseModel):
+    models: list[LocalModel]
+    default_model: str
+
 class PDFDocument(BaseModel):
     filename: str
     url: str
@@ -43,28 +61,172 @@ class CreateKBRequest(BaseModel):
     
     name: str
     model_id: str
-    provider: str = 'bedrock'  # 'bedrock' or 'openai'
+    provider: str = 'bedrock'  # 'bedrock', 'openai' or 'local'
     api_key: Optional[str] = None  # Required for OpenAI
     documents: List[PDFDocument]
+    # Shortened embeddings (e.g. 256 or 512) for a smaller index; None keeps the full width
+    embedding_dimensions: Optional[int] = Field(default=None, ge=32, le=4096)
 
 class CreateKBResponse(BaseModel):
     id: int
     name: str
     status: str
     message: str
+    embedding_tokens: int = 0
+
+class CloneKBRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
+    name: str
+    model_id: Optional[str] = None  # Chat model of the clone; defaults to the source's
+
+class CloneKBResponse(BaseModel):
+    id: int
+    name: str
+    source_id: int
+    documents: int
+    files_linked: int
+    files_copied: int  # Only when hardlinks are not possible (e.g. another filesystem)
+    bytes_copied: int
+
+class SearchRecallResponse(BaseModel):
+    vectors: int
+    dimensions: Optional[int] = None
+    coarse_dimensions: Optional[int] = None  # None when the snapshot is searched exactly
+    coarse_method: Optional[str] = None
+    index_bytes: int
+    coarse_index_bytes: int
+    samples: int
+    k: int
+    recall: Optional[float] = None  # Share of exact top-k hits the two-stage search also returns
+    exact_ms: Optional[float] = None  # Mean search time per query
+    two_stage_ms: Optional[float] = None
+
+class RefreshKBRequest(BaseModel):
+    api_key: Optional[str] = None
+
+class RefreshKBResponse(BaseModel):
+    id: int
+    checked: int
+    unchanged: int
+    updated: int
+    failed: List[str]
+    chunks_replaced: int
+    embedding_tokens: int = 0
+
+class ReindexKBRequest(BaseModel):
+    chunk_size: int = Field(ge=100, le=8000)
+    chunk_overlap: int = Field(ge=0, le=4000)
+    api_key: Optional[str] = None
+
+class ReindexKBResponse(BaseModel):
+    id: int
+    chunks: int
+    embeddings_reused: int
+    embeddings_generated: int
+    chunk_size: int
+    chunk_overlap: int
+    embedding_tokens: int = 0
+
+class PageRange(BaseModel):
+    start: int = Field(ge=1)
+    end: int = Field(ge=1)  # inclusive
+
+class SearchFilters(BaseModel):
+    # A chunk matches when it belongs to any listed document (by id or filename)
+    # and lies on any listed page range; omitted fields do not restrict
+    document_ids: Optional[List[int]] = None
+    filenames: Optional[List[str]] = None
+    page_ranges: Optional[List[PageRange]] = None
 
 class ChatRequest(BaseModel):
     message: str
     api_key: Optional[str] = None
+    # 0 = plain nearest chunks, up to 1 = favour chunks unlike those already picked
+    diversity: Optional[float] = Field(default=None, ge=0, le=1)
+    filters: Optional[SearchFilters] = None
+    # Continue a conversation created with POST /api/kb/{kb_id}/conversations
+    conversation_id: Optional[int] = None
 
 class SourceReference(BaseModel):
     filename: str
     page_number: int
     text: str
 
+class RequestUsage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    embedding_tokens: int = 0
+    estimated_tokens: int = 0  # Part of the above estimated with tiktoken, not reported by the provider
+
 class ChatResponse(BaseModel):
     response: str
     sources: List[SourceReference]
+    usage: Optional[RequestUsage] = None
+    conversation_id: Optional[int] = None
+    standalone_query: Optional[str] = None  # Query used for retrieval when it was rewritten
+
+class ConversationTurn(BaseModel):
+    user: str
+    assistant: str
+
+class ConversationResponse(BaseModel):
+    id: int
+    kb_id: int
+    summary: str
+    recent_turns: List[ConversationTurn]
+    turn_count: int
+    created_at: datetime
+    updated_at: datetime
+
+class SearchRequest(BaseModel):
+    query: str
+    n_results: int = Field(default=5, ge=1, le=50)
+    api_key: Optional[str] = None
+    diversity: Optional[float] = Field(default=None, ge=0, le=1)
+    filters: Optional[SearchFilters] = None
+
+class SearchResult(BaseModel):
+    filename: str
+    page_number: int
+    text: str
+    distance: float
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+
+class UsageDay(BaseModel):
+    day: str
+    stage: str  # 'chat', 'query' (question embedding) or 'ingest' (document embedding)
+    model: str
+    requests: int
+    input_tokens: int
+    output_tokens: int
+    estimated_tokens: int
+    cost_usd: Optional[float] = None  # None when the model has no configured price
+
+class UsageTotals(BaseModel):
+    requests: int
+    input_tokens: int
+    output_tokens: int
+    estimated_tokens: int
+    cost_usd: float
+
+class KBUsageResponse(BaseModel):
+    kb_id: int
+    days: List[UsageDay]
+    totals: UsageTotals
+    unpriced_models: List[str]
+
+class KBUsageSummary(BaseModel):
+    kb_id: int
+    name: str
+    totals: UsageTotals
+    unpriced_models: List[str]
+
+class UsageSummaryResponse(BaseModel):
+    since: str
+    knowledge_bases: List[KBUsageSummary]
 
 class ChatHistoryItem(BaseModel):
     id: int
@@ -74,6 +236,7 @@ class ChatHistoryItem(BaseModel):
 
 class ChatHistoryResponse(BaseModel):
     history: List[ChatHistoryItem]
+    next_cursor: Optional[str] = None  # Pass as ?before= to fetch the next (older) page
 
 class DocumentInfo(BaseModel):
     id: int
@@ -90,10 +253,16 @@ class KBDetail(BaseModel):
     name: str
     model_id: str
     provider: str
+    chunk_size: int
+    chunk_overlap: int
+    embedding_dimensions: Optional[int] = None
+    history_retention_days: int
+    state: str = 'ready'  # 'building', 'updating' or 'deleting' while a write holds the KB lock
     created_at: datetime
     updated_at: datetime
     documents: List[DocumentInfo]
     document_count: int
+    next_documents_cursor: Optional[int] = None  # Pass as ?documents_after= for the next page
 
 class KBListItem(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
@@ -110,4 +279,5 @@ class KBListResponse(BaseModel):
     total: int
 
 class UpdateKBRequest(BaseModel):
-    name: str
+    name: Optional[str] = None
+    history_retention_days: Optional[int] = Field(default=None, ge=1, le=3650)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Maintenance utility: remove cached page text that no live document uses.
+"""
+from database import SessionLocal, Document
+from services.text_cache import PageTextCache
+
+
+def main() -> int:
+    db = SessionLocal()
+    try:
+        live_hashes = [h for (h,) in db.query(Document.content_hash).distinct().all()]
+        result = PageTextCache().prune(live_hashes)
+        print(
+            f"Removed {result['removed']} cached text file(s) "
+            f"({result['bytes_freed']} bytes), kept {result['kept']}."
+        )
+        return 0
+    except Exception as exc:
+        print(f"Failed to prune text cache: {exc}")
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,18 +1,18 @@
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
 from typing import List
 from models import BedrockModel
+from services.lazy_imports import lazy_import
 
 class BedrockClient:
     def __init__(self, profile_name: str = 'default'):
         try:
-            session = boto3.Session(profile_name=profile_name)
+            session = lazy_import('boto3').Session(profile_name=profile_name)
             self.client = session.client('bedrock', region_name='us-east-1')
         except Exception as e:
             raise Exception(f"Failed to initialize Bedrock client: {str(e)}")
     
     def list_available_models(self) -> List[BedrockModel]:
         """List all available foundation models in AWS Bedrock"""
+        from botocore.exceptions import ClientError, NoCredentialsError
         try:
             response = self.client.list_foundation_models()
             
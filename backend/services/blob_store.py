@@ -0,0 +1,153 @@
+"""
+Content-addressed PDF store shared by all knowledge bases.
+
+Blobs live under ``data/blobs/<first two hex chars>/<sha256>.pdf``. Each KB
+references a blob through a hardlink in its own ``pdfs`` folder, so the
+filesystem link count doubles as the reference count: a blob whose only
+remaining link is the store's own entry is garbage. ``lock`` serialises
+commit+link against gc across workers so a blob cannot be collected between
+being stored and being linked.
+"""
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, Optional
+
+from services.locks import FileLock, LockTimeout
+
+
+class BlobStore:
+    def __init__(self, base_path: str = "../data"):
+        self.root = Path(base_path) / "blobs"
+        self.tmp_path = self.root / "tmp"
+        self.tmp_path.mkdir(parents=True, exist_ok=True)
+        self.lock = FileLock(Path(base_path) / "locks" / "blobs.lock")
+
+    def blob_path(self, content_hash: str) -> Path:
+        return self.root / content_hash[:2] / f"{content_hash}.pdf"
+
+    def has(self, content_hash: Optional[str]) -> bool:
+        return bool(content_hash) and self.blob_path(content_hash).exists()
+
+    def staging_file(self) -> Path:
+        """Temp file on the store's filesystem to stream a download into"""
+        return self.tmp_path / f"{uuid.uuid4().hex}.part"
+
+    def resumable_file(self, url: str) -> Path:
+        """Stable staging file for a URL so an interrupted ranged download can resume"""
+        return self.tmp_path / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.range.part"
+
+    @staticmethod
+    def resumable_lock(partial: Path) -> FileLock:
+        """Lock held by the worker fetching into a resumable staging file"""
+        return FileLock(partial.with_suffix('.lock'))
+
+    @staticmethod
+    def _mtime(path: Path) -> float:
+        try:
+            return path.stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def _prune_resumable(self, partial: Path, cutoff: float) -> int:
+        """Remove an abandoned partial, its resume state and its lock file, holding the lock.
+
+        A worker that locked the file after it was unlinked sees is_current() fail
+        and does not write to the partial.
+        """
+        state = partial.with_name(partial.name + '.json')
+        lock = self.resumable_lock(partial)
+        if max(self._mtime(partial), self._mtime(state), self._mtime(lock.path)) >= cutoff:
+            return 0
+        try:
+            lock.acquire(timeout=0)
+        except LockTimeout:
+            return 0  # still being fetched
+        try:
+            if not lock.is_current():
+                return 0
+            removed = 0
+            for path in (partial, state):
+                if path.exists():
+                    path.unlink(missing_ok=True)
+                    removed += 1
+            lock.path.unlink(missing_ok=True)
+            return removed
+        finally:
+            lock.release()
+
+    def prune_staging(self, max_age_seconds: float = 24 * 3600) -> int:
+        """Remove staging files (and their resume state) abandoned for longer than max_age_seconds"""
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for path in list(self.tmp_path.iterdir()):
+            name = path.name
+            if name.endswith('.range.part'):
+                removed += self._prune_resumable(path, cutoff)
+            elif name.endswith('.lock'):
+                # Lock left without a partial (the download finished or was discarded)
+                partial = path.with_suffix('.part')
+                if not partial.exists():
+                    removed += self._prune_resumable(partial, cutoff)
+            elif name.endswith('.range.part.json'):
+                continue  # pruned with its partial
+            else:
+                try:
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def commit(self, staged: Path, content_hash: str) -> bool:
+        """Move a fully written staging file into the store.
+
+        Returns True when the content was already stored (the staged copy is discarded).
+        """
+        blob = self.blob_path(content_hash)
+        if blob.exists():
+            staged.unlink(missing_ok=True)
+            return True
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged, blob)
+        return False
+
+    def link(self, content_hash: str, dest: Path) -> None:
+        """Atomically point dest at a blob (hardlink, or a copy across filesystems)"""
+        blob = self.blob_path(content_hash)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex[:8]}.link")
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            shutil.copy2(blob, tmp)
+        os.replace(tmp, dest)
+
+    def gc(self, content_hashes: Optional[Iterable[str]] = None) -> int:
+        """Delete blobs no KB links to any more; checks all blobs when no hashes are given"""
+        if content_hashes is None:
+            candidates = self.root.glob("??/*.pdf")
+        else:
+            candidates = (self.blob_path(h) for h in set(content_hashes) if h)
+
+        with self.lock:
+            return self._gc(candidates)
+
+    def _gc(self, candidates) -> int:
+        removed = 0
+        for blob in candidates:
+            try:
+                if blob.stat().st_nlink <= 1:
+                    blob.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+            try:
+                blob.parent.rmdir()  # only succeeds once the prefix folder is empty
+            except OSError:
+                pass
+        return removed
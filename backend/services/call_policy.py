@@ -0,0 +1,258 @@
+"""
+Deadlines, retries and hedging for provider calls.
+
+Every chat and embedding call an LLMProvider makes to a remote API goes
+through ``CallPolicy.call``:
+
+- each attempt gets a timeout, and all attempts together a deadline
+- retryable failures (timeouts, connection errors, throttling, 5xx) are
+  retried with full-jitter exponential backoff
+- idempotent calls (embeddings) can be hedged: when an attempt is slower than
+  the recent ``hedge_percentile`` of that call, an identical request is sent
+  and whichever answers first wins (only while hedge workers are free)
+
+Latency percentiles and retry/hedge counts per provider and operation are
+kept in memory for GET /api/admin/provider-latency.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from services.metrics import PROVIDER_CALL_EVENTS
+
+T = TypeVar('T')
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Exception class names (any base class) that indicate a transient failure
+RETRYABLE_EXCEPTIONS = {
+    'APITimeoutError', 'APIConnectionError', 'RateLimitError', 'InternalServerError',  # openai
+    'ReadTimeoutError', 'ConnectTimeoutError', 'EndpointConnectionError', 'ConnectionClosedError',  # botocore
+    'TimeoutError', 'ConnectionError'
+}
+# Error codes of botocore ClientError worth retrying
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException',
+    'InternalServerException', 'ModelTimeoutException', 'ModelNotReadyException', 'RequestTimeout'
+}
+TIMEOUT_EXCEPTIONS = {'APITimeoutError', 'ReadTimeoutError', 'ConnectTimeoutError', 'TimeoutError'}
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+# Attempt samples needed before the hedge threshold is trusted
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+LATENCY_WINDOW = 1000
+
+# Runs hedged attempts; losers finish in the background, bounded by their timeout.
+# Attempts only go to the pool while a worker is free for them, so none waits
+# in its queue; with every worker busy calls are not hedged.
+HEDGE_POOL_SIZE = 32
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix='provider-hedge')
+_hedge_slots = threading.BoundedSemaphore(HEDGE_POOL_SIZE)
+# Allowance beyond an attempt's timeout for the client to raise its own timeout
+HEDGE_WAIT_GRACE = 1.0
+
+
+def _class_names(exc: BaseException):
+    return {cls.__name__ for cls in type(exc).__mro__}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether a provider error is transient (timeout, connection, throttling, 5xx)"""
+    if _class_names(exc) & RETRYABLE_EXCEPTIONS:
+        return True
+    if getattr(exc, 'status_code', None) in RETRYABLE_STATUS:
+        return True
+    response = getattr(exc, 'response', None)
+    if isinstance(response, dict):  # botocore ClientError
+        code = response.get('Error', {}).get('Code')
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return code in RETRYABLE_ERROR_CODES or status in RETRYABLE_STATUS
+    return False
+
+
+def _percentile(sorted_samples, percent: float) -> Optional[float]:
+    if not sorted_samples:
+        return None
+    rank = min(len(sorted_samples) - 1, max(0, int(round(percent / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[rank]
+
+
+class LatencyStats:
+    """Rolling latencies and event counts of one provider operation"""
+
+    EVENTS = ('calls', 'retries', 'timeouts', 'failures', 'hedges', 'hedge_wins')
+
+    def __init__(self, provider: str, operation: str, window: int = LATENCY_WINDOW):
+        self.provider = provider
+        self.operation = operation
+        # Single attempts (drive the hedge threshold) and whole calls as callers see them
+        self.attempts = deque(maxlen=window)
+        self.calls = deque(maxlen=window)
+        self.counts = dict.fromkeys(self.EVENTS, 0)
+        self._lock = threading.Lock()
+
+    def record_attempt(self, seconds: float) -> None:
+        with self._lock:
+            self.attempts.append(seconds)
+
+    def record_call(self, seconds: float) -> None:
+        with self._lock:
+            self.calls.append(seconds)
+        self.count('calls')
+
+    def count(self, event: str) -> None:
+        with self._lock:
+            self.counts[event] += 1
+        PROVIDER_CALL_EVENTS.labels(provider=self.provider, operation=self.operation, event=event).inc()
+
+    def attempt_percentile(self, percent: float) -> Optional[float]:
+        """Percentile of recent attempt latencies, or None before HEDGE_MIN_SAMPLES attempts"""
+        with self._lock:
+            if len(self.attempts) < HEDGE_MIN_SAMPLES:
+                return None
+            samples = sorted(self.attempts)
+        return _percentile(samples, percent)
+
+    def report(self) -> Dict:
+        with self._lock:
+            calls = sorted(self.calls)
+            attempts = sorted(self.attempts)
+            counts = dict(self.counts)
+        return {
+            **counts,
+            'call_seconds': {f"p{p}": _percentile(calls, p) for p in (50, 90, 95, 99)},
+            'attempt_seconds': {f"p{p}": _percentile(attempts, p) for p in (50, 90, 95, 99)},
+            'max_call_seconds': calls[-1] if calls else None
+        }
+
+
+_stats: Dict[Tuple[str, str], LatencyStats] = {}
+_stats_lock = threading.Lock()
+
+
+def latency_stats(provider: str, operation: str) -> LatencyStats:
+    key = (provider, operation)
+    with _stats_lock:
+        if key not in _stats:
+            _stats[key] = LatencyStats(provider, operation)
+        return _stats[key]
+
+
+def latency_report() -> Dict[str, Dict[str, Dict]]:
+    """Tail-latency statistics per provider and operation since process start"""
+    with _stats_lock:
+        stats = list(_stats.values())
+    report: Dict[str, Dict[str, Dict]] = {}
+    for item in stats:
+        report.setdefault(item.provider, {})[item.operation] = item.report()
+    return report
+
+
+class CallPolicy:
+    def __init__(self, timeout: float = 30.0, deadline: float = 60.0, max_attempts: int = 3,
+                 hedge_percentile: float = 0.0):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_attempts = max(1, max_attempts)
+        # 0 disables hedging
+        self.hedge_percentile = hedge_percentile
+
+    def call(self, fn: Callable[[float], T], stats: LatencyStats, hedge: bool = False,
+             on_hedge: Optional[Callable[[], None]] = None) -> T:
+        """Run fn(timeout) under the policy; hedge only idempotent calls.
+
+        on_hedge is called each time a backup request is sent, so callers can
+        count the request whose result is discarded (it is billed too).
+        """
+        start = time.monotonic()
+        deadline_at = start + self.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = max(0.001, min(self.timeout, deadline_at - time.monotonic()))
+            try:
+                if hedge and self.hedge_percentile > 0:
+                    result = self._hedged(fn, timeout, stats, on_hedge)
+                else:
+                    result = self._attempt(fn, timeout, stats)
+                stats.record_call(time.monotonic() - start)
+                return result
+            except Exception as e:
+                if _class_names(e) & TIMEOUT_EXCEPTIONS:
+                    stats.count('timeouts')
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+                if attempt >= self.max_attempts or not is_retryable(e) \
+                        or time.monotonic() + delay >= deadline_at:
+                    stats.count('failures')
+                    raise
+                stats.count('retries')
+                time.sleep(delay)
+
+    @staticmethod
+    def _attempt(fn: Callable[[float], T], timeout: float, stats: LatencyStats) -> T:
+        start = time.monotonic()
+        try:
+            return fn(timeout)
+        finally:
+            stats.record_attempt(time.monotonic() - start)
+
+    def _submit(self, fn: Callable[[float], T], timeout: float, stats: LatencyStats):
+        """Run an attempt on a free hedge worker, or return None when all are busy"""
+        if not _hedge_slots.acquire(blocking=False):
+            return None
+        future = _hedge_pool.submit(self._attempt, fn, timeout, stats)
+        future.add_done_callback(lambda _: _hedge_slots.release())
+        return future
+
+    def _hedged(self, fn: Callable[[float], T], timeout: float, stats: LatencyStats,
+                on_hedge: Optional[Callable[[], None]] = None) -> T:
+        threshold = stats.attempt_percentile(self.hedge_percentile)
+        if threshold is None or max(threshold, HEDGE_MIN_DELAY) >= timeout:
+            return self._attempt(fn, timeout, stats)
+        delay = max(threshold, HEDGE_MIN_DELAY)
+        give_up_at = time.monotonic() + timeout + HEDGE_WAIT_GRACE
+        primary = self._submit(fn, timeout, stats)
+        if primary is None:
+            return self._attempt(fn, timeout, stats)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        pending = {primary}
+        backup = self._submit(fn, timeout - delay, stats)
+        if backup is not None:
+            stats.count('hedges')
+            if on_hedge is not None:
+                on_hedge()
+            pending.add(backup)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, give_up_at - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"Provider attempt exceeded its {timeout:.1f}s timeout")
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        stats.count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+_policies: Dict[str, CallPolicy] = {
+    'chat': CallPolicy(timeout=60.0, deadline=120.0),
+    'embedding': CallPolicy(timeout=15.0, deadline=30.0)
+}
+
+
+def configure_call_policies(**policies: CallPolicy) -> None:
+    """Replace the policy for operations ('chat', 'embedding') in this process"""
+    _policies.update(policies)
+
+
+def get_call_policy(operation: str) -> CallPolicy:
+    return _policies[operation]
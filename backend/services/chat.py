@@ -1,26 +1,50 @@
 import json
-from typing import List, Dict
+from typing import Dict, Iterable, List, Optional, Tuple
+from services.conversation import STANDALONE_QUERY_TOKENS, ConversationMemory
 from services.embeddings import EmbeddingsService
+from services.tokens import truncate_tokens
 from services.llm_provider import get_llm_provider
+from services.metrics import LLM_SECONDS, LLM_TOKENS, stage_labels, observe_seconds
 
 class ChatService:
-    def __init__(self, kb_id: int, model_id: str, provider: str = 'bedrock', api_key: str = None, profile_name: str = 'default'):
+    def __init__(self, kb_id: int, model_id: str, provider: str = 'bedrock', api_key: str = None, profile_name: str = 'default',
+                 embedding_dimensions: int = None):
         self.kb_id = kb_id
         self.model_id = model_id
         self.provider = provider
         self.llm_provider = get_llm_provider(provider, model_id, api_key, profile_name)
-        self.embeddings_service = EmbeddingsService(kb_id, provider, api_key, profile_name)
+        self.embeddings_service = EmbeddingsService(
+            kb_id, provider, api_key, profile_name, embedding_dimensions=embedding_dimensions
+        )
     
-    def chat(self, user_message: str, n_results: int = 5) -> Dict:
-        """Generate RAG-based response"""
+    def chat(self, user_message: str, n_results: int = 5, diversity: float = 0.0,
+             filenames: Optional[Iterable[str]] = None,
+             page_ranges: Optional[Iterable[Tuple[int, int]]] = None,
+             memory: Optional[ConversationMemory] = None) -> Dict:
+        """Generate RAG-based response (diversity 0-1 trades relevance for distinct chunks via MMR;
+        filenames/page_ranges limit retrieval to those documents and pages; memory makes it a
+        turn of a conversation and is updated in place)"""
         try:
+            # Follow-ups are searched as a standalone question
+            query = user_message
+            if memory is not None and not memory.empty:
+                query = self.llm_provider.condense_question(memory.summary, memory.turns, user_message)
+                query = (query or '').strip().split('\n')[0].strip()
+                query = truncate_tokens(query, STANDALONE_QUERY_TOKENS) or user_message
+            
             # Retrieve relevant chunks
-            relevant_chunks = self.embeddings_service.query(user_message, n_results)
+            relevant_chunks = self.embeddings_service.query(
+                query, n_results, diversity, filenames=filenames, page_ranges=page_ranges
+            )
             
             if not relevant_chunks:
+                response = 'I don\'t have enough information to answer that question.'
+                self._remember(memory, user_message, response)
                 return {
-                    'response': 'I don\'t have enough information to answer that question.',
-                    'sources': []
+                    'response': response,
+                    'sources': [],
+                    'standalone_query': query,
+                    'usage': self.request_usage()
                 }
             
             # Build context from chunks
@@ -29,10 +53,16 @@ class ChatService:
                 for chunk in relevant_chunks
             ])
             
-            # Build prompt
+            # Build prompt; the conversation section has a fixed token budget
+            conversation = ""
+            if memory is not None and not memory.empty:
+                conversation = f"""Conversation so far:
+{memory.render()}
+
+"""
             prompt = f"""You are a helpful assistant. Use the following context to answer the user's question. 
             
-Context:
+{conversation}Context:
 {context}
 
 User Question: {user_message}
@@ -40,7 +70,13 @@ User Question: {user_message}
 Provide a clear and concise answer based on the context. If the context doesn't contain relevant information, say so."""
             
             # Call LLM provider
-            response = self.llm_provider.generate_chat_response(prompt)
+            with observe_seconds(LLM_SECONDS, self.kb_id, self.provider):
+                response = self.llm_provider.generate_chat_response(prompt)
+            self._remember(memory, user_message, response)
+            labels = stage_labels(self.kb_id, self.provider)
+            usage = self.request_usage()
+            LLM_TOKENS.labels(direction='prompt', **labels).inc(usage['prompt_tokens'])
+            LLM_TOKENS.labels(direction='completion', **labels).inc(usage['completion_tokens'])
             
             # Extract sources
             sources = []
@@ -57,8 +93,25 @@ Provide a clear and concise answer based on the context. If the context doesn't
             
             return {
                 'response': response,
-                'sources': sources
+                'sources': sources,
+                'standalone_query': query,
+                'usage': usage
             }
         
         except Exception as e:
             raise Exception(f"Chat failed: {str(e)}")
+    
+    def _remember(self, memory: Optional[ConversationMemory], user_message: str, response: str) -> None:
+        if memory is not None:
+            memory.add_turn(user_message, response, self.llm_provider.summarize_conversation)
+    
+    def request_usage(self) -> Dict:
+        """Tokens this chat used: prompt/completion for the model, plus the query embedding"""
+        chat = self.llm_provider.usage.totals()
+        query = self.embeddings_service.llm_provider.usage.totals()
+        return {
+            'prompt_tokens': chat['input_tokens'],
+            'completion_tokens': chat['output_tokens'],
+            'embedding_tokens': query['input_tokens'],
+            'estimated_tokens': chat['estimated_tokens'] + query['estimated_tokens']
+        }
@@ -0,0 +1,72 @@
+"""
+Bounded memory for multi-turn chat.
+
+A conversation keeps its latest turns word for word. Older turns are folded
+into a running summary. The summary is capped at ``summary_tokens`` and the
+recent turns at the rest of ``context_tokens``, so the conversation part of
+the prompt stays the same size however long the conversation gets.
+Follow-up questions are rewritten into a standalone query before retrieval,
+which keeps the search query short too.
+"""
+from typing import Callable, Dict, List, Optional
+
+from services.tokens import count_tokens, truncate_tokens
+
+DEFAULT_CONTEXT_TOKENS = 1200
+DEFAULT_SUMMARY_TOKENS = 300
+# Cap on a rewritten retrieval query
+STANDALONE_QUERY_TOKENS = 128
+
+
+def render_turns(turns: List[Dict]) -> str:
+    return "\n".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in turns)
+
+
+class ConversationMemory:
+    def __init__(self, summary: str = '', turns: Optional[List[Dict]] = None,
+                 context_tokens: int = DEFAULT_CONTEXT_TOKENS, summary_tokens: int = DEFAULT_SUMMARY_TOKENS):
+        self.summary = summary or ''
+        self.turns: List[Dict] = list(turns or [])
+        self.context_tokens = context_tokens
+        self.summary_tokens = min(summary_tokens, context_tokens // 2)
+
+    @property
+    def turn_budget(self) -> int:
+        """Tokens available to the verbatim turns"""
+        return self.context_tokens - self.summary_tokens
+
+    @property
+    def empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    def _turn_tokens(self) -> int:
+        return sum(count_tokens(turn['user']) + count_tokens(turn['assistant']) for turn in self.turns)
+
+    def render(self) -> str:
+        """Conversation section of the prompt (at most context_tokens plus labels)"""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation:\n{self.summary}")
+        if self.turns:
+            parts.append(f"Most recent turns:\n{render_turns(self.turns)}")
+        return "\n\n".join(parts)
+
+    def add_turn(self, user_message: str, response: str,
+                 summarize: Callable[[str, List[Dict], int], str]) -> None:
+        """Append a turn and fold the oldest turns into the summary until the budget holds.
+
+        summarize(summary, turns, max_tokens) returns the new running summary.
+        """
+        # A single turn never takes more than the whole turn budget
+        half = self.turn_budget // 2
+        self.turns.append({
+            'user': truncate_tokens(user_message, half),
+            'assistant': truncate_tokens(response or '', half)
+        })
+        overflow = []
+        while len(self.turns) > 1 and self._turn_tokens() > self.turn_budget:
+            overflow.append(self.turns.pop(0))
+        if overflow:
+            summary = summarize(self.summary, overflow, self.summary_tokens)
+            # Most recent information matters most when the summary runs long
+            self.summary = truncate_tokens((summary or '').strip(), self.summary_tokens, keep='end')
@@ -0,0 +1,271 @@
+"""
+Recursive PDF crawler.
+
+Crawls HTML pages breadth-first from a start URL (optionally seeded from
+sitemap.xml), honours robots.txt and a per-host politeness delay, and yields
+PDF links as soon as they are discovered.
+"""
+import asyncio
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Set
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+import httpx
+from bs4 import BeautifulSoup
+from models import PDFInfo
+
+USER_AGENT = "KBBuilder-Crawler/1.0"
+MAX_SITEMAP_URLS = 5000
+MAX_SITEMAP_FILES = 20
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form used for dedupe: lowercase scheme/host, no fragment,
+    no default port, sorted query parameters and a non-empty path."""
+    parts = urlparse(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunparse((scheme, host, path, '', query, ''))
+
+
+def is_pdf_url(url: str) -> bool:
+    return urlparse(url).path.lower().endswith('.pdf')
+
+
+@dataclass
+class CrawlOptions:
+    max_depth: int = 2
+    same_domain: bool = True
+    max_pages: int = 200
+    max_frontier: int = 1000
+    concurrency: int = 4
+    politeness_delay: float = 0.5
+    respect_robots: bool = True
+    use_sitemap: bool = True
+    timeout: float = 15.0
+
+
+@dataclass
+class CrawlStats:
+    pages_fetched: int = 0
+    pages_skipped_robots: int = 0
+    frontier_dropped: int = 0
+    pdfs_found: int = 0
+    errors: int = 0
+
+
+@dataclass
+class _HostState:
+    robots: Optional[RobotFileParser] = None
+    next_slot: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class PDFCrawler:
+    """Breadth-first crawler that streams discovered PDFs"""
+
+    def __init__(self, start_url: str, options: CrawlOptions = None):
+        self.start_url = normalize_url(start_url)
+        self.options = options or CrawlOptions()
+        self.root_host = urlparse(self.start_url).netloc
+        self.stats = CrawlStats()
+        self._hosts: Dict[str, _HostState] = {}
+        self._seen_pages: Set[str] = set()
+        self._seen_pdfs: Set[str] = set()
+        self._frontier: asyncio.Queue = None
+        self._found: asyncio.Queue = None
+
+    @staticmethod
+    def _is_http(url: str) -> bool:
+        return urlparse(url).scheme in ('http', 'https')
+
+    def _in_scope(self, url: str) -> bool:
+        """Whether a page may be followed; same_domain limits pages, not the PDFs they link to"""
+        if not self._is_http(url):
+            return False
+        return not self.options.same_domain or urlparse(url).netloc == self.root_host
+
+    def _host(self, url: str) -> _HostState:
+        netloc = urlparse(url).netloc
+        if netloc not in self._hosts:
+            self._hosts[netloc] = _HostState()
+        return self._hosts[netloc]
+
+    async def _wait_for_slot(self, url: str) -> None:
+        """Per-host politeness: space requests to one host by the crawl delay"""
+        host = self._host(url)
+        delay = self.options.politeness_delay
+        if host.robots is not None:
+            delay = max(delay, host.robots.crawl_delay(USER_AGENT) or 0)
+        async with host.lock:
+            now = time.monotonic()
+            wait = max(host.next_slot - now, 0)
+            host.next_slot = max(host.next_slot, now) + delay
+        if wait:
+            await asyncio.sleep(wait)
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str) -> Optional[httpx.Response]:
+        await self._wait_for_slot(url)
+        try:
+            return await client.get(url)
+        except httpx.HTTPError:
+            self.stats.errors += 1
+            return None
+
+    async def _load_robots(self, client: httpx.AsyncClient, url: str) -> RobotFileParser:
+        host = self._host(url)
+        if host.robots is None:
+            parts = urlparse(url)
+            robots = RobotFileParser(f"{parts.scheme}://{parts.netloc}/robots.txt")
+            response = await self._fetch(client, robots.url)
+            if response is not None and response.status_code == 200:
+                robots.parse(response.text.splitlines())
+            else:
+                # Missing robots.txt means everything is allowed
+                robots.parse([])
+            host.robots = robots
+        return host.robots
+
+    async def _allowed(self, client: httpx.AsyncClient, url: str) -> bool:
+        if not self.options.respect_robots:
+            return True
+        robots = await self._load_robots(client, url)
+        return robots.can_fetch(USER_AGENT, url)
+
+    async def _emit_pdf(self, client: httpx.AsyncClient, url: str) -> None:
+        url = normalize_url(url)
+        # PDFs are often served from a CDN or sub-domain, so any host is accepted
+        if url in self._seen_pdfs or not self._is_http(url):
+            return
+        self._seen_pdfs.add(url)
+        if not await self._allowed(client, url):
+            self.stats.pages_skipped_robots += 1
+            return
+        self.stats.pdfs_found += 1
+        filename = urlparse(url).path.rsplit('/', 1)[-1]
+        await self._found.put(PDFInfo(filename=filename, url=url))
+
+    def _enqueue_page(self, url: str, depth: int) -> None:
+        url = normalize_url(url)
+        if url in self._seen_pages or depth > self.options.max_depth or not self._in_scope(url):
+            return
+        self._seen_pages.add(url)
+        try:
+            self._frontier.put_nowait((url, depth))
+        except asyncio.QueueFull:
+            self.stats.frontier_dropped += 1
+
+    async def _sitemap_urls(self, client: httpx.AsyncClient) -> List[str]:
+        """URLs listed in sitemap.xml (and sitemaps named in robots.txt), following sitemap indexes"""
+        parts = urlparse(self.start_url)
+        pending = [f"{parts.scheme}://{parts.netloc}/sitemap.xml"]
+        if self.options.respect_robots:
+            robots = await self._load_robots(client, self.start_url)
+            pending.extend(robots.site_maps() or [])
+
+        urls, visited = [], set()
+        while pending and len(visited) < MAX_SITEMAP_FILES and len(urls) < MAX_SITEMAP_URLS:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in visited:
+                continue
+            visited.add(sitemap_url)
+            response = await self._fetch(client, sitemap_url)
+            if response is None or response.status_code != 200:
+                continue
+            try:
+                root = ET.fromstring(response.content)
+            except ET.ParseError:
+                continue
+            locs = [el.text.strip() for el in root.iter() if el.tag.endswith('loc') and el.text]
+            if root.tag.endswith('sitemapindex'):
+                pending.extend(locs)
+            else:
+                urls.extend(locs[:MAX_SITEMAP_URLS - len(urls)])
+        return urls
+
+    async def _crawl_page(self, client: httpx.AsyncClient, url: str, depth: int) -> None:
+        if self.stats.pages_fetched >= self.options.max_pages:
+            return
+        if not await self._allowed(client, url):
+            self.stats.pages_skipped_robots += 1
+            return
+
+        self.stats.pages_fetched += 1
+        response = await self._fetch(client, url)
+        if response is None or response.status_code != 200:
+            return
+        if 'html' not in response.headers.get('content-type', 'text/html').lower():
+            return
+
+        base_url = str(response.url)
+        soup = BeautifulSoup(response.content, 'html.parser')
+        for link in soup.find_all('a', href=True):
+            full_url = urljoin(base_url, link['href'])
+            if is_pdf_url(full_url):
+                await self._emit_pdf(client, full_url)
+            elif depth < self.options.max_depth:
+                self._enqueue_page(full_url, depth + 1)
+
+    async def _worker(self, client: httpx.AsyncClient) -> None:
+        while True:
+            url, depth = await self._frontier.get()
+            try:
+                await self._crawl_page(client, url, depth)
+            except Exception as e:
+                self.stats.errors += 1
+                print(f"Crawler error on {url}: {str(e)}")
+            finally:
+                self._frontier.task_done()
+
+    async def _run(self, client: httpx.AsyncClient) -> None:
+        if self.options.use_sitemap:
+            for url in await self._sitemap_urls(client):
+                if is_pdf_url(url):
+                    await self._emit_pdf(client, url)
+                else:
+                    self._enqueue_page(url, 1)
+
+        workers = [asyncio.create_task(self._worker(client)) for _ in range(self.options.concurrency)]
+        try:
+            await self._frontier.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def crawl(self) -> AsyncIterator[PDFInfo]:
+        """Yield PDFs as they are discovered"""
+        self._frontier = asyncio.Queue(maxsize=self.options.max_frontier)
+        self._found = asyncio.Queue()
+        self._enqueue_page(self.start_url, 0)
+
+        async with httpx.AsyncClient(
+            timeout=self.options.timeout,
+            follow_redirects=True,
+            headers={'User-Agent': USER_AGENT},
+            limits=httpx.Limits(max_connections=self.options.concurrency * 2)
+        ) as client:
+            runner = asyncio.create_task(self._run(client))
+            try:
+                while True:
+                    getter = asyncio.create_task(self._found.get())
+                    done, _ = await asyncio.wait({getter, runner}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter in done:
+                        yield getter.result()
+                        continue
+                    getter.cancel()
+                    while not self._found.empty():
+                        yield self._found.get_nowait()
+                    runner.result()  # surface crawl errors
+                    break
+            finally:
+                if not runner.done():
+                    runner.cancel()
+                    await asyncio.gather(runner, return_exceptions=True)
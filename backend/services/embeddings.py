@@ -1,144 +1,720 @@
-import json
+import os
 import pickle
-from typing import List, Dict
-try:
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
-except ImportError:
-    from langchain.text_splitters import RecursiveCharacterTextSplitter
-import tiktoken
-import faiss
-import numpy as np
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
+from services.lazy_imports import lazy_import
 from services.llm_provider import get_llm_provider
+from services.tokens import count_tokens
+from services.metrics import (
+    CHUNK_SECONDS, EMBEDDING_SECONDS, EMBEDDING_BATCH_SIZE, SEARCH_SECONDS,
+    stage_labels, observe_seconds, record_cache
+)
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 150
+
+@lru_cache(maxsize=32)
+def get_text_splitter(chunk_size: int, chunk_overlap: int):
+    """Token-length recursive splitter, built once per (chunk_size, chunk_overlap) per process"""
+    try:
+        splitters = lazy_import('langchain_text_splitters')
+    except ImportError:
+        splitters = lazy_import('langchain.text_splitters')
+    return splitters.RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=count_tokens,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+
+# Candidates fetched per requested result when diversifying with MMR
+MMR_FETCH_FACTOR = 4
+MMR_MIN_CANDIDATES = 20
+
+def mmr_select(query_vector, candidates, k: int, diversity: float) -> List[int]:
+    """Greedy Maximal Marginal Relevance over candidate vectors (rows, best match first).
+    
+    Scores are cosine similarities; diversity 0 keeps the relevance order and
+    1 only penalises similarity to the chunks already picked. Returns row
+    positions into candidates in selection order.
+    """
+    np = lazy_import('numpy')
+    vectors = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = query_vector.ravel() / max(float(np.linalg.norm(query_vector)), 1e-12)
+    relevance = vectors @ query
+    pairwise = vectors @ vectors.T
+    
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to anything selected so far
+    redundancy = pairwise[selected[0]].copy()
+    available = np.ones(len(vectors), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, len(vectors)):
+        scores = (1 - diversity) * relevance - diversity * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
+
+# Name of the file in vectors/ that points at the live index snapshot
+CURRENT_POINTER = "CURRENT"
+# Superseded snapshots kept for readers that resolved the pointer just before a swap
+KEEP_OLD_SNAPSHOTS = 2
+# Staging files younger than this may belong to a publish still in progress
+STAGING_GRACE_SECONDS = 3600
+# Knowledge bases whose loaded snapshot is kept in memory per process
+INDEX_CACHE_SIZE = 16
+
+# vector path -> (snapshot version, index, metadata). Cached objects are shared
+# by every request in the process and must never be mutated; writers copy them.
+_index_cache: "OrderedDict[str, Tuple[str, object, List[Dict]]]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+# id(metadata) -> (metadata, ChunkPositions) for loaded snapshots; holding the
+# metadata list keeps its id from being reused while the entry exists
+_positions_cache: "OrderedDict[int, Tuple[List[Dict], ChunkPositions]]" = OrderedDict()
+
+class ChunkPositions:
+    """FAISS ids of a snapshot's chunks grouped by document, for filtered search"""
+    
+    def __init__(self, metadata: List[Dict]):
+        np = lazy_import('numpy')
+        by_file: Dict[str, List[int]] = {}
+        for position, entry in enumerate(metadata):
+            by_file.setdefault(entry['metadata']['filename'], []).append(position)
+        self.by_file = {name: np.array(ids, dtype='int64') for name, ids in by_file.items()}
+        self.pages = np.array([entry['metadata'].get('page_number', 0) for entry in metadata], dtype='int64')
+    
+    def select(self, filenames: Optional[Iterable[str]] = None,
+               page_ranges: Optional[Iterable[Tuple[int, int]]] = None):
+        """Sorted ids of chunks in any of filenames (all when None) on any of the page ranges"""
+        np = lazy_import('numpy')
+        if filenames is None:
+            ids = np.arange(len(self.pages), dtype='int64')
+        else:
+            parts = [self.by_file[name] for name in set(filenames) if name in self.by_file]
+            ids = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype='int64')
+        if page_ranges:
+            pages = self.pages[ids]
+            keep = np.zeros(len(ids), dtype=bool)
+            for start, end in page_ranges:
+                keep |= (pages >= start) & (pages <= end)
+            ids = ids[keep]
+        return ids
+
+def chunk_positions(metadata: List[Dict]) -> ChunkPositions:
+    """Document map of a loaded snapshot's metadata, built once per snapshot per process"""
+    key = id(metadata)
+    with _index_cache_lock:
+        cached = _positions_cache.get(key)
+        if cached and cached[0] is metadata:
+            _positions_cache.move_to_end(key)
+            return cached[1]
+    positions = ChunkPositions(metadata)
+    with _index_cache_lock:
+        _positions_cache[key] = (metadata, positions)
+        while len(_positions_cache) > INDEX_CACHE_SIZE:
+            _positions_cache.popitem(last=False)
+    return positions
+
+# Two-stage search: the query is first matched against a low-dimensional copy
+# of the vectors ("coarse.index" in the snapshot), then the best
+# candidate_factor * k candidates are re-scored with the full-width vectors.
+# Snapshots smaller than COARSE_MIN_VECTORS are searched exactly.
+COARSE_MIN_VECTORS = 2000
+COARSE_TRAIN_SAMPLES = 20000
+COARSE_METHODS = ('pca', 'truncate')
+_coarse_search = {'dimensions': 0, 'method': 'pca', 'candidate_factor': 16}
+
+# id(index) -> (index, coarse index or None) for loaded snapshots, like _positions_cache
+_coarse_cache: "OrderedDict[int, Tuple[object, object]]" = OrderedDict()
+
+def configure_coarse_search(dimensions: int = 0, method: str = 'pca', candidate_factor: int = 16) -> None:
+    """Enable two-stage search for snapshots published from now on (dimensions 0 disables it)"""
+    if method not in COARSE_METHODS:
+        raise ValueError(f"Unknown coarse search method: {method}")
+    _coarse_search.update(dimensions=max(0, dimensions), method=method, candidate_factor=max(1, candidate_factor))
+
+def build_coarse_index(index):
+    """Low-dimensional copy of an index's vectors (PCA or leading dimensions), or None when not worthwhile"""
+    dimensions = _coarse_search['dimensions']
+    if not dimensions or index is None or index.ntotal < COARSE_MIN_VECTORS or dimensions >= index.d:
+        return None
+    faiss = lazy_import('faiss')
+    np = lazy_import('numpy')
+    vectors = index.reconstruct_n(0, index.ntotal)
+    if _coarse_search['method'] == 'pca':
+        transform = faiss.PCAMatrix(index.d, dimensions)
+    else:
+        # Matryoshka-style embeddings (text-embedding-3, Titan V2) front-load information
+        transform = faiss.RemapDimensionsTransform(index.d, dimensions, False)
+    coarse = faiss.IndexPreTransform(transform, faiss.IndexFlatL2(dimensions))
+    if len(vectors) > COARSE_TRAIN_SAMPLES:
+        sample = np.random.default_rng(0).choice(len(vectors), COARSE_TRAIN_SAMPLES, replace=False)
+        coarse.train(vectors[np.sort(sample)])
+    else:
+        coarse.train(vectors)
+    coarse.add(vectors)
+    return coarse
+
+def _cache_coarse(index, coarse) -> None:
+    with _index_cache_lock:
+        _coarse_cache[id(index)] = (index, coarse)
+        _coarse_cache.move_to_end(id(index))
+        while len(_coarse_cache) > INDEX_CACHE_SIZE:
+            _coarse_cache.popitem(last=False)
+
+def coarse_index(snapshot_path: Path, index):
+    """The coarse index published with a loaded snapshot, read once per snapshot per process"""
+    with _index_cache_lock:
+        cached = _coarse_cache.get(id(index))
+        if cached and cached[0] is index:
+            _coarse_cache.move_to_end(id(index))
+            return cached[1]
+    coarse = None
+    path = Path(snapshot_path) / "coarse.index"
+    if path.exists():
+        try:
+            coarse = lazy_import('faiss').read_index(str(path))
+        except RuntimeError:
+            coarse = None  # garbage-collected meanwhile; this snapshot is searched exactly
+        if coarse is not None and coarse.ntotal != index.ntotal:
+            coarse = None
+    _cache_coarse(index, coarse)
+    return coarse
+
+def search_vectors(index, coarse, query_vectors, k: int, params=None):
+    """(distances, ids) of the k nearest vectors; two-stage when a coarse index is given.
+    
+    Candidates from the coarse index are re-scored with exact L2 distances on
+    the full-width vectors, so returned distances match a flat search.
+    """
+    if coarse is None:
+        return index.search(query_vectors, k, params=params)
+    np = lazy_import('numpy')
+    fetch = min(k * _coarse_search['candidate_factor'], index.ntotal)
+    _, candidates = coarse.search(query_vectors, fetch, params=params)
+    distances = np.full((len(query_vectors), k), np.inf, dtype='float32')
+    ids = np.full((len(query_vectors), k), -1, dtype='int64')
+    for row, query in enumerate(query_vectors):
+        found = candidates[row][candidates[row] >= 0]
+        if len(found) == 0:
+            continue
+        exact = ((index.reconstruct_batch(found) - query) ** 2).sum(axis=1)
+        best = np.argsort(exact, kind='stable')[:k]
+        distances[row, :len(best)] = exact[best]
+        ids[row, :len(best)] = found[best]
+    return distances, ids
+
+def search_recall(vector_path: Path, k: int = 10, samples: int = 200) -> Dict:
+    """Recall@k of two-stage search against exact search, plus index sizes and latency.
+    
+    Queries are a random sample of the stored chunk vectors, so no provider
+    call is needed. Each query's own chunk is left out of both result lists,
+    since both stages find it at distance 0.
+    """
+    np = lazy_import('numpy')
+    snapshot_path, index, metadata = load_snapshot(vector_path)
+    report = {
+        'vectors': 0, 'dimensions': None, 'coarse_dimensions': None, 'coarse_method': None,
+        'index_bytes': 0, 'coarse_index_bytes': 0, 'samples': 0, 'k': k,
+        'recall': None, 'exact_ms': None, 'two_stage_ms': None
+    }
+    if index is None or index.ntotal == 0:
+        return report
+    coarse = coarse_index(snapshot_path, index)
+    report.update(vectors=index.ntotal, dimensions=index.d, index_bytes=index.ntotal * index.d * 4)
+    if coarse is None:
+        return report
+    faiss = lazy_import('faiss')
+    transform = faiss.downcast_VectorTransform(coarse.chain.at(0))
+    report.update(
+        coarse_dimensions=transform.d_out,
+        coarse_method='pca' if isinstance(transform, faiss.PCAMatrix) else 'truncate',
+        coarse_index_bytes=coarse.ntotal * transform.d_out * 4 + index.d * transform.d_out * 4
+    )
+    k = min(k, index.ntotal - 1)
+    if k < 1:
+        return report
+    rows = np.sort(np.random.default_rng(0).choice(index.ntotal, min(samples, index.ntotal), replace=False))
+    queries = index.reconstruct_batch(rows.astype('int64'))
+    start = time.perf_counter()
+    _, exact = index.search(queries, k + 1)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    _, approximate = search_vectors(index, coarse, queries, k + 1)
+    two_stage_seconds = time.perf_counter() - start
+    
+    def others(ids, own):
+        return set([i for i in ids if i >= 0 and i != own][:k])
+    
+    found = sum(len(others(a, own) & others(e, own)) for a, e, own in zip(approximate, exact, rows))
+    report.update(
+        samples=len(queries),
+        k=k,
+        recall=round(found / (len(queries) * k), 4),
+        exact_ms=round(exact_seconds * 1000 / len(queries), 3),
+        two_stage_ms=round(two_stage_seconds * 1000 / len(queries), 3)
+    )
+    return report
+
+def _staged_before(path: Path, cutoff: float) -> bool:
+    """Whether a staging file or folder (and everything in it) was last written before cutoff"""
+    try:
+        paths = [path, *path.iterdir()] if path.is_dir() else [path]
+        return all(p.stat().st_mtime < cutoff for p in paths)
+    except FileNotFoundError:
+        return False
+
+def _fsync(path: Path) -> None:
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _snapshot_version(vector_path: Path) -> Tuple[Path, Optional[str]]:
+    """Resolve the live snapshot folder and a version token (None when there is no index)"""
+    try:
+        name = (vector_path / CURRENT_POINTER).read_text().strip()
+    except FileNotFoundError:
+        name = ""
+    if name:
+        return vector_path / name, name
+    # Pre-snapshot KBs keep their files directly in vectors/
+    try:
+        stat = (vector_path / "faiss.index").stat()
+    except FileNotFoundError:
+        return vector_path, None
+    return vector_path, f"legacy-{stat.st_mtime_ns}-{stat.st_size}"
+
+def load_snapshot(vector_path: Path):
+    """Return (snapshot path, index, metadata) for the live snapshot without taking locks.
+    
+    Snapshots are immutable once published, so a loaded snapshot stays valid
+    for as long as the caller holds it; the pointer is re-read on every call to
+    pick up newer versions.
+    """
+    key = str(vector_path)
+    for attempt in range(3):
+        snapshot_path, version = _snapshot_version(vector_path)
+        if version is None:
+            evict_snapshot(vector_path)  # e.g. deleted by another worker
+            return snapshot_path, None, []
+        with _index_cache_lock:
+            cached = _index_cache.get(key)
+            if cached and cached[0] == version:
+                _index_cache.move_to_end(key)
+                return snapshot_path, cached[1], cached[2]
+        if snapshot_path != vector_path and not (snapshot_path / "faiss.index").exists() \
+                and (snapshot_path / "metadata.pkl").exists():
+            return snapshot_path, None, []  # published empty (e.g. re-index without text)
+        try:
+            index = lazy_import('faiss').read_index(str(snapshot_path / "faiss.index"))
+            with open(snapshot_path / "metadata.pkl", 'rb') as f:
+                metadata = pickle.load(f)
+        except (FileNotFoundError, RuntimeError):
+            # Garbage-collected between resolving the pointer and reading; resolve again
+            if attempt == 2:
+                raise
+            continue
+        with _index_cache_lock:
+            _index_cache[key] = (version, index, metadata)
+            _index_cache.move_to_end(key)
+            while len(_index_cache) > INDEX_CACHE_SIZE:
+                _index_cache.popitem(last=False)
+        return snapshot_path, index, metadata
+
+def evict_snapshot(vector_path: Path) -> None:
+    """Drop a KB's loaded snapshot from this process's cache"""
+    with _index_cache_lock:
+        _index_cache.pop(str(vector_path), None)
 
 class EmbeddingsService:
-    def __init__(self, kb_id: int, provider: str = 'bedrock', api_key: str = None, profile_name: str = 'default', base_path: str = "../data"):
+    # Number of chunks sent to the provider per embedding call
+    embedding_batch_size = 64
+    
+    def __init__(self, kb_id: int, provider: str = 'bedrock', api_key: str = None, profile_name: str = 'default', base_path: str = "../data",
+                 chunk_size: int = None, chunk_overlap: int = None, embedding_dimensions: int = None):
         self.kb_id = kb_id
         self.provider = provider
-        self.llm_provider = get_llm_provider(provider, None, api_key, profile_name)  # model_id not needed for embeddings
+        # model_id not needed for embeddings; embedding_dimensions None means the provider's full width
+        self.llm_provider = get_llm_provider(provider, None, api_key, profile_name, embedding_dimensions)
         
         # FAISS setup
-        self.vector_path = Path(base_path) / f"kb_{kb_id}" / "vectors"
-        self.vector_path.mkdir(parents=True, exist_ok=True)
+        self.vector_path = Path(base_path) / f"kb_{kb_id}" / "vectors"  # created by the first write
         
-        self.index_file = self.vector_path / "faiss.index"
-        self.metadata_file = self.vector_path / "metadata.pkl"
+        # Every write publishes a new snapshot folder and points CURRENT at it.
+        # The loaded index and metadata are shared read-only with other requests.
+        self.snapshot_path, self.index, self.metadata = load_snapshot(self.vector_path)
         
-        # Initialize or load FAISS index
-        if self.index_file.exists():
-            self.index = faiss.read_index(str(self.index_file))
-            with open(self.metadata_file, 'rb') as f:
-                self.metadata = pickle.load(f)
-        else:
-            self.index = None
-            self.metadata = []
-        
-        # Text splitter for semantic chunking
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=150,
-            length_function=self._count_tokens,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+        self.chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        self.chunk_overlap = DEFAULT_CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+    
+    @property
+    def text_splitter(self):
+        """Text splitter for semantic chunking (shared per process, built on first use)"""
+        return get_text_splitter(self.chunk_size, self.chunk_overlap)
     
     def _count_tokens(self, text: str) -> int:
         """Count tokens using tiktoken"""
-        encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(text))
+        return count_tokens(text)
     
-    def chunk_text(self, pages_data: List[Dict]) -> List[Dict]:
-        """Chunk text from pages with metadata"""
-        chunks = []
-        
-        for page_data in pages_data:
-            text = page_data['text']
-            page_num = page_data['page_number']
-            filename = page_data['filename']
-            
-            # Split text into chunks
-            text_chunks = self.text_splitter.split_text(text)
-            
-            for i, chunk in enumerate(text_chunks):
-                chunks.append({
-                    'text': chunk,
-                    'metadata': {
-                        'filename': filename,
-                        'page_number': page_num,
-                        'chunk_index': i
+    def iter_chunks(self, pages: Iterable[Dict], text_splitter=None) -> Iterator[Dict]:
+        """Chunk pages with metadata lazily, one page at a time"""
+        text_splitter = text_splitter or self.text_splitter
+        elapsed = 0.0
+        try:
+            for page_data in pages:
+                # Split text into chunks
+                start = time.perf_counter()
+                text_chunks = text_splitter.split_text(page_data['text'])
+                elapsed += time.perf_counter() - start
+                
+                for i, chunk in enumerate(text_chunks):
+                    yield {
+                        'text': chunk,
+                        'metadata': {
+                            'filename': page_data['filename'],
+                            'page_number': page_data['page_number'],
+                            'chunk_index': i
+                        }
                     }
-                })
-        
-        return chunks
+        finally:
+            CHUNK_SECONDS.labels(**stage_labels(self.kb_id, self.provider)).observe(elapsed)
+    
+    def chunk_text(self, pages_data: Iterable[Dict], text_splitter=None) -> List[Dict]:
+        """Chunk text from pages with metadata"""
+        return list(self.iter_chunks(pages_data, text_splitter))
     
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding using configured provider"""
-        return self.llm_provider.generate_embedding(text)
+        EMBEDDING_BATCH_SIZE.labels(**stage_labels(self.kb_id, self.provider)).observe(1)
+        with observe_seconds(EMBEDDING_SECONDS, self.kb_id, self.provider):
+            return self.llm_provider.generate_embedding(text)
     
-    def store_chunks(self, chunks: List[Dict]) -> int:
-        """Store chunks with embeddings in FAISS"""
-        try:
-            embeddings = []
-            total = len(chunks)
-            
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a batch of texts using configured provider"""
+        EMBEDDING_BATCH_SIZE.labels(**stage_labels(self.kb_id, self.provider)).observe(len(texts))
+        with observe_seconds(EMBEDDING_SECONDS, self.kb_id, self.provider):
+            return self.llm_provider.generate_embeddings(texts)
+    
+    def _embed_chunks(self, chunks: List[Dict], progress: bool = True):
+        """Embed chunks in batches; returns (float32 vectors, metadata entries)"""
+        np = lazy_import('numpy')
+        embeddings = []
+        metadata = []
+        total = len(chunks)
+        
+        if progress:
             print(f"  Generating embeddings: 0/{total}", end='', flush=True)
+        
+        for start in range(0, total, self.embedding_batch_size):
+            batch = chunks[start:start + self.embedding_batch_size]
             
-            for i, chunk in enumerate(chunks, 1):
-                # Generate embedding
-                embedding = self.generate_embedding(chunk['text'])
-                embeddings.append(embedding)
-                
-                # Store metadata
-                self.metadata.append({
+            # Generate embeddings for the whole batch; float32 right away instead of lists of floats
+            embeddings.append(np.asarray(self.generate_embeddings([chunk['text'] for chunk in batch]), dtype='float32'))
+            
+            for chunk in batch:
+                metadata.append({
                     'text': chunk['text'],
                     'metadata': chunk['metadata']
                 })
-                
-                # Progress update every 10 chunks or at the end
-                if i % 10 == 0 or i == total:
-                    print(f"\r  Generating embeddings: {i}/{total}", end='', flush=True)
             
+            if progress:
+                print(f"\r  Generating embeddings: {start + len(batch)}/{total}", end='', flush=True)
+        
+        if progress:
             print()  # New line after progress
+        
+        if not embeddings:
+            return np.zeros((0, 0), dtype='float32'), metadata
+        return np.vstack(embeddings), metadata
+    
+    def builder(self) -> "IndexBuilder":
+        """Start a write on a private copy of the current index"""
+        return IndexBuilder(self)
+    
+    def _writable_copy(self):
+        """Private copies of the loaded index and metadata for a writer to modify"""
+        index = lazy_import('faiss').clone_index(self.index) if self.index is not None else None
+        return index, list(self.metadata)
+    
+    @staticmethod
+    def _add_vectors(index, metadata: List[Dict], embeddings_array: "numpy.ndarray", new_metadata: List[Dict]):
+        if len(new_metadata) == 0:
+            return index
+        
+        # Create FAISS index on first add
+        if index is None:
+            dimension = embeddings_array.shape[1]
+            index = lazy_import('faiss').IndexFlatL2(dimension)
+        
+        index.add(embeddings_array)
+        metadata.extend(new_metadata)
+        return index
+    
+    def store_chunks(self, chunks: Iterable[Dict]) -> int:
+        """Store chunks with embeddings in FAISS"""
+        try:
+            builder = self.builder()
+            count = builder.add_chunks(chunks)
+            builder.publish()
+            return count
+        except Exception as e:
+            raise Exception(f"Failed to store chunks: {str(e)}")
+    
+    def replace_document_chunks(self, filename: str, chunks: Iterable[Dict]) -> int:
+        """Replace every vector of one document with freshly embedded chunks"""
+        try:
+            # The builder works on a copy, so a provider failure leaves the stored index untouched
+            builder = self.builder()
+            builder.remove_document(filename)
+            count = builder.add_chunks(chunks)
+            builder.publish()
+            return count
+        except Exception as e:
+            raise Exception(f"Failed to replace chunks for {filename}: {str(e)}")
+    
+    def replace_document_pages(self, filename: str, pages: Iterable[Dict]) -> int:
+        """Replace a document's vectors, chunking and embedding its pages as they stream in"""
+        return self.replace_document_chunks(filename, self.iter_chunks(pages))
+    
+    def reindex(self, pages_data: Iterable[Dict], chunk_size: int, chunk_overlap: int) -> Dict:
+        """Re-chunk stored page text and publish a new index snapshot.
+        
+        Vectors of chunks whose text is unchanged are copied from the current
+        index instead of being re-embedded. The new snapshot is written to its
+        own folder and made live by atomically replacing the CURRENT pointer,
+        so requests that already loaded the old index keep using it.
+        """
+        np = lazy_import('numpy')
+        try:
+            splitter = get_text_splitter(chunk_size, chunk_overlap)
+            
+            # Existing vectors keyed by chunk text
+            reusable = {}
+            if self.index is not None and self.index.ntotal:
+                old_vectors = self.index.reconstruct_n(0, self.index.ntotal)
+                for i, entry in enumerate(self.metadata):
+                    reusable.setdefault(entry['text'], old_vectors[i])
+                del old_vectors
             
-            # Convert to numpy array
-            embeddings_array = np.array(embeddings).astype('float32')
+            index, metadata = None, []
+            counts = {'chunks': 0, 'embeddings_reused': 0, 'embeddings_generated': 0}
             
-            # Create or add to FAISS index
-            if self.index is None:
-                dimension = embeddings_array.shape[1]
-                self.index = faiss.IndexFlatL2(dimension)
+            def add_batch(batch: List[Dict]) -> None:
+                nonlocal index
+                missing = list(dict.fromkeys(chunk['text'] for chunk in batch if chunk['text'] not in reusable))
+                for chunk in batch:
+                    record_cache('embedding', chunk['text'] not in missing)
+                if missing:
+                    new_vectors, _ = self._embed_chunks([{'text': text, 'metadata': {}} for text in missing], progress=False)
+                    reusable.update(zip(missing, new_vectors))
+                vectors = np.stack([reusable[chunk['text']] for chunk in batch]).astype('float32')
+                index = self._add_vectors(index, metadata, vectors, batch)
+                counts['chunks'] += len(batch)
+                counts['embeddings_generated'] += len(missing)
+                counts['embeddings_reused'] += len(batch) - len(missing)
             
-            self.index.add(embeddings_array)
+            # Stream pages through chunking; only one embedding batch is pending at a time
+            batch = []
+            for chunk in self.iter_chunks(pages_data, splitter):
+                batch.append(chunk)
+                if len(batch) == self.embedding_batch_size:
+                    add_batch(batch)
+                    batch = []
+            if batch:
+                add_batch(batch)
             
-            # Save index and metadata
-            faiss.write_index(self.index, str(self.index_file))
-            with open(self.metadata_file, 'wb') as f:
-                pickle.dump(self.metadata, f)
+            self._publish_snapshot(index, metadata)
+            self.chunk_size, self.chunk_overlap = chunk_size, chunk_overlap
             
-            return len(chunks)
+            return counts
         except Exception as e:
-            raise Exception(f"Failed to store chunks: {str(e)}")
+            raise Exception(f"Failed to re-index: {str(e)}")
+    
+    def _publish_snapshot(self, index, metadata: List[Dict]) -> None:
+        """Write index + metadata to a new snapshot folder and atomically swap CURRENT to it.
+        
+        The folder is fully written and fsynced under a temporary name before
+        it is renamed into place, so a crash never leaves a half-written
+        snapshot behind the pointer.
+        """
+        name = f"snapshot-{time.time_ns()}"
+        staging = self.vector_path / f".{name}.tmp"
+        staging.mkdir(parents=True)
+        try:
+            coarse = None
+            if index is not None:
+                lazy_import('faiss').write_index(index, str(staging / "faiss.index"))
+                coarse = build_coarse_index(index)
+                if coarse is not None:
+                    lazy_import('faiss').write_index(coarse, str(staging / "coarse.index"))
+            with open(staging / "metadata.pkl", 'wb') as f:
+                pickle.dump(metadata, f)
+            for path in staging.iterdir():
+                _fsync(path)
+            snapshot = self.vector_path / name
+            os.rename(staging, snapshot)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        
+        pointer_tmp = self.vector_path / f".{CURRENT_POINTER}.{name}"
+        with open(pointer_tmp, 'w') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, self.vector_path / CURRENT_POINTER)
+        _fsync(self.vector_path)
+        
+        self.snapshot_path = snapshot
+        self.index, self.metadata = index, metadata
+        if index is not None:
+            with _index_cache_lock:
+                _index_cache[str(self.vector_path)] = (name, index, metadata)
+                _index_cache.move_to_end(str(self.vector_path))
+            _cache_coarse(index, coarse)
+        
+        self._gc_snapshots(name)
     
-    def query(self, query_text: str, n_results: int = 5) -> List[Dict]:
-        """Query FAISS for relevant chunks"""
+    def _gc_snapshots(self, current: str) -> None:
+        """Delete superseded snapshots beyond the few kept for in-flight readers.
+        
+        Writers of a KB are serialised by its kb_lock, but a publish from a
+        process that bypassed it must not lose its staging files, so those are
+        only removed once they are older than STAGING_GRACE_SECONDS.
+        """
+        # Names embed the publish time, so they sort oldest first
+        old = sorted(p.name for p in self.vector_path.glob("snapshot-*") if p.name != current)
+        for name in old[:max(len(old) - KEEP_OLD_SNAPSHOTS, 0)]:
+            shutil.rmtree(self.vector_path / name, ignore_errors=True)
+        # Staging folders and pointer files left behind by a crash during publish
+        cutoff = time.time() - STAGING_GRACE_SECONDS
+        for path in self.vector_path.glob(".snapshot-*.tmp"):
+            if path.name != f".{current}.tmp" and _staged_before(path, cutoff):
+                shutil.rmtree(path, ignore_errors=True)
+        for path in self.vector_path.glob(f".{CURRENT_POINTER}.*"):
+            if _staged_before(path, cutoff):
+                path.unlink(missing_ok=True)
+        # Files of a pre-snapshot KB are superseded by the first snapshot
+        for legacy in ("faiss.index", "metadata.pkl"):
+            (self.vector_path / legacy).unlink(missing_ok=True)
+    
+    def query(self, query_text: str, n_results: int = 5, diversity: float = 0.0,
+              filenames: Optional[Iterable[str]] = None,
+              page_ranges: Optional[Iterable[Tuple[int, int]]] = None) -> List[Dict]:
+        """Query FAISS for relevant chunks.
+        
+        With diversity > 0, over-fetches candidates and re-ranks them with MMR
+        on their stored vectors so near-duplicate chunks give way to distinct ones.
+        Snapshots published with a coarse index are searched in two stages.
+        filenames and page_ranges (inclusive) restrict the search itself through
+        a FAISS ID selector, so n_results matches are found however few chunks
+        pass the filter.
+        """
         try:
             if self.index is None or len(self.metadata) == 0:
                 return []
             
+            np = lazy_import('numpy')
+            faiss = lazy_import('faiss')
+            params = None
+            searchable = len(self.metadata)
+            if filenames is not None or page_ranges:
+                allowed = chunk_positions(self.metadata).select(filenames, page_ranges)
+                if len(allowed) == 0:
+                    return []
+                if len(allowed) < len(self.metadata):
+                    params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(allowed))
+                    searchable = len(allowed)
+            
             query_embedding = self.generate_embedding(query_text)
             query_vector = np.array([query_embedding]).astype('float32')
+            if query_vector.shape[1] != self.index.d:
+                raise ValueError(
+                    f"query embedding has {query_vector.shape[1]} dimensions but the index has {self.index.d}"
+                )
+            k = min(n_results, searchable)
+            fetch_k = min(max(k * MMR_FETCH_FACTOR, MMR_MIN_CANDIDATES), searchable) if diversity > 0 else k
+            coarse = coarse_index(self.snapshot_path, self.index) if _coarse_search['dimensions'] else None
             
             # Search in FAISS
-            distances, indices = self.index.search(query_vector, min(n_results, len(self.metadata)))
-            
-            results = []
-            for i, idx in enumerate(indices[0]):
-                if idx < len(self.metadata):
-                    results.append({
-                        'text': self.metadata[idx]['text'],
-                        'metadata': self.metadata[idx]['metadata'],
-                        'distance': float(distances[0][i])
-                    })
+            with observe_seconds(SEARCH_SECONDS, self.kb_id, self.provider):
+                distances, indices = search_vectors(self.index, coarse, query_vector, fetch_k, params)
+                hits = [(int(idx), float(dist)) for idx, dist in zip(indices[0], distances[0])
+                        if 0 <= idx < len(self.metadata)]
+                if diversity > 0 and len(hits) > k:
+                    candidates = self.index.reconstruct_batch(np.array([idx for idx, _ in hits], dtype='int64'))
+                    hits = [hits[i] for i in mmr_select(query_vector, candidates, k, min(diversity, 1.0))]
             
-            return results
+            return [
+                {
+                    'text': self.metadata[idx]['text'],
+                    'metadata': self.metadata[idx]['metadata'],
+                    'distance': distance
+                }
+                for idx, distance in hits[:k]
+            ]
         except Exception as e:
             raise Exception(f"Failed to query: {str(e)}")
+
+
+class IndexBuilder:
+    """A pending write: chunks are embedded batch by batch into a private index copy.
+    
+    Besides the index itself only one embedding batch is held in memory, and
+    nothing is visible to readers until publish() swaps in the new snapshot.
+    """
+    
+    def __init__(self, service: EmbeddingsService):
+        self.service = service
+        self.index, self.metadata = service._writable_copy()
+        self.chunks_added = 0
+    
+    def remove_document(self, filename: str) -> int:
+        stale = [i for i, entry in enumerate(self.metadata) if entry['metadata']['filename'] == filename]
+        if stale:
+            # IndexFlat.remove_ids compacts the index in order, matching the metadata list
+            self.index.remove_ids(lazy_import('numpy').array(stale, dtype='int64'))
+            stale_set = set(stale)
+            self.metadata = [entry for i, entry in enumerate(self.metadata) if i not in stale_set]
+        return len(stale)
+    
+    def add_chunks(self, chunks: Iterable[Dict]) -> int:
+        """Embed and add chunks from any iterable, one batch at a time"""
+        added = 0
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) == self.service.embedding_batch_size:
+                added += self._add_batch(batch)
+                batch = []
+        if batch:
+            added += self._add_batch(batch)
+        return added
+    
+    def add_pages(self, pages: Iterable[Dict]) -> int:
+        """Chunk, embed and add pages as they are produced (e.g. by PDFProcessor.iter_pages)"""
+        return self.add_chunks(self.service.iter_chunks(pages))
+    
+    def _add_batch(self, chunks: List[Dict]) -> int:
+        vectors, metadata = self.service._embed_chunks(chunks, progress=False)
+        self.index = self.service._add_vectors(self.index, self.metadata, vectors, metadata)
+        self.chunks_added += len(chunks)
+        print(f"\r  Embedded chunks: {self.chunks_added}", end='', flush=True)
+        return len(chunks)
+    
+    def publish(self) -> None:
+        if self.chunks_added:
+            print()  # New line after progress
+        if self.index is not None:
+            self.service._publish_snapshot(self.index, self.metadata)
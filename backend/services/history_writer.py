@@ -0,0 +1,189 @@
+"""
+Write-behind batching for chat history inserts.
+
+Chat requests enqueue their history row and return immediately; a background
+thread commits queued rows in batches, flushing when a batch is full or when
+the oldest queued row has waited ``flush_interval`` seconds. This turns one
+fsync-bound SQLite commit per chat into one per batch. A batch that still
+fails after its retries is kept and tried again with the next flush; rows
+are only dropped (and counted in kb_history_rows_dropped_total) after
+``max_requeues`` such flushes or when the writer stops.
+"""
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict
+
+from database import SessionLocal, ChatHistory
+from services.metrics import HISTORY_ROWS_DROPPED
+
+_FLUSH = object()
+_STOP = object()
+
+
+class HistoryWriter:
+    def __init__(self, session_factory=SessionLocal, batch_size: int = 100, flush_interval: float = 0.5,
+                 max_retries: int = 3, max_requeues: int = 20):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_requeues = max_requeues
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread = None
+        self._cond = threading.Condition()
+        self._submitted = 0      # sequence number of the last queued row
+        self._flushed = 0        # sequence number of the last row a flush handled
+        self._done = 0           # sequence number up to which rows are written (or dropped)
+        self._pending_by_kb: Dict[int, int] = defaultdict(int)
+        # Rows of failed flushes, retried with the next one, and how often each was requeued
+        self._retry = []
+        self._requeues: Dict[int, int] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if not self.running:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Drain everything queued so far and stop the writer thread"""
+        if self.running:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        # Rows that raced with the stop request are written directly
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item not in (_FLUSH, _STOP):
+                leftovers.append(item)
+        if leftovers or self._retry:
+            self._flush(leftovers, final=True)
+
+    def submit(self, kb_id: int, user_message: str, bot_response: str, timestamp: datetime) -> None:
+        """Queue a history row; written synchronously when the writer is not running"""
+        row = {
+            'kb_id': kb_id,
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'timestamp': timestamp
+        }
+        if not self.running:
+            self._write([row])
+            return
+        with self._cond:
+            self._submitted += 1
+            self._pending_by_kb[kb_id] += 1
+            self._queue.put((self._submitted, row))
+
+    def wait_for_kb(self, kb_id: int, timeout: float = 5.0) -> bool:
+        """Block until every row queued so far for kb_id is committed (read-your-writes)"""
+        with self._cond:
+            if not self._pending_by_kb.get(kb_id):
+                return True
+            target = self._submitted
+        self._queue.put(_FLUSH)
+        with self._cond:
+            return self._cond.wait_for(lambda: self._done >= target, timeout)
+
+    def _write(self, rows) -> None:
+        db = self.session_factory()
+        try:
+            db.bulk_insert_mappings(ChatHistory, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _flush(self, batch, final: bool = False) -> None:
+        """Write requeued rows and batch; failed rows are requeued unless final or out of requeues"""
+        batch = self._retry + batch
+        self._retry = []
+        if not batch:
+            return
+        rows = [row for _, row in batch]
+        handled = batch
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._write(rows)
+                break
+            except Exception as e:
+                if attempt < self.max_retries:
+                    time.sleep(0.1 * 2 ** attempt)
+                    continue
+                for item in batch:
+                    self._requeues[item[0]] = self._requeues.get(item[0], 0) + 1
+                if not final:
+                    self._retry = [item for item in batch if self._requeues[item[0]] <= self.max_requeues]
+                retried = {seq for seq, _ in self._retry}
+                handled = [item for item in batch if item[0] not in retried]
+                if self._retry:
+                    print(f"ERROR writing {len(rows)} chat history row(s), will retry: {str(e)}")
+                if handled:
+                    print(f"ERROR dropping {len(handled)} chat history row(s) that kept failing: {str(e)}")
+                    HISTORY_ROWS_DROPPED.inc(len(handled))
+
+        with self._cond:
+            self._flushed = max(self._flushed, batch[-1][0])
+            self._done = min(seq for seq, _ in self._retry) - 1 if self._retry else self._flushed
+            for seq, row in handled:
+                self._requeues.pop(seq, None)
+                self._pending_by_kb[row['kb_id']] -= 1
+                if self._pending_by_kb[row['kb_id']] <= 0:
+                    del self._pending_by_kb[row['kb_id']]
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        batch = []
+        deadline = None
+        stopping = False
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _FLUSH
+
+            if item is _STOP:
+                stopping = True
+            elif item is not _FLUSH:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+
+            if stopping:
+                # Pick up anything queued before the stop request
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item not in (_FLUSH, _STOP):
+                        batch.append(item)
+
+            while True:
+                self._flush(batch[:self.batch_size], final=stopping)
+                batch = batch[self.batch_size:]
+                if not batch:
+                    break
+            # Failed rows are retried after another flush interval
+            deadline = time.monotonic() + self.flush_interval if self._retry else None
+
+            if stopping:
+                return
+
+
+# Process-wide writer started and drained by the app lifecycle
+history_writer = HistoryWriter()
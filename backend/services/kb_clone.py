@@ -0,0 +1,87 @@
+"""
+Clone a knowledge base's files with hardlinks.
+
+Nothing under ``data/kb_<id>`` is modified in place once written: PDFs are
+swapped in with BlobStore.link, and every index write publishes a new
+snapshot folder and replaces the CURRENT pointer. A clone can therefore
+share every file with its source through hardlinks. The first write to
+either KB replaces its own links with new files, so the copy happens on
+write and only for what changed. Blob garbage collection counts links, so
+PDFs shared with a clone stay alive while either KB uses them.
+"""
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict
+
+from services.embeddings import CURRENT_POINTER
+
+
+def _link_file(src: Path, dst: Path, stats: Dict[str, int]) -> None:
+    try:
+        os.link(src, dst)
+        stats['files_linked'] += 1
+    except OSError:
+        # Different filesystem (or no hardlink support): fall back to a copy
+        shutil.copy2(src, dst)
+        stats['files_copied'] += 1
+        stats['bytes_copied'] += dst.stat().st_size
+
+
+def _link_dir(src: Path, dst: Path, stats: Dict[str, int]) -> None:
+    dst.mkdir(parents=True, exist_ok=True)
+    for entry in src.iterdir():
+        # Staging files of an interrupted write are not part of the KB
+        if entry.name.startswith('.'):
+            continue
+        if entry.is_dir():
+            _link_dir(entry, dst / entry.name, stats)
+        else:
+            _link_file(entry, dst / entry.name, stats)
+
+
+def _link_vectors(src: Path, dst: Path, stats: Dict[str, int]) -> None:
+    """Link only the live index snapshot (or a pre-snapshot KB's index files)"""
+    dst.mkdir(parents=True, exist_ok=True)
+    try:
+        current = (src / CURRENT_POINTER).read_text().strip()
+    except FileNotFoundError:
+        current = ""
+    if current:
+        _link_dir(src / current, dst / current, stats)
+        _link_file(src / CURRENT_POINTER, dst / CURRENT_POINTER, stats)
+        return
+    for legacy in ("faiss.index", "metadata.pkl"):
+        if (src / legacy).exists():
+            _link_file(src / legacy, dst / legacy, stats)
+
+
+def clone_kb_files(source_id: int, target_id: int, base_path: str = "../data") -> Dict[str, int]:
+    """Hardlink source KB's PDFs and live index into a new kb_<target_id> folder.
+
+    The caller holds the source KB's write lock. The tree is built under a
+    temporary name and renamed into place, so the target folder either does
+    not exist or is complete.
+    """
+    source = Path(base_path) / f"kb_{source_id}"
+    target = Path(base_path) / f"kb_{target_id}"
+    staging = Path(base_path) / f".kb_{target_id}.{uuid.uuid4().hex[:8]}.clone"
+    stats = {'files_linked': 0, 'files_copied': 0, 'bytes_copied': 0}
+    try:
+        staging.mkdir(parents=True)
+        for entry in (source.iterdir() if source.exists() else []):
+            if entry.name.startswith('.'):
+                continue
+            if entry.name == "vectors" and entry.is_dir():
+                _link_vectors(entry, staging / entry.name, stats)
+            elif entry.is_dir():
+                _link_dir(entry, staging / entry.name, stats)
+            else:
+                _link_file(entry, staging / entry.name, stats)
+        shutil.rmtree(target, ignore_errors=True)  # left by a deleted KB whose id was reused
+        os.rename(staging, target)
+    except Exception as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise Exception(f"Error cloning files of KB {source_id}: {str(e)}")
+    return stats
@@ -0,0 +1,43 @@
+"""
+Deferred imports for heavy dependencies.
+
+faiss, PyMuPDF, langchain, tiktoken, boto3 and openai together add more than
+a second to worker start-up. Services import them through ``lazy_import`` at
+first use instead of at module load, and the first-load cost of each is kept
+for the start-up report (GET /api/admin/startup, import_report.py).
+"""
+import importlib
+import sys
+import threading
+import time
+from typing import Dict
+
+# Modules the API must not import at start-up
+HEAVY_MODULES = (
+    'faiss', 'fitz', 'langchain_text_splitters', 'tiktoken', 'boto3', 'botocore', 'openai', 'numpy'
+)
+
+_load_seconds: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def lazy_import(name: str):
+    """Import a module on first use and record how long the first import took"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    with _lock:
+        _load_seconds.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def lazy_load_seconds() -> Dict[str, float]:
+    """First-use import time of each module loaded through lazy_import"""
+    with _lock:
+        return dict(_load_seconds)
+
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
@@ -1,12 +1,70 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union
 import json
-import boto3
-from openai import OpenAI
+import math
+import threading
+import re
+import zlib
+from services.lazy_imports import lazy_import
+from services.call_policy import get_call_policy, latency_stats
+from services.tokens import TokenUsage, count_tokens
+from services.conversation import render_turns
+
+# Embedding widths each provider can produce besides its full width
+# (None: any width up to the maximum)
+EMBEDDING_DIMENSIONS = {
+    'bedrock': (256, 512, 1024),  # Titan Text Embeddings V2
+    'openai': None,
+    'local': None
+}
+MAX_EMBEDDING_DIMENSIONS = {'bedrock': 1024, 'openai': 1536}
+
+def validate_embedding_dimensions(provider: str, dimensions: Optional[int]) -> None:
+    """Raise ValueError when a provider cannot produce embeddings of that width"""
+    if dimensions is None:
+        return
+    allowed = EMBEDDING_DIMENSIONS.get(provider)
+    if allowed is not None and dimensions not in allowed:
+        raise ValueError(f"{provider} embeddings support {', '.join(map(str, allowed))} dimensions")
+    if provider in MAX_EMBEDDING_DIMENSIONS and dimensions > MAX_EMBEDDING_DIMENSIONS[provider]:
+        raise ValueError(f"{provider} embeddings have at most {MAX_EMBEDDING_DIMENSIONS[provider]} dimensions")
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers"""
     
+    # Label for latency statistics of remote calls
+    name = 'provider'
+    
+    def _call(self, operation: str, fn, hedge: bool = False, on_hedge=None):
+        """Run fn(timeout) under the deadline/retry/hedging policy of an operation ('chat', 'embedding')"""
+        return get_call_policy(operation).call(fn, latency_stats(self.name, operation), hedge=hedge, on_hedge=on_hedge)
+    
+    @property
+    def usage(self) -> TokenUsage:
+        """Tokens used by this provider instance's calls so far, per model"""
+        if self.__dict__.get('_usage') is None:
+            self._usage = TokenUsage()
+        return self._usage
+    
+    def _record_usage(self, model: str, input_tokens: Optional[int], output_tokens: Optional[int],
+                      input_text: Union[str, List[str]] = '', output_text: str = '', hedges: int = 0) -> None:
+        """Count a call's tokens as reported by the provider, estimating with tiktoken what it did not report.
+        
+        Each hedge request sent the same input and is billed as well; its
+        result was discarded, so its tokens are counted as estimated.
+        """
+        estimated = 0
+        if input_tokens is None:
+            texts = [input_text] if isinstance(input_text, str) else input_text
+            input_tokens = sum(count_tokens(text) for text in texts)
+            estimated += input_tokens
+        if output_tokens is None:
+            output_tokens = count_tokens(output_text) if output_text else 0
+            estimated += output_tokens
+        self.usage.add(model, int(input_tokens), int(output_tokens), estimated)
+        for _ in range(hedges):
+            self.usage.add(model, int(input_tokens), int(output_tokens), int(input_tokens) + int(output_tokens))
+    
     @abstractmethod
     def generate_chat_response(self, prompt: str) -> str:
         """Generate chat response from prompt"""
@@ -16,15 +74,84 @@ class LLMProvider(ABC):
     def generate_embedding(self, text: str) -> List[float]:
         """Generate text embedding"""
         pass
+    
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a batch of texts (one call per text by default)"""
+        return [self.generate_embedding(text) for text in texts]
+    
+    def condense_question(self, summary: str, turns: List[Dict], question: str) -> str:
+        """Rewrite a follow-up question so it can be understood without the conversation"""
+        history = "\n\n".join(part for part in (summary, render_turns(turns)) if part)
+        prompt = f"""Rewrite the follow-up question as a standalone question that can be understood without the conversation. Keep the names, documents and figures it refers to. Return only the question.
+
+Conversation:
+{history}
+
+Follow-up question: {question}
+
+Standalone question:"""
+        return self.generate_chat_response(prompt)
+    
+    def summarize_conversation(self, summary: str, turns: List[Dict], max_tokens: int) -> str:
+        """Fold turns into the running summary of a conversation"""
+        prompt = f"""Update the running summary of a conversation with the turns below. Keep facts, names, figures and open questions; drop pleasantries. Use at most {max_tokens * 3 // 4} words. Return only the summary.
+
+Current summary:
+{summary or '(none)'}
+
+New turns:
+{render_turns(turns)}
+
+Updated summary:"""
+        return self.generate_chat_response(prompt)
 
 
 class BedrockLLMProvider(LLMProvider):
     """AWS Bedrock LLM provider"""
     
-    def __init__(self, model_id: str, profile_name: str = 'default'):
+    name = 'bedrock'
+    embedding_model = "amazon.titan-embed-text-v1"
+    # Used instead when a KB asks for reduced-width embeddings
+    reduced_embedding_model = "amazon.titan-embed-text-v2:0"
+    # botocore only takes timeouts per client, so attempts use the client of
+    # the largest bucket within their remaining time
+    TIMEOUT_BUCKETS = (1, 2, 5, 10, 15, 30, 60, 120, 300)
+    
+    def __init__(self, model_id: str, profile_name: str = 'default', embedding_dimensions: int = None):
         self.model_id = model_id
-        session = boto3.Session(profile_name=profile_name)
-        self.bedrock_runtime = session.client('bedrock-runtime', region_name='us-east-1')
+        self.embedding_dimensions = embedding_dimensions
+        if embedding_dimensions:
+            self.embedding_model = self.reduced_embedding_model
+        self.session = lazy_import('boto3').Session(profile_name=profile_name)
+        self._clients: Dict[int, object] = {}
+        self._clients_lock = threading.Lock()
+    
+    def _client(self, timeout: float):
+        """bedrock-runtime client whose timeouts do not exceed an attempt's timeout"""
+        bucket = max([b for b in self.TIMEOUT_BUCKETS if b <= timeout] or [self.TIMEOUT_BUCKETS[0]])
+        with self._clients_lock:
+            if bucket not in self._clients:
+                # Retries are left to the call policy
+                config = lazy_import('botocore.config').Config(
+                    connect_timeout=min(10, bucket), read_timeout=bucket, retries={'total_max_attempts': 1}
+                )
+                self._clients[bucket] = self.session.client('bedrock-runtime', region_name='us-east-1', config=config)
+            return self._clients[bucket]
+    
+    def _invoke(self, client, model_id: str, body: str) -> Tuple[Dict, Dict]:
+        """Response body and HTTP headers (which carry the token counts) of one invocation"""
+        response = client.invoke_model(
+            modelId=model_id,
+            body=body,
+            contentType="application/json",
+            accept="application/json"
+        )
+        return json.loads(response['body'].read()), response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    
+    @staticmethod
+    def _header_tokens(headers: Dict, name: str) -> Optional[int]:
+        value = headers.get(f'x-amzn-bedrock-{name}-token-count')
+        return int(value) if value is not None else None
     
     def generate_chat_response(self, prompt: str) -> str:
         """Generate chat response using Bedrock"""
@@ -48,22 +175,28 @@ class BedrockLLMProvider(LLMProvider):
                     "max_tokens": 2000
                 })
             
-            response = self.bedrock_runtime.invoke_model(
-                modelId=self.model_id,
-                body=body,
-                contentType="application/json",
-                accept="application/json"
+            response_body, headers = self._call(
+                'chat', lambda timeout: self._invoke(self._client(timeout), self.model_id, body)
             )
             
-            response_body = json.loads(response['body'].read())
-            
             # Extract text based on model
             if 'claude-3' in self.model_id:
-                return response_body['content'][0]['text']
+                text = response_body['content'][0]['text']
             elif 'claude' in self.model_id:
-                return response_body.get('completion', '')
+                text = response_body.get('completion', '')
             else:
-                return response_body.get('results', [{}])[0].get('outputText', '')
+                text = response_body.get('results', [{}])[0].get('outputText', '')
+            
+            reported = response_body.get('usage', {})
+            input_tokens = self._header_tokens(headers, 'input')
+            output_tokens = self._header_tokens(headers, 'output')
+            self._record_usage(
+                self.model_id,
+                input_tokens if input_tokens is not None else reported.get('input_tokens'),
+                output_tokens if output_tokens is not None else reported.get('output_tokens'),
+                prompt, text
+            )
+            return text
         
         except Exception as e:
             raise Exception(f"Bedrock invocation failed: {str(e)}")
@@ -71,15 +204,21 @@ class BedrockLLMProvider(LLMProvider):
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding using AWS Bedrock Titan"""
         try:
-            body = json.dumps({"inputText": text})
-            response = self.bedrock_runtime.invoke_model(
-                modelId="amazon.titan-embed-text-v1",
-                body=body,
-                contentType="application/json",
-                accept="application/json"
+            request = {"inputText": text}
+            if self.embedding_dimensions:
+                request.update(dimensions=self.embedding_dimensions, normalize=True)
+            body = json.dumps(request)
+            hedges = []
+            response_body, headers = self._call(
+                'embedding',
+                lambda timeout: self._invoke(self._client(timeout), self.embedding_model, body),
+                hedge=True,
+                on_hedge=lambda: hedges.append(1)
             )
-            
-            response_body = json.loads(response['body'].read())
+            input_tokens = response_body.get('inputTextTokenCount')
+            if input_tokens is None:
+                input_tokens = self._header_tokens(headers, 'input')
+            self._record_usage(self.embedding_model, input_tokens, 0, text, hedges=len(hedges))
             return response_body['embedding']
         except Exception as e:
             raise Exception(f"Failed to generate embedding: {str(e)}")
@@ -88,24 +227,36 @@ class BedrockLLMProvider(LLMProvider):
 class OpenAILLMProvider(LLMProvider):
     """OpenAI LLM provider"""
     
-    def __init__(self, model_id: str, api_key: str):
+    name = 'openai'
+    
+    def __init__(self, model_id: str, api_key: str, embedding_dimensions: int = None):
         self.model_id = model_id
-        self.client = OpenAI(api_key=api_key)
+        # Retries are left to the call policy
+        self.client = lazy_import('openai').OpenAI(api_key=api_key, max_retries=0)
         self.embedding_model = "text-embedding-3-small"  # Cost-effective option
+        # text-embedding-3 models shorten their vectors server-side
+        self.embedding_options = {'dimensions': embedding_dimensions} if embedding_dimensions else {}
     
     def generate_chat_response(self, prompt: str) -> str:
         """Generate chat response using OpenAI"""
         try:
-            response = self.client.chat.completions.create(
+            response = self._call('chat', lambda timeout: self.client.chat.completions.create(
                 model=self.model_id,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=2000,
-                temperature=0.7
-            )
+                temperature=0.7,
+                timeout=timeout
+            ))
             
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            usage = getattr(response, 'usage', None)
+            self._record_usage(
+                self.model_id, getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None),
+                prompt, content or ''
+            )
+            return content
         
         except Exception as e:
             raise Exception(f"OpenAI invocation failed: {str(e)}")
@@ -113,23 +264,158 @@ class OpenAILLMProvider(LLMProvider):
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding using OpenAI"""
         try:
-            response = self.client.embeddings.create(
+            hedges = []
+            response = self._call('embedding', lambda timeout: self.client.embeddings.create(
                 model=self.embedding_model,
-                input=text
-            )
+                input=text,
+                timeout=timeout,
+                **self.embedding_options
+            ), hedge=True, on_hedge=lambda: hedges.append(1))
             
+            self._record_usage(
+                self.embedding_model, getattr(response.usage, 'prompt_tokens', None), 0, text, hedges=len(hedges)
+            )
             return response.data[0].embedding
         except Exception as e:
             raise Exception(f"Failed to generate embedding: {str(e)}")
+    
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a batch of texts in a single OpenAI request"""
+        try:
+            hedges = []
+            response = self._call('embedding', lambda timeout: self.client.embeddings.create(
+                model=self.embedding_model,
+                input=texts,
+                timeout=timeout,
+                **self.embedding_options
+            ), hedge=True, on_hedge=lambda: hedges.append(1))
+            
+            self._record_usage(
+                self.embedding_model, getattr(response.usage, 'prompt_tokens', None), 0, texts, hedges=len(hedges)
+            )
+            return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+        except Exception as e:
+            raise Exception(f"Failed to generate embeddings: {str(e)}")
+
+
+class LocalLLMProvider(LLMProvider):
+    """In-process provider that needs no network access or downloaded weights.
+    
+    Embeddings are hashed word/character n-gram features with sublinear term
+    frequency, signed hashing and L2 normalisation. Chat responses are
+    extractive: the most relevant context passages are returned verbatim.
+    """
+    
+    name = 'local'
+    embedding_model = 'local-hashed-ngrams'
+    TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+    
+    def __init__(self, model_id: str = None, dimension: int = 768, char_ngram: int = 3):
+        self.model_id = model_id or 'local-extractive'
+        self.dimension = dimension
+        self.char_ngram = char_ngram
+    
+    def _features(self, text: str) -> List[str]:
+        """Word unigrams, word bigrams and character n-grams of a text"""
+        words = self.TOKEN_PATTERN.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        n = self.char_ngram
+        for word in words:
+            padded = f"<{word}>"
+            features.extend(f"#{padded[i:i + n]}" for i in range(max(len(padded) - n + 1, 1)))
+        return features
+    
+    def _hash_rows(self, texts: List[str]):
+        """Return (row, bucket, sign) arrays for every feature of every text"""
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                rows.append(row)
+                hashes.append(zlib.crc32(feature.encode('utf-8')))
+        np = lazy_import('numpy')
+        rows = np.asarray(rows, dtype=np.int64)
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        buckets = (hashes % self.dimension).astype(np.int64)
+        signs = np.where((hashes >> np.uint64(31)) & np.uint64(1), -1.0, 1.0).astype(np.float32)
+        return rows, buckets, signs
+    
+    def embed_batch(self, texts: List[str]) -> "numpy.ndarray":
+        """Vectorised embedding of a batch of texts as a float32 matrix"""
+        np = lazy_import('numpy')
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if not texts:
+            return matrix
+        rows, buckets, signs = self._hash_rows(texts)
+        if rows.size:
+            np.add.at(matrix, (rows, buckets), signs)
+        # Sublinear tf keeps long chunks from being dominated by frequent n-grams
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+    
+    def generate_chat_response(self, prompt: str) -> str:
+        """Return the context passages that best match the question"""
+        context = prompt
+        question = ''
+        if 'Context:' in prompt:
+            context = prompt.split('Context:', 1)[1]
+        if 'User Question:' in context:
+            context, question = context.split('User Question:', 1)
+            question = question.split('\n\n', 1)[0].strip()
+        
+        passages = [p.strip() for p in context.strip().split('\n\n') if p.strip()]
+        if not passages:
+            return "No relevant context was found for this question."
+        if question:
+            vectors = self.embed_batch(passages + [question])
+            scores = vectors[:-1] @ vectors[-1]
+            passages = [passages[i] for i in (-scores).argsort()]
+        
+        top = passages[:max(1, math.ceil(len(passages) / 2))]
+        response = "Most relevant excerpts (local extractive mode):\n\n" + "\n\n".join(top)
+        self._record_usage(self.model_id, None, None, prompt, response)
+        return response
+    
+    def condense_question(self, summary: str, turns: List[Dict], question: str) -> str:
+        """Prefix the previous question so a follow-up keeps its search terms"""
+        if not turns:
+            return question
+        # One line: callers keep only the first line of a rewritten question
+        return " ".join(f"{turns[-1]['user']} {question}".split())
+    
+    def summarize_conversation(self, summary: str, turns: List[Dict], max_tokens: int) -> str:
+        """Append each folded turn's question and the first sentence of its answer"""
+        lines = [summary] if summary else []
+        for turn in turns:
+            # Skip the extractive-mode heading of local answers
+            answer = turn['assistant'].strip().split('\n\n', 1)[-1]
+            first_sentence = re.split(r'(?<=[.!?])\s', answer, maxsplit=1)[0]
+            lines.append(f"Asked: {turn['user']} Answered: {first_sentence}")
+        return "\n".join(lines)
+    
+    def generate_embedding(self, text: str) -> List[float]:
+        """Generate a hashed n-gram embedding in-process"""
+        self._record_usage(self.embedding_model, None, 0, text)
+        return self.embed_batch([text])[0].tolist()
+    
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate hashed n-gram embeddings for a batch of texts"""
+        self._record_usage(self.embedding_model, None, 0, texts)
+        return self.embed_batch(texts).tolist()
 
 
-def get_llm_provider(provider: str, model_id: str, api_key: str = None, profile_name: str = 'default') -> LLMProvider:
-    """Factory function to get the appropriate LLM provider"""
+def get_llm_provider(provider: str, model_id: str, api_key: str = None, profile_name: str = 'default',
+                     embedding_dimensions: int = None) -> LLMProvider:
+    """Factory function to get the appropriate LLM provider (embedding_dimensions None = full width)"""
     if provider == 'bedrock':
-        return BedrockLLMProvider(model_id, profile_name)
+        return BedrockLLMProvider(model_id, profile_name, embedding_dimensions)
     elif provider == 'openai':
         if not api_key:
             raise ValueError("API key is required for OpenAI provider")
-        return OpenAILLMProvider(model_id, api_key)
+        return OpenAILLMProvider(model_id, api_key, embedding_dimensions)
+    elif provider == 'local':
+        return LocalLLMProvider(model_id, dimension=embedding_dimensions or 768)
     else:
         raise ValueError(f"Unknown provider: {provider}")
@@ -0,0 +1,22 @@
+from typing import List
+from models import LocalModel
+
+class LocalClient:
+    """Local (offline) provider client for listing available models"""
+    
+    def __init__(self):
+        pass
+    
+    def list_available_models(self) -> List[LocalModel]:
+        """List models served in-process by the local provider"""
+        models = [
+            LocalModel(
+                model_id="local-extractive",
+                model_name="Local Extractive (offline, no LLM)"
+            )
+        ]
+        return models
+    
+    def get_default_model(self) -> str:
+        """Return the default model ID"""
+        return "local-extractive"
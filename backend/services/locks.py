@@ -0,0 +1,94 @@
+"""
+Cross-process locks for running the API with several workers.
+
+Locks are advisory OS file locks (flock on POSIX, msvcrt on Windows) on files
+under ``data/locks``. The OS releases them when a worker dies, so a crash never
+leaves a KB locked. Lock files live outside the KB folders so deleting a KB
+does not pull the lock file out from under a waiting worker.
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(Exception):
+    """The lock is held by another request or worker"""
+
+
+class FileLock:
+    def __init__(self, path: Path, poll_interval: float = 0.05):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self._fd: Optional[int] = None
+        # flock is per open file, so threads of one process also exclude each other;
+        # the thread lock only guards this object's own descriptor
+        self._local = threading.Lock()
+
+    def _try_lock(self, fd: int) -> bool:
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> None:
+        """Block until the lock is held; timeout=None waits forever, 0 tries once"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._local.acquire(timeout=-1 if timeout is None else timeout):
+            raise LockTimeout(f"Timed out waiting for {self.path.name}")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+            while not self._try_lock(fd):
+                if deadline is not None and time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise LockTimeout(f"Timed out waiting for {self.path.name}")
+                time.sleep(self.poll_interval)
+            self._fd = fd
+        except BaseException:
+            self._local.release()
+            raise
+
+    def is_current(self) -> bool:
+        """Whether the held descriptor is still the file at path (it was not unlinked and recreated)"""
+        try:
+            return self._fd is not None and os.fstat(self._fd).st_ino == os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+            self._local.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def kb_lock(kb_id: int, base_path: str = "../data") -> FileLock:
+    """Exclusive lock for writes to one KB's files (ingest, refresh, re-index, delete)"""
+    return FileLock(Path(base_path) / "locks" / f"kb_{kb_id}.lock")
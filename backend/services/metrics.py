@@ -0,0 +1,84 @@
+"""
+Prometheus metrics for the ingest and chat pipelines.
+
+Every stage metric is labelled with the knowledge base id and provider so a
+slow stage can be traced back to a specific KB.
+"""
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+STAGE_LABELS = ['kb_id', 'provider']
+
+# Buckets shared by the latency histograms (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+DOWNLOAD_BYTES = Counter(
+    'kb_download_bytes_total', 'Bytes downloaded for source PDFs', STAGE_LABELS
+)
+DOWNLOAD_SECONDS = Histogram(
+    'kb_download_seconds', 'Time spent downloading a source PDF', STAGE_LABELS,
+    buckets=LATENCY_BUCKETS
+)
+EXTRACT_PAGE_SECONDS = Histogram(
+    'kb_pdf_extract_page_seconds', 'Time spent extracting text from one PDF page', STAGE_LABELS,
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+CHUNK_SECONDS = Histogram(
+    'kb_chunking_seconds', 'Time spent chunking the pages of a document', STAGE_LABELS,
+    buckets=LATENCY_BUCKETS
+)
+EMBEDDING_SECONDS = Histogram(
+    'kb_embedding_call_seconds', 'Latency of one embedding provider call', STAGE_LABELS,
+    buckets=LATENCY_BUCKETS
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    'kb_embedding_batch_size', 'Number of texts sent per embedding call', STAGE_LABELS,
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+SEARCH_SECONDS = Histogram(
+    'kb_faiss_search_seconds', 'Latency of a FAISS index search', STAGE_LABELS,
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+LLM_SECONDS = Histogram(
+    'kb_llm_call_seconds', 'Latency of one chat completion call', STAGE_LABELS,
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    'kb_llm_tokens_total', 'Tokens sent to and received from the chat model', STAGE_LABELS + ['direction']
+)
+PROVIDER_CALL_EVENTS = Counter(
+    'kb_provider_call_events_total', 'Provider calls, retries, timeouts, failures and hedges',
+    ['provider', 'operation', 'event']
+)
+HISTORY_ROWS_DROPPED = Counter(
+    'kb_history_rows_dropped_total', 'Chat history rows dropped after repeated write failures'
+)
+CACHE_REQUESTS = Counter(
+    'kb_cache_requests_total', 'Cache lookups by cache name and outcome', ['cache', 'result']
+)
+
+
+def stage_labels(kb_id, provider) -> dict:
+    """Label values for a stage metric"""
+    return {'kb_id': str(kb_id), 'provider': provider or 'unknown'}
+
+
+@contextmanager
+def observe_seconds(histogram: Histogram, kb_id, provider):
+    """Time the enclosed block into a labelled histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**stage_labels(kb_id, provider)).observe(time.perf_counter() - start)
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup; hit rate is hit / (hit + miss)"""
+    CACHE_REQUESTS.labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+
+def render_metrics():
+    """Return the exposition payload and its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,57 +1,254 @@
 import os
+import time
+import hashlib
 import requests
-import fitz  # PyMuPDF
-from typing import List, Dict
+from typing import Iterator, List, Dict
 from pathlib import Path
+from services.metrics import (
+    DOWNLOAD_BYTES, DOWNLOAD_SECONDS, EXTRACT_PAGE_SECONDS, stage_labels, observe_seconds, record_cache
+)
+from services.blob_store import BlobStore
+from services.downloader import (
+    STREAM_BUFFER_SIZE, RangedDownload, RangeNotSatisfied, range_validator, supports_parallel_ranges
+)
+from services.locks import LockTimeout
+from services.text_cache import PageTextCache
+from services.lazy_imports import lazy_import
 
 class PDFProcessor:
-    def __init__(self, kb_id: int, base_path: str = "../data"):
+    # Pages between releases of PyMuPDF's resource store during extraction
+    store_shrink_interval = 50
+    
+    def __init__(self, kb_id: int, base_path: str = "../data", provider: str = None):
         self.kb_id = kb_id
+        self.provider = provider
         self.kb_path = Path(base_path) / f"kb_{kb_id}"
         self.pdf_path = self.kb_path / "pdfs"
         self.pdf_path.mkdir(parents=True, exist_ok=True)
+        self.blob_store = BlobStore(base_path)
+        self.text_cache = PageTextCache(base_path)
     
     def download_pdf(self, url: str, filename: str) -> str:
         """Download PDF from URL and save to kb folder"""
+        return self.fetch_pdf(url, filename)['file_path']
+    
+    def fetch_pdf(self, url: str, filename: str, etag: str = None, last_modified: str = None,
+                  content_hash: str = None) -> Dict:
+        """Download a PDF, skipping it when the server or content says it is unchanged.
+        
+        Sends If-None-Match / If-Modified-Since when validators are known and hashes
+        the body while streaming it into the shared blob store. Large bodies from
+        servers that accept byte ranges are fetched as parallel, resumable ranges
+        (see services/downloader.py). The KB's file is a
+        hardlink to the blob and is only repointed when the SHA-256 differs from
+        content_hash. Validators may come from another KB's copy of the same URL: a
+        304 then links the existing blob without downloading it again. Returns
+        file_path, changed, etag, last_modified and content_hash.
+        """
+        file_path = self.pdf_path / filename
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        
+        staged = self.blob_store.staging_file()
+        lock = None
         try:
-            response = requests.get(url, timeout=30, stream=True)
-            response.raise_for_status()
+            with observe_seconds(DOWNLOAD_SECONDS, self.kb_id, self.provider):
+                response = requests.get(url, timeout=30, stream=True, headers=headers)
+                
+                if response.status_code == 304:
+                    response.close()
+                    with self.blob_store.lock:
+                        reusable = file_path.exists() or self.blob_store.has(content_hash)
+                        changed = not file_path.exists()
+                        if reusable and changed:
+                            self.blob_store.link(content_hash, file_path)
+                    if reusable:
+                        record_cache('pdf_blob', True)
+                        return {
+                            'file_path': str(file_path),
+                            'changed': changed,
+                            'etag': response.headers.get('ETag', etag),
+                            'last_modified': response.headers.get('Last-Modified', last_modified),
+                            'content_hash': content_hash
+                        }
+                    # Nothing local to reuse; fetch unconditionally
+                    return self.fetch_pdf(url, filename)
+                response.raise_for_status()
+                
+                ranged, body = None, response
+                if supports_parallel_ranges(response):
+                    response.close()
+                    ranged = self._fetch_ranges(url, response)
+                    if ranged is None:
+                        # Ranges are not usable after all; stream the body in one go
+                        body = requests.get(url, timeout=30, stream=True)
+                        body.raise_for_status()
+                if ranged is not None:
+                    source, downloaded, lock = ranged
+                    new_hash = self.hash_file(source)
+                else:
+                    source = staged
+                    sha256 = hashlib.sha256()
+                    downloaded = 0
+                    with open(staged, 'wb') as f:
+                        for chunk in body.iter_content(chunk_size=STREAM_BUFFER_SIZE):
+                            f.write(chunk)
+                            sha256.update(chunk)
+                            downloaded += len(chunk)
+                    new_hash = sha256.hexdigest()
+            
+            DOWNLOAD_BYTES.labels(**stage_labels(self.kb_id, self.provider)).inc(downloaded)
             
-            file_path = self.pdf_path / filename
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            changed = not (new_hash == content_hash and file_path.exists())
+            with self.blob_store.lock:
+                record_cache('pdf_blob', self.blob_store.commit(source, new_hash))
+                if changed:
+                    self.blob_store.link(new_hash, file_path)
+            if changed:
+                if content_hash and content_hash != new_hash:
+                    # The previous version may now be unreferenced
+                    self.blob_store.gc([content_hash])
             
-            return str(file_path)
+            return {
+                'file_path': str(file_path),
+                'changed': changed,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_hash': new_hash
+            }
         except Exception as e:
             raise Exception(f"Failed to download {filename}: {str(e)}")
+        finally:
+            staged.unlink(missing_ok=True)
+            if lock is not None:
+                lock.release()
     
-    def extract_text_from_pdf(self, file_path: str) -> List[Dict[str, any]]:
-        """Extract text from PDF with page numbers using PyMuPDF"""
+    def _fetch_ranges(self, url: str, response: requests.Response):
+        """Fetch a large body as parallel ranges into the URL's resumable staging file.
+        
+        Returns (path, bytes fetched, held lock) or None when the body should be
+        streamed over a single connection instead: another worker is already
+        fetching this URL, or the server does not honour range requests.
+        """
+        self.blob_store.prune_staging()
+        dest = self.blob_store.resumable_file(url)
+        lock = self.blob_store.resumable_lock(dest)
+        try:
+            lock.acquire(timeout=0)
+        except LockTimeout:
+            return None
+        if not lock.is_current():
+            # Pruned between opening and locking; another worker may hold the new lock file
+            lock.release()
+            return None
+        download = RangedDownload(url, dest, int(response.headers['Content-Length']), range_validator(response))
+        try:
+            fetched = download.run()
+        except RangeNotSatisfied as e:
+            print(f"Range requests not honoured for {url}, using a single stream: {str(e)}")
+            download.discard()
+            lock.release()
+            return None
+        except BaseException:
+            # Keep the partial file and its state for the next attempt
+            lock.release()
+            raise
+        download.finish()
+        return dest, fetched, lock
+    
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        """SHA-256 of a file on disk"""
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+    
+    def iter_pages(self, file_path: str, content_hash: str = None) -> Iterator[Dict[str, any]]:
+        """Yield pages with text ({'page_number', 'text', 'filename'}) one at a time.
+        
+        Only the current page is held in memory. When the PDF's content hash is
+        given, pages are streamed from the page text cache if present; fresh
+        extractions are streamed into it and the entry is only kept once the
+        whole document was read.
+        """
+        filename = Path(file_path).name
+        last_page = 0
+        if content_hash:
+            cached = self.text_cache.open_pages(content_hash)
+            record_cache('page_text', cached is not None)
+            if cached is not None:
+                try:
+                    for page in cached:
+                        last_page = page['page_number']
+                        yield {**page, 'filename': filename}
+                    return
+                except (OSError, EOFError, ValueError) as e:
+                    # Corrupt entry (already dropped); extract the remaining pages instead
+                    print(f"Page text cache for {filename} is unreadable, extracting: {str(e)}")
+        
+        fitz = lazy_import('fitz')  # PyMuPDF
         try:
             doc = fitz.open(file_path)
-            pages_data = []
-            
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                text = page.get_text()
-                
-                if text.strip():  # Only include pages with text
-                    pages_data.append({
-                        'page_number': page_num + 1,
-                        'text': text,
-                        'filename': Path(file_path).name
-                    })
-            
-            doc.close()
-            return pages_data
         except Exception as e:
             raise Exception(f"Failed to extract text from {file_path}: {str(e)}")
+        
+        writer = None
+        if content_hash and last_page == 0:
+            try:
+                writer = self.text_cache.writer(content_hash)
+            except OSError as e:
+                print(f"Failed to cache page text for {filename}: {str(e)}")
+        
+        completed = False
+        try:
+            page_seconds = EXTRACT_PAGE_SECONDS.labels(**stage_labels(self.kb_id, self.provider))
+            for page_num in range(last_page, len(doc)):
+                start = time.perf_counter()
+                try:
+                    page = doc.load_page(page_num)
+                    text = page.get_text()
+                    del page
+                except Exception as e:
+                    raise Exception(f"Failed to extract text from {file_path}: {str(e)}")
+                page_seconds.observe(time.perf_counter() - start)
+                
+                if page_num % self.store_shrink_interval == 0:
+                    # Drop MuPDF's cached fonts/images so memory does not grow with page count
+                    fitz.TOOLS.store_shrink(100)
+                
+                if not text.strip():  # Only include pages with text
+                    continue
+                page_data = {'page_number': page_num + 1, 'text': text, 'filename': filename}
+                if writer is not None:
+                    try:
+                        writer.write(page_data)
+                    except OSError as e:
+                        print(f"Failed to cache page text for {filename}: {str(e)}")
+                        writer.abort()
+                        writer = None
+                yield page_data
+            completed = True
+        finally:
+            doc.close()
+            if writer is not None:
+                try:
+                    writer.commit() if completed else writer.abort()
+                except OSError as e:
+                    print(f"Failed to cache page text for {filename}: {str(e)}")
+    
+    def extract_text_from_pdf(self, file_path: str, content_hash: str = None) -> List[Dict[str, any]]:
+        """Extract text from PDF with page numbers using PyMuPDF (all pages as a list)"""
+        return list(self.iter_pages(file_path, content_hash))
     
     def get_page_count(self, file_path: str) -> int:
         """Get total page count from PDF"""
         try:
-            doc = fitz.open(file_path)
+            doc = lazy_import('fitz').open(file_path)  # PyMuPDF
             count = len(doc)
             doc.close()
             return count
@@ -0,0 +1,169 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled only when it carries ``X-Profile: 1`` or ``?profile=1``;
+all other requests pass straight through. Profiles are rendered to HTML by
+pyinstrument (a sampling profiler) and kept in a bounded on-disk ring buffer.
+Work a route hands to the threadpool through this module's run_in_threadpool
+is sampled in the worker thread and merged into the request's profile.
+"""
+import json
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from typing import List, Dict, Optional
+from starlette import concurrency
+from starlette.datastructures import Headers, QueryParams
+
+PROFILE_HEADER = 'x-profile'
+PROFILE_QUERY = 'profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+_PROFILE_ID = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]{6}-[0-9a-f]{6}$')
+# (sampling interval, worker sessions) of the request being profiled, if any
+_worker_sessions: ContextVar = ContextVar('profiling_worker_sessions', default=None)
+
+
+def _is_truthy(value: Optional[str]) -> bool:
+    return value is not None and value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def profiling_requested(scope) -> bool:
+    """Whether the request asked to be profiled"""
+    if _is_truthy(Headers(scope=scope).get(PROFILE_HEADER)):
+        return True
+    return _is_truthy(QueryParams(scope.get('query_string', b'')).get(PROFILE_QUERY))
+
+
+async def run_in_threadpool(func, *args, **kwargs):
+    """starlette's run_in_threadpool, sampling func in its worker thread when the request is profiled"""
+    profiling = _worker_sessions.get()
+    if profiling is None:
+        return await concurrency.run_in_threadpool(func, *args, **kwargs)
+    interval, sessions = profiling
+
+    def profiled():
+        from pyinstrument import Profiler
+
+        profiler = Profiler(interval=interval, async_mode='disabled')
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            sessions.append(profiler.last_session)
+
+    return await concurrency.run_in_threadpool(profiled)
+
+
+class ProfileStore:
+    """Bounded ring buffer of request profiles on disk"""
+
+    def __init__(self, base_path: str = "../data", max_profiles: int = 50):
+        self.profile_path = Path(base_path) / "profiles"
+        self.max_profiles = max_profiles
+
+    def new_id(self) -> str:
+        now = time.time()
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now))
+        return f"{stamp}-{int(now % 1 * 1_000_000):06d}-{uuid.uuid4().hex[:6]}"
+
+    def save(self, profile_id: str, html: str, info: Dict) -> None:
+        """Write a profile and evict the oldest ones beyond the buffer size"""
+        self.profile_path.mkdir(parents=True, exist_ok=True)
+        (self.profile_path / f"{profile_id}.html").write_text(html, encoding='utf-8')
+        (self.profile_path / f"{profile_id}.json").write_text(json.dumps(info), encoding='utf-8')
+
+        ids = self._ids()
+        for stale in ids[:max(len(ids) - self.max_profiles, 0)]:
+            for suffix in ('.html', '.json'):
+                (self.profile_path / f"{stale}{suffix}").unlink(missing_ok=True)
+
+    def _ids(self) -> List[str]:
+        if not self.profile_path.exists():
+            return []
+        # Ids start with a timestamp, so lexical order is chronological
+        return sorted(p.stem for p in self.profile_path.glob("*.html") if _PROFILE_ID.match(p.stem))
+
+    def list(self) -> List[Dict]:
+        """Stored profiles, newest first"""
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            info_file = self.profile_path / f"{profile_id}.json"
+            try:
+                info = json.loads(info_file.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                info = {}
+            profiles.append({'id': profile_id, **info})
+        return profiles
+
+    def get_path(self, profile_id: str) -> Optional[Path]:
+        """Path of a stored profile, or None for unknown/invalid ids"""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = self.profile_path / f"{profile_id}.html"
+        return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that samples opted-in requests with pyinstrument.
+
+    Implemented as plain ASGI (not BaseHTTPMiddleware) so the route runs in the
+    same task as the profiler. The event loop task is sampled in async mode;
+    blocking work an ``async def`` route passes to run_in_threadpool above is
+    sampled in its worker and shows up as a separate thread in the profile.
+    Sync (``def``) routes are not sampled.
+    """
+
+    def __init__(self, app, store: ProfileStore, interval: float = 0.001):
+        self.app = app
+        self.store = store
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import HTMLRenderer
+        from pyinstrument.session import Session
+
+        profile_id = self.store.new_id()
+        status = {'code': None}
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+                message.setdefault('headers', [])
+                message['headers'] = list(message['headers']) + [
+                    (PROFILE_ID_HEADER.lower().encode(), profile_id.encode())
+                ]
+            await send(message)
+
+        profiler = Profiler(interval=self.interval, async_mode='enabled')
+        sessions = []
+        token = _worker_sessions.set((self.interval, sessions))
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            _worker_sessions.reset(token)
+            duration = time.perf_counter() - start
+            try:
+                session = profiler.last_session
+                for worker in sessions:
+                    session = Session.combine(session, worker)
+                html = HTMLRenderer().render(session)
+                self.store.save(profile_id, html, {
+                    'method': scope.get('method'),
+                    'path': scope.get('path'),
+                    'status': status['code'],
+                    'duration_ms': round(duration * 1000, 1),
+                    'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+                })
+            except Exception as e:
+                print(f"Failed to store profile {profile_id}: {str(e)}")
@@ -0,0 +1,137 @@
+"""
+In-process chat history retention.
+
+A background thread periodically deletes expired ``ChatHistory`` rows in small
+batches on the (kb_id, timestamp) index. Each batch is its own short
+transaction and every run is time-boxed, so the SQLite write lock is only
+held briefly and chat inserts keep flowing while old history is removed.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from database import SessionLocal, KnowledgeBase
+from services.locks import FileLock, LockTimeout
+
+_DELETE_BATCH = text(
+    "DELETE FROM chat_history WHERE id IN ("
+    "SELECT id FROM chat_history WHERE kb_id = :kb_id AND timestamp < :cutoff LIMIT :batch_size)"
+)
+
+
+class HistoryRetention:
+    def __init__(self, session_factory=SessionLocal, default_days: int = 7, interval: float = 3600,
+                 batch_size: int = 500, max_run_seconds: float = 10.0, pause: float = 0.05,
+                 vacuum_every: int = 24, vacuum_pages: int = 1000, lock_path: Optional[Path] = None):
+        self.session_factory = session_factory
+        self.default_days = default_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_run_seconds = max_run_seconds
+        self.pause = pause                # sleep between batches so writers can take the lock
+        self.vacuum_every = vacuum_every  # runs between incremental vacuums
+        self.vacuum_pages = vacuum_pages
+        self._runs = 0
+        self._deleted_since_vacuum = 0
+        # A pass cut short by its time box resumes at this KB, so later KBs are reached too
+        self._resume_kb_id = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._run_lock = threading.Lock()
+        # With several API workers only the one holding this lock runs a pass
+        self._worker_lock = FileLock(lock_path) if lock_path else None
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="history-retention", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 15.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                result = self.run_once()
+                if result['deleted']:
+                    print(f"[{datetime.now()}] History retention deleted {result['deleted']} row(s)")
+            except Exception as e:
+                print(f"[{datetime.now()}] History retention error: {str(e)}")
+
+    def run_once(self, max_run_seconds: float = None) -> Dict:
+        """Delete expired rows until done or the time box is used up"""
+        if self._worker_lock is None:
+            return self._run(max_run_seconds)
+        try:
+            self._worker_lock.acquire(timeout=0)
+        except LockTimeout:
+            return {'deleted': 0, 'complete': False}  # another worker is running a pass
+        try:
+            return self._run(max_run_seconds)
+        finally:
+            self._worker_lock.release()
+
+    def _run(self, max_run_seconds: float = None) -> Dict:
+        with self._run_lock:
+            budget = self.max_run_seconds if max_run_seconds is None else max_run_seconds
+            deadline = time.monotonic() + budget
+            now = datetime.now(timezone.utc)
+            deleted, complete = 0, True
+
+            db = self.session_factory()
+            try:
+                retention = db.query(KnowledgeBase.id, KnowledgeBase.history_retention_days) \
+                    .order_by(KnowledgeBase.id).all()
+                db.rollback()  # end the read transaction before deleting
+                retention = [kb for kb in retention if kb[0] >= self._resume_kb_id] + \
+                    [kb for kb in retention if kb[0] < self._resume_kb_id]
+
+                for kb_id, days in retention:
+                    cutoff = now - timedelta(days=days or self.default_days)
+                    while True:
+                        if time.monotonic() >= deadline or self._stop.is_set():
+                            complete = False
+                            break
+                        result = db.execute(_DELETE_BATCH, {
+                            'kb_id': kb_id,
+                            # Stored format of SQLAlchemy's SQLite DateTime
+                            'cutoff': cutoff.replace(tzinfo=None).strftime('%Y-%m-%d %H:%M:%S.%f'),
+                            'batch_size': self.batch_size
+                        })
+                        db.commit()
+                        deleted += result.rowcount
+                        if result.rowcount < self.batch_size:
+                            break
+                        time.sleep(self.pause)
+                    if not complete:
+                        self._resume_kb_id = kb_id
+                        break
+                if complete:
+                    self._resume_kb_id = 0
+
+                self._runs += 1
+                self._deleted_since_vacuum += deleted
+                if self._deleted_since_vacuum and self._runs % self.vacuum_every == 0:
+                    self._incremental_vacuum(db)
+                    self._deleted_since_vacuum = 0
+            finally:
+                db.close()
+
+            return {'deleted': deleted, 'complete': complete}
+
+    def _incremental_vacuum(self, db) -> None:
+        """Return a bounded number of free pages to the OS (only in auto_vacuum=INCREMENTAL databases)"""
+        if db.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+            db.commit()
+            # SQLite frees one page per step of this statement, and pysqlite's execute
+            # steps it once even with fetchall(); executescript runs it to completion
+            connection = db.connection().connection
+            connection.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});")
+            db.commit()
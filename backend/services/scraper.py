@@ -1,9 +1,20 @@
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
-from typing import List
+from typing import List, Dict, Iterable
 from models import PDFInfo
 
+# Size probing limits for scan_url_for_pdfs
+PROBE_MAX_WORKERS = 32      # concurrent HEAD requests overall
+PROBE_PER_HOST = 8          # concurrent HEAD requests per host
+PROBE_TIMEOUT = 10          # seconds per HEAD request
+PROBE_DEADLINE = 20         # seconds for all probes of one scan
+
 def format_size(bytes_size: int) -> str:
     """Convert bytes to human-readable format"""
     for unit in ['B', 'KB', 'MB', 'GB']:
@@ -12,10 +23,11 @@ def format_size(bytes_size: int) -> str:
         bytes_size /= 1024.0
     return f"{bytes_size:.2f} TB"
 
-def get_pdf_size(url: str) -> str:
+def get_pdf_size(url: str, session: requests.Session = None, timeout: float = PROBE_TIMEOUT) -> str:
     """Get PDF file size using HEAD request"""
     try:
-        response = requests.head(url, timeout=10, allow_redirects=True)
+        http = session or requests
+        response = http.head(url, timeout=timeout, allow_redirects=True)
         if 'content-length' in response.headers:
             size_bytes = int(response.headers['content-length'])
             return format_size(size_bytes)
@@ -23,6 +35,54 @@ def get_pdf_size(url: str) -> str:
     except Exception as e:
         return "Unknown"
 
+def _pooled_session(pool_size: int) -> requests.Session:
+    """Session whose connection pool can serve pool_size concurrent requests per host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def probe_pdf_sizes(urls: Iterable[str], deadline: float = PROBE_DEADLINE,
+                    max_workers: int = PROBE_MAX_WORKERS, per_host: int = PROBE_PER_HOST) -> Dict[str, str]:
+    """Probe PDF sizes concurrently over a pooled session.
+    
+    Probes are capped per host and share a global deadline; any probe that has
+    not finished by then is reported as "Unknown".
+    """
+    urls = list(dict.fromkeys(urls))
+    sizes = {url: "Unknown" for url in urls}
+    if not urls:
+        return sizes
+    
+    end = time.monotonic() + deadline
+    host_slots = defaultdict(lambda: threading.Semaphore(per_host))
+    for url in urls:
+        host_slots[urlparse(url).netloc]
+    session = _pooled_session(per_host)
+    
+    def probe(url: str) -> str:
+        with host_slots[urlparse(url).netloc]:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return "Unknown"
+            return get_pdf_size(url, session, timeout=min(PROBE_TIMEOUT, remaining))
+    
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    futures = {executor.submit(probe, url): url for url in urls}
+    try:
+        for future in as_completed(futures, timeout=max(end - time.monotonic(), 0)):
+            sizes[futures[future]] = future.result()
+    except FuturesTimeoutError:
+        pending = sum(1 for future in futures if not future.done())
+        print(f"Size probing deadline reached; {pending} PDF(s) reported as Unknown")
+    finally:
+        # Don't wait for stragglers; their results are no longer needed
+        executor.shutdown(wait=False, cancel_futures=True)
+        session.close()
+    
+    return sizes
+
 def scan_url_for_pdfs(url: str) -> List[PDFInfo]:
     """Scan a webpage and extract all PDF download links"""
     try:
@@ -49,15 +109,16 @@ def scan_url_for_pdfs(url: str) -> List[PDFInfo]:
                 # Extract filename
                 filename = full_url.split('/')[-1]
                 
-                # Get file size
-                size = get_pdf_size(full_url)
-                
                 pdf_links.append(PDFInfo(
                     filename=filename,
-                    url=full_url,
-                    size=size
+                    url=full_url
                 ))
         
+        # Get file sizes concurrently
+        sizes = probe_pdf_sizes(pdf.url for pdf in pdf_links)
+        for pdf in pdf_links:
+            pdf.size = sizes[pdf.url]
+        
         return pdf_links
     
     except requests.RequestException as e:
@@ -0,0 +1,116 @@
+"""
+Cache of extracted page text keyed by PDF content hash and extractor version.
+
+Entries are gzip-compressed JSON Lines side files under ``data/text_cache``
+(one page per line), so any build, refresh or re-chunk of a PDF that was
+already extracted skips PyMuPDF, and entries are written and read one page
+at a time however large the PDF is.
+"""
+import gzip
+import json
+import os
+import uuid
+from pathlib import Path
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional
+from services.lazy_imports import lazy_import
+
+ENTRY_SUFFIX = ".jsonl.gz"
+
+
+@lru_cache(maxsize=1)
+def extractor_version() -> str:
+    """PyMuPDF version plus a suffix to bump whenever extraction output changes"""
+    return f"pymupdf{lazy_import('fitz').VersionBind}-v2"
+
+
+class PageTextCacheWriter:
+    """Streams pages into a temporary file that only becomes the entry on commit"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}")
+        self._file = gzip.open(self.tmp, 'wt', encoding='utf-8')
+
+    def write(self, page: Dict) -> None:
+        self._file.write(json.dumps({'page_number': page['page_number'], 'text': page['text']}))
+        self._file.write('\n')
+
+    def commit(self) -> None:
+        self._file.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+class PageTextCache:
+    def __init__(self, base_path: str = "../data"):
+        self.root = Path(base_path) / "text_cache"
+
+    def _entry_path(self, content_hash: str, version: str = None) -> Path:
+        version = version or extractor_version()
+        return self.root / content_hash[:2] / f"{content_hash}.{version}{ENTRY_SUFFIX}"
+
+    def open_pages(self, content_hash: str) -> Optional[Iterator[Dict]]:
+        """Iterator over cached pages ({'page_number', 'text'}) for a PDF, or None"""
+        path = self._entry_path(content_hash)
+        try:
+            f = gzip.open(path, 'rt', encoding='utf-8')
+        except FileNotFoundError:
+            return None
+
+        def pages() -> Iterator[Dict]:
+            with f:
+                try:
+                    for line in f:
+                        yield json.loads(line)
+                except (OSError, EOFError, ValueError):
+                    # Corrupt entry; drop it so the next read re-extracts
+                    path.unlink(missing_ok=True)
+                    raise
+        return pages()
+
+    def get(self, content_hash: str) -> Optional[List[Dict]]:
+        """Cached pages for a PDF as a list, or None"""
+        pages = self.open_pages(content_hash)
+        if pages is None:
+            return None
+        try:
+            return list(pages)
+        except (OSError, EOFError, ValueError):
+            return None
+
+    def writer(self, content_hash: str) -> PageTextCacheWriter:
+        return PageTextCacheWriter(self._entry_path(content_hash))
+
+    def put(self, content_hash: str, pages: Iterable[Dict]) -> None:
+        writer = self.writer(content_hash)
+        try:
+            for page in pages:
+                writer.write(page)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+
+    def prune(self, live_hashes: Iterable[str]) -> Dict[str, int]:
+        """Remove entries for PDFs no document uses and entries from older extractor versions"""
+        live = set(h for h in live_hashes if h)
+        removed, kept, freed = 0, 0, 0
+        current_version = extractor_version()
+        # Also matches *.json.gz entries written before the JSON Lines format
+        for path in self.root.glob("??/*.json*.gz"):
+            content_hash, _, rest = path.name.partition('.')
+            if content_hash in live and rest == f"{current_version}{ENTRY_SUFFIX}":
+                kept += 1
+                continue
+            try:
+                freed += path.stat().st_size
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return {'removed': removed, 'kept': kept, 'bytes_freed': freed}
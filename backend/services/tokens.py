@@ -0,0 +1,73 @@
+"""
+Token counting shared by chunking and usage estimates.
+"""
+import threading
+from typing import Dict
+
+from services.lazy_imports import lazy_import
+
+_ENCODING_UNAVAILABLE = object()
+_encoding = None
+
+def _get_encoding():
+    """Load the cl100k_base encoding once; None when it cannot be fetched (e.g. air-gapped hosts)"""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = lazy_import('tiktoken').get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken encoding unavailable, approximating token counts: {str(e)}")
+            _encoding = _ENCODING_UNAVAILABLE
+    return None if _encoding is _ENCODING_UNAVAILABLE else _encoding
+
+def count_tokens(text: str) -> int:
+    """Count tokens using tiktoken (approximated when the encoding is unavailable)"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text))
+
+def truncate_tokens(text: str, max_tokens: int, keep: str = 'start') -> str:
+    """Cut text to at most max_tokens, keeping its 'start' or its 'end'"""
+    encoding = _get_encoding()
+    if encoding is None:
+        limit = max_tokens * 4
+        if len(text) <= limit:
+            return text
+        return text[:limit] if keep == 'start' else text[-limit:]
+    ids = encoding.encode(text)
+    if len(ids) <= max_tokens:
+        return text
+    return encoding.decode(ids[:max_tokens] if keep == 'start' else ids[-max_tokens:])
+
+# Counters kept per model by TokenUsage and per KB/day/stage/model by services/usage.py
+FIELDS = ('requests', 'input_tokens', 'output_tokens', 'estimated_tokens')
+
+class TokenUsage:
+    """Token counts of the calls made through one provider instance, per model"""
+
+    def __init__(self):
+        self.by_model: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, model: str, input_tokens: int, output_tokens: int = 0, estimated_tokens: int = 0) -> None:
+        """Count one call; estimated_tokens is the part of the tokens that was not provider-reported"""
+        with self._lock:
+            counts = self.by_model.setdefault(model, dict.fromkeys(FIELDS, 0))
+            counts['requests'] += 1
+            counts['input_tokens'] += input_tokens
+            counts['output_tokens'] += output_tokens
+            counts['estimated_tokens'] += estimated_tokens
+
+    def per_model(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {model: dict(counts) for model, counts in self.by_model.items()}
+
+    def totals(self) -> Dict[str, int]:
+        with self._lock:
+            return {field: sum(counts[field] for counts in self.by_model.values()) for field in FIELDS}
+
+    @property
+    def total_tokens(self) -> int:
+        totals = self.totals()
+        return totals['input_tokens'] + totals['output_tokens']
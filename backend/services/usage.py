@@ -0,0 +1,133 @@
+"""
+Token usage accounting per knowledge base, day, stage and model.
+
+Each LLMProvider counts the tokens of its calls in a ``TokenUsage`` (see
+services/tokens.py). The counts come from the API response when the provider
+reports them, and from a tiktoken estimate otherwise. Callers hand those
+counts to ``usage_recorder``. It sums them in memory and, every few seconds,
+adds the sums to the ``token_usage_daily`` row for each KB, UTC day, stage
+and model. A chat
+therefore adds no SQLite commit of its own. The additions are upserts, so
+several workers can write to the same rows.
+"""
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.dialects.sqlite import insert
+
+from database import SessionLocal, TokenUsageDaily
+from services.tokens import FIELDS, TokenUsage
+
+STAGES = ('chat', 'query', 'ingest')
+
+
+def _price(pricing: Dict, model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """Cost in USD from per-million-token prices, or None when the model has no price"""
+    prices = pricing.get(model)
+    if not prices:
+        return None
+    return round(
+        (input_tokens * float(prices.get('input', 0)) + output_tokens * float(prices.get('output', 0))) / 1e6, 6
+    )
+
+
+def usage_rows(rows, pricing: Dict) -> Dict:
+    """Shape token_usage_daily rows for the usage endpoints, with cost where priced"""
+    days = []
+    totals = dict.fromkeys(FIELDS, 0)
+    cost_total = 0.0
+    unpriced = set()
+    for row in rows:
+        cost = _price(pricing, row.model, row.input_tokens, row.output_tokens)
+        if cost is None:
+            unpriced.add(row.model)
+        else:
+            cost_total += cost
+        days.append({
+            'day': row.day, 'stage': row.stage, 'model': row.model,
+            **{field: getattr(row, field) for field in FIELDS},
+            'cost_usd': cost
+        })
+        for field in FIELDS:
+            totals[field] += getattr(row, field)
+    return {
+        'days': days,
+        'totals': {**totals, 'cost_usd': round(cost_total, 6)},
+        'unpriced_models': sorted(unpriced)
+    }
+
+
+class UsageRecorder:
+    def __init__(self, session_factory=SessionLocal, flush_interval: float = 5.0):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[int, str, str, str], Dict[str, int]] = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="usage-recorder", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the flush thread and write what is still pending"""
+        if self.running:
+            self._stop.set()
+            self._thread.join(timeout)
+        self.flush()
+
+    def record(self, kb_id: int, stage: str, usage: TokenUsage) -> None:
+        """Add a provider's counts to the KB's totals for today (UTC)"""
+        day = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        by_model = usage.per_model()
+        if not by_model:
+            return
+        with self._lock:
+            for model, counts in by_model.items():
+                pending = self._pending[(kb_id, day, stage, model)]
+                for field in FIELDS:
+                    pending[field] += counts[field]
+        if not self.running:
+            self.flush()
+
+    def flush(self) -> None:
+        """Upsert everything pending; on failure the counts are kept for the next flush"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+        if not pending:
+            return
+        db = self.session_factory()
+        try:
+            for (kb_id, day, stage, model), counts in pending.items():
+                statement = insert(TokenUsageDaily).values(kb_id=kb_id, day=day, stage=stage, model=model, **counts)
+                db.execute(statement.on_conflict_do_update(
+                    index_elements=['kb_id', 'day', 'stage', 'model'],
+                    set_={field: getattr(TokenUsageDaily, field) + statement.excluded[field] for field in FIELDS}
+                ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"ERROR writing token usage, will retry: {str(e)}")
+            with self._lock:
+                for key, counts in pending.items():
+                    for field in FIELDS:
+                        self._pending[key][field] += counts[field]
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+# Process-wide recorder started and flushed by the app lifecycle
+usage_recorder = UsageRecorder()
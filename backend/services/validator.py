@@ -0,0 +1,104 @@
+"""
+Concurrent PDF URL validation with a short-lived result cache.
+"""
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Tuple
+from urllib.parse import urlparse
+import httpx
+from services.metrics import record_cache
+
+VALIDATE_TIMEOUT = 10       # seconds per HEAD request
+VALIDATE_CONCURRENCY = 32   # concurrent HEAD requests overall
+VALIDATE_PER_HOST = 8       # concurrent HEAD requests per host
+CACHE_TTL = 300             # seconds a validation result is reused
+CACHE_MAX_ENTRIES = 10000
+
+# url -> (expires_at, status, reason)
+_cache: Dict[str, Tuple[float, str, str]] = {}
+
+# Transient failures are not cached so a retry can succeed
+_UNCACHED_REASONS = {'Timeout', 'Connection Error'}
+
+
+def _status_for(status_code: int) -> Tuple[str, str]:
+    if status_code == 200:
+        return 'available', 'OK'
+    if status_code == 404:
+        return 'unavailable', '404 Not Found'
+    if status_code == 403:
+        return 'unavailable', '403 Forbidden'
+    return 'unavailable', f'HTTP {status_code}'
+
+
+def _cached(url: str):
+    entry = _cache.get(url)
+    if entry is None or entry[0] < time.monotonic():
+        _cache.pop(url, None)
+        record_cache('pdf_validation', False)
+        return None
+    record_cache('pdf_validation', True)
+    return entry[1], entry[2]
+
+
+async def _check(client: httpx.AsyncClient, url: str, host_limits: Dict[str, asyncio.Semaphore]) -> Tuple[str, str]:
+    cached = _cached(url)
+    if cached is not None:
+        return cached
+
+    try:
+        async with host_limits[urlparse(url).netloc]:
+            response = await client.head(url)
+        status, reason = _status_for(response.status_code)
+    except httpx.TimeoutException:
+        status, reason = 'unavailable', 'Timeout'
+    except httpx.ConnectError:
+        status, reason = 'unavailable', 'Connection Error'
+    except Exception as e:
+        status, reason = 'unavailable', str(e)[:50]
+
+    if reason not in _UNCACHED_REASONS:
+        if len(_cache) >= CACHE_MAX_ENTRIES:
+            now = time.monotonic()
+            for stale in [u for u, entry in _cache.items() if entry[0] < now]:
+                del _cache[stale]
+        _cache[url] = (time.monotonic() + CACHE_TTL, status, reason)
+    return status, reason
+
+
+async def _validate_indexed(urls: List[Dict]) -> AsyncIterator[Tuple[int, Dict]]:
+    host_limits = {urlparse(u.get('url') or '').netloc: asyncio.Semaphore(VALIDATE_PER_HOST) for u in urls}
+    global_limit = asyncio.Semaphore(VALIDATE_CONCURRENCY)
+
+    async with httpx.AsyncClient(
+        timeout=VALIDATE_TIMEOUT,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=VALIDATE_CONCURRENCY, max_keepalive_connections=VALIDATE_CONCURRENCY)
+    ) as client:
+        async def validate(index: int, url_info: Dict) -> Tuple[int, Dict]:
+            url = url_info.get('url')
+            async with global_limit:
+                status, reason = await _check(client, url, host_limits)
+            return index, {
+                'url': url,
+                'filename': url_info.get('filename'),
+                'status': status,
+                'reason': reason
+            }
+
+        for result in asyncio.as_completed([validate(i, u) for i, u in enumerate(urls)]):
+            yield await result
+
+
+async def validate_pdfs_stream(urls: List[Dict]) -> AsyncIterator[Dict]:
+    """Validate PDF URLs concurrently, yielding each result as soon as it is known"""
+    async for _, result in _validate_indexed(urls):
+        yield result
+
+
+async def validate_pdfs(urls: List[Dict]) -> List[Dict]:
+    """Validate PDF URLs concurrently, returning results in request order"""
+    results = [None] * len(urls)
+    async for index, result in _validate_indexed(urls):
+        results[index] = result
+    return results
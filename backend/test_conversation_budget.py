@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Check that long conversations keep a constant prompt size.
+
+Builds a small knowledge base with the local (offline) provider and holds a
+conversation of --turns follow-up questions through ChatService, carrying a
+ConversationMemory from turn to turn as the chat endpoint does. Every turn's
+conversation section must fit the token budget, and the prompt size reported
+by the provider must stop growing once older turns are being summarized. The
+size an unbounded transcript would have reached is printed for comparison.
+
+Usage:
+    python test_conversation_budget.py [--turns 60] [--context-tokens 600] [--summary-tokens 150]
+"""
+import argparse
+import random
+import tempfile
+
+from services.chat import ChatService
+from services.conversation import ConversationMemory, render_turns
+from services.embeddings import EmbeddingsService
+from services.tokens import count_tokens
+
+TOPICS = ['inflation', 'unemployment', 'interest rates', 'housing', 'wages', 'exports', 'energy prices', 'credit']
+# Labels and separators of the conversation section around the budgeted text
+SECTION_OVERHEAD = 32
+
+
+def make_pages(seed: int = 3):
+    rng = random.Random(seed)
+    pages = []
+    for number, topic in enumerate(TOPICS, start=1):
+        sentences = [
+            f"{topic.capitalize()} rose {rng.randint(1, 9)}.{rng.randint(0, 9)} percent in quarter {q}."
+            for q in range(1, 5)
+        ]
+        sentences.append(f"Analysts expect {topic} to {rng.choice(['ease', 'stabilise', 'climb'])} next year.")
+        pages.append({'filename': 'outlook.pdf', 'page_number': number, 'text': " ".join(sentences * 3)})
+    return pages
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--context-tokens", type=int, default=600)
+    parser.add_argument("--summary-tokens", type=int, default=150)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as base:
+        builder = EmbeddingsService(1, 'local', base_path=base).builder()
+        builder.add_pages(make_pages())
+        builder.publish()
+
+        memory = ConversationMemory(context_tokens=args.context_tokens, summary_tokens=args.summary_tokens)
+        transcript = []
+        prompts, sections = [], []
+        for turn in range(args.turns):
+            topic = TOPICS[turn % len(TOPICS)]
+            question = f"What happened to {topic}?" if turn % 2 == 0 else "And what do analysts expect for it?"
+            # A fresh service per turn, like the chat endpoint
+            chat_service = ChatService(1, 'local-extractive', 'local')
+            chat_service.embeddings_service = EmbeddingsService(1, 'local', base_path=base)
+            sections.append(count_tokens(memory.render()))
+            result = chat_service.chat(question, n_results=3, memory=memory)
+            prompts.append(result['usage']['prompt_tokens'])
+            transcript.append({'user': question, 'assistant': result['response']})
+
+    unbounded = count_tokens(render_turns(transcript))
+    third = max(1, args.turns // 3)
+    middle, last = prompts[third:2 * third], prompts[2 * third:]
+    print(f"Turns: {args.turns}, budget {args.context_tokens} tokens ({memory.summary_tokens} for the summary)")
+    print(f"Conversation section: max {max(sections)} tokens; full transcript would be {unbounded} tokens")
+    print(f"Prompt tokens: first {prompts[0]}, max middle third {max(middle)}, max last third {max(last)}")
+    print(f"Summary now {count_tokens(memory.summary)} tokens, {len(memory.turns)} recent turns kept")
+
+    failed = False
+    if max(sections) > args.context_tokens + SECTION_OVERHEAD:
+        print("✗ Conversation section exceeded its token budget")
+        failed = True
+    # Retrieved context varies by question; the conversation part must not keep growing
+    if max(last) > max(middle) * 1.1:
+        print("✗ Prompt size kept growing with the conversation")
+        failed = True
+    if not memory.summary:
+        print("✗ Older turns were never summarized")
+        failed = True
+    if failed:
+        return 1
+    print("✓ Prompt size stays bounded as the conversation grows")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
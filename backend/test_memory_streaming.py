@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Check that building an index from a very large PDF keeps memory bounded.
+
+Generates a synthetic text-heavy PDF, then ingests it in a fresh interpreter
+with the local (offline) embedding provider and asserts that peak RSS grew by
+less than --ceiling-mb beyond what the finished index and chunk metadata
+occupy. With --mode list the old all-in-memory path is measured instead, for
+comparison.
+
+Usage:
+    python test_memory_streaming.py [--pages 3000] [--ceiling-mb 64] [--mode streaming|list]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+CHILD = r"""
+import json, resource, sys
+sys.path.insert(0, {backend!r})
+from services.pdf_processor import PDFProcessor
+from services.embeddings import EmbeddingsService
+
+def peak_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+base, small, large, mode = {base!r}, {small!r}, {large!r}, {mode!r}
+processor = PDFProcessor(1, base_path=base, provider='local')
+
+# Warm up imports, allocators and the splitter on a small PDF first
+warm = EmbeddingsService(2, 'local', base_path=base)
+builder = warm.builder()
+builder.add_pages(processor.iter_pages(small))
+baseline = peak_mb()
+
+service = EmbeddingsService(1, 'local', base_path=base)
+if mode == 'streaming':
+    builder = service.builder()
+    builder.add_pages(processor.iter_pages(large))
+    builder.publish()
+else:
+    pages = processor.extract_text_from_pdf(large)
+    chunks = service.chunk_text(pages)
+    service.store_chunks(chunks)
+    del pages, chunks
+
+index = service.index
+retained = (index.ntotal * index.d * 4 + sum(len(e['text']) for e in service.metadata) * 2) / (1024 * 1024)
+print(json.dumps({{'baseline_mb': baseline, 'peak_mb': peak_mb(), 'retained_mb': retained, 'chunks': index.ntotal}}))
+"""
+
+
+def make_pdf(path: Path, pages: int) -> None:
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    line = "Quarterly revenue, operating costs and regional growth figures for the period under review. "
+    for number in range(pages):
+        page = doc.new_page()
+        text = "\n".join(f"{number}.{row} {line}" for row in range(40))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=6)
+    doc.save(str(path), garbage=3, deflate=True)
+    doc.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=3000)
+    parser.add_argument("--ceiling-mb", type=float, default=64.0,
+                        help="allowed peak RSS growth beyond the finished index and metadata")
+    parser.add_argument("--mode", choices=("streaming", "list"), default="streaming")
+    args = parser.parse_args()
+
+    try:
+        import resource  # noqa: F401 (POSIX only)
+    except ImportError:
+        print("SKIPPED: peak RSS measurement needs the POSIX resource module")
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        print(f"Generating {args.pages}-page PDF...")
+        make_pdf(tmp / "large.pdf", args.pages)
+        make_pdf(tmp / "small.pdf", 20)
+
+        code = CHILD.format(
+            backend=str(Path(__file__).resolve().parent),
+            base=str(tmp / "data"), small=str(tmp / "small.pdf"), large=str(tmp / "large.pdf"), mode=args.mode
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if result.returncode != 0:
+            print(result.stderr)
+            print("✗ FAILED: ingestion raised an error")
+            return 1
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+
+    growth = stats['peak_mb'] - stats['baseline_mb']
+    transient = growth - stats['retained_mb']
+    print(f"  chunks:            {stats['chunks']}")
+    print(f"  peak RSS growth:   {growth:8.1f} MB")
+    print(f"  index + metadata:  {stats['retained_mb']:8.1f} MB")
+    print(f"  transient memory:  {transient:8.1f} MB (ceiling {args.ceiling_mb:.0f} MB)")
+
+    if transient > args.ceiling_mb:
+        print(f"✗ FAILED: {args.mode} ingestion used more transient memory than allowed")
+        return 1
+    print(f"✓ SUCCESS: {args.mode} ingestion stayed under the memory ceiling")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
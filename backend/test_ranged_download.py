@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Check parallel ranged downloads against a local server that throttles each connection.
+
+Serves a generated file from 127.0.0.1, then downloads it through
+PDFProcessor.fetch_pdf three ways and verifies the stored blob each time:
+
+  * single stream (server without Accept-Ranges)
+  * parallel ranges (server with Accept-Ranges), which must be faster
+  * parallel ranges interrupted half way, then resumed without refetching
+    the finished segments
+
+Usage:
+    python test_ranged_download.py [--size-mb 24] [--rate-mb 8]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from services import downloader
+from services.pdf_processor import PDFProcessor
+
+RANGE = re.compile(r"bytes=(\d+)-(\d+)")
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    payload = b""
+    rate = 8 * 1024 * 1024
+    ranges = True
+    fail_after = None  # abort range responses after this many bytes served in total
+    served = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body, status = self.payload, 200
+        match = RANGE.match(self.headers.get('Range', ''))
+        if self.ranges and match:
+            start, end = int(match.group(1)), int(match.group(2))
+            body, status = self.payload[start:end + 1], 206
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        if self.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        block = 64 * 1024
+        for offset in range(0, len(body), block):
+            if status == 206 and self.fail_after is not None:
+                with self.lock:
+                    ThrottledHandler.served += block
+                    if ThrottledHandler.served > self.fail_after:
+                        self.connection.close()
+                        return
+            try:
+                self.wfile.write(body[offset:offset + block])
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            time.sleep(block / self.rate)
+
+
+def fetch(base: Path, url: str):
+    processor = PDFProcessor(1, base_path=str(base))
+    start = time.perf_counter()
+    result = processor.fetch_pdf(url, "large.pdf")
+    return result, time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=24)
+    parser.add_argument("--rate-mb", type=float, default=8.0, help="per-connection throttle in MB/s")
+    args = parser.parse_args()
+
+    ThrottledHandler.payload = os.urandom(args.size_mb * 1024 * 1024)
+    ThrottledHandler.rate = args.rate_mb * 1024 * 1024
+    expected = hashlib.sha256(ThrottledHandler.payload).hexdigest()
+    # Use ranges for the test file and keep segments small enough to interrupt
+    downloader.RANGE_MIN_SIZE = 4 * 1024 * 1024
+    downloader.RANGE_SEGMENT_SIZE = 2 * 1024 * 1024
+    downloader.SEGMENT_RETRIES = 1
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottledHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/large.pdf"
+    status = 0
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            ThrottledHandler.ranges = False
+            result, single = fetch(Path(tmp) / "single", url)
+            ok = result['content_hash'] == expected
+            print(f"  single stream:   {single:6.2f} s {'✓' if ok else '✗ hash mismatch'}")
+            status |= not ok
+
+            ThrottledHandler.ranges = True
+            result, ranged = fetch(Path(tmp) / "ranged", url)
+            ok = result['content_hash'] == expected and ranged < single
+            print(f"  parallel ranges: {ranged:6.2f} s {'✓' if ok else '✗ hash mismatch or not faster'}")
+            status |= not ok
+
+            base = Path(tmp) / "resume"
+            ThrottledHandler.fail_after = len(ThrottledHandler.payload) // 2
+            try:
+                fetch(base, url)
+                print("  interrupted:     ✗ download did not fail")
+                status = 1
+            except Exception:
+                states = list((base / "blobs" / "tmp").glob("*.range.part.json"))
+                finished = len(json.loads(states[0].read_text())['done']) if states else 0
+                ok = finished > 0
+                print(f"  interrupted:     {finished} segments kept {'✓' if ok else '✗ no resume state'}")
+                status |= not ok
+            ThrottledHandler.fail_after = None
+            ThrottledHandler.served = 0
+            result, resumed = fetch(base, url)
+            ok = result['content_hash'] == expected and resumed < ranged
+            print(f"  resumed:         {resumed:6.2f} s {'✓' if ok else '✗ hash mismatch or refetched everything'}")
+            status |= not ok
+    finally:
+        server.shutdown()
+
+    print("✓ SUCCESS: ranged downloads verified" if status == 0 else "✗ FAILED")
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -25,6 +25,44 @@ export default {
     return api.post('/scan-url', { url })
   },
 
+  // Crawl a site for PDFs; onPdf is called for each PDF as it streams in
+  async crawlUrl(url, options = {}, onPdf = () => {}) {
+    // axios buffers the whole body, so use fetch to read the NDJSON stream
+    const response = await fetch('/api/crawl-url', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ url, ...options })
+    })
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let stats = null
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop()
+      for (const line of lines) {
+        if (!line.trim()) continue
+        const event = JSON.parse(line)
+        if (event.type === 'pdf') {
+          const { type, ...pdf } = event
+          onPdf(pdf)
+        } else if (event.type === 'done') {
+          stats = event.stats
+        } else if (event.type === 'error') {
+          throw new Error(event.detail)
+        }
+      }
+    }
+    return stats
+  },
+
   // Validate PDF URLs
   validatePdfs(urls) {
     return api.post('/validate-pdfs', { urls })
@@ -69,13 +107,19 @@ export default {
   },
 
   // Chat with KB
-  chat(kbId, message, apiKey = null) {
+  chat(kbId, message, apiKey = null, conversationId = null) {
     return api.post(`/kb/${kbId}/chat`, {
       message,
-      api_key: apiKey
+      api_key: apiKey,
+      conversation_id: conversationId
     })
   },
 
+  // Start a conversation so follow-up questions keep their context
+  createConversation(kbId) {
+    return api.post(`/kb/${kbId}/conversations`)
+  },
+
   // Get chat history
   getHistory(kbId) {
     return api.get(`/kb/${kbId}/history`)